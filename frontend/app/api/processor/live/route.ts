@@ -0,0 +1,34 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+export async function GET(request: NextRequest) {
+  try {
+    // Pass the event stream through unbuffered; aborting the client request closes it upstream
+    const response = await fetch(`http://processor:8001/live${request.nextUrl.search}`, {
+      headers: {
+        'Accept': 'text/event-stream',
+      },
+      cache: 'no-store',
+      signal: request.signal,
+    });
+    
+    if (!response.ok || !response.body) {
+      throw new Error(`Processor responded with status: ${response.status}`);
+    }
+    
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.error('Error opening processor live stream:', error);
+    return NextResponse.json(
+      { error: 'Failed to open processor live stream' },
+      { status: 502 }
+    );
+  }
+}
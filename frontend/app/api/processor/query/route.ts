@@ -0,0 +1,35 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+export async function GET(request: NextRequest) {
+  try {
+    // Events come back as newline-delimited JSON and are passed through as they arrive;
+    // group_by queries return a single JSON object
+    const response = await fetch(`http://processor:8001/query${request.nextUrl.search}`, {
+      cache: 'no-store',
+      signal: request.signal,
+    });
+    
+    if (!response.ok || !response.body) {
+      const detail = await response.json().catch(() => ({}));
+      return NextResponse.json(
+        { error: detail.detail ?? `Processor responded with status: ${response.status}` },
+        { status: response.status }
+      );
+    }
+    
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': response.headers.get('Content-Type') ?? 'application/json',
+        'Cache-Control': 'no-cache',
+      },
+    });
+  } catch (error) {
+    console.error('Error querying processor event store:', error);
+    return NextResponse.json(
+      { error: 'Failed to query processor event store' },
+      { status: 502 }
+    );
+  }
+}
@@ -0,0 +1,25 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export async function GET(request: NextRequest) {
+  try {
+    const response = await fetch(`http://processor:8001/stats${request.nextUrl.search}`, {
+      headers: {
+        'Accept': 'application/json',
+      },
+      cache: 'no-store',
+    });
+    
+    if (!response.ok) {
+      throw new Error(`Processor responded with status: ${response.status}`);
+    }
+    
+    const data = await response.json();
+    return NextResponse.json(data);
+  } catch (error) {
+    console.error('Error fetching processor stats:', error);
+    return NextResponse.json(
+      { error: 'Failed to fetch processor stats' },
+      { status: 500 }
+    );
+  }
+}
@@ -19,6 +19,21 @@ interface DashboardStats {
   topDestinations: Array<{ ip: string; count: number }>;
 }
 
+interface LiveEvent {
+  sourcetype: string;
+  event: Record<string, any>;
+}
+
+interface Drilldown {
+  ip: string;
+  ports: Array<{ port: number | null; proto: string | null; count: number }>;
+  events: Array<Record<string, any>>;
+  error?: string;
+}
+
+const LIVE_EVENTS_SHOWN = 50;
+const DRILLDOWN_SECONDS = 900;
+
 export default function Dashboard() {
   const [systemStatus, setSystemStatus] = useState<SystemStatus>({
     zeek: 'checking',
@@ -36,6 +51,10 @@ export default function Dashboard() {
     topSources: [],
     topDestinations: []
   });
+  const [liveEvents, setLiveEvents] = useState<LiveEvent[]>([]);
+  const [liveDropped, setLiveDropped] = useState(0);
+  const [liveConnected, setLiveConnected] = useState(false);
+  const [drilldown, setDrilldown] = useState<Drilldown | null>(null);
 
   const checkStatus = async () => {
     try {
@@ -63,41 +82,90 @@ export default function Dashboard() {
     }
   };
 
-  const loadDashboardStats = async () => {
+  const applyStats = (stats: any) => {
+    // Streaming aggregates kept by the processor, so no Splunk search is needed
+    const toCounts = (items: Array<{ ip: string; count: number }>) =>
+      items.slice(0, 5).map(({ ip, count }) => ({ ip, count }));
+    // Connections seen in the processor's current window (one minute by default)
+    const latest = stats.series[stats.series.length - 1];
+    const current = latest && stats.timestamp - latest.start < stats.window_seconds ? latest : null;
+
+    setDashboardStats({
+      totalConnections: stats.totals.connections,
+      activeConnections: current ? current.connections : 0,
+      totalPackets: stats.totals.packets,
+      alerts: (stats.window.events.notice ?? 0) + (stats.window.events.detection ?? 0),
+      topSources: toCounts(stats.window.top_sources),
+      topDestinations: toCounts(stats.window.top_destinations)
+    });
+    setLoading(false);
+  };
+
+  const drillInto = async (ip: string) => {
+    // Recent traffic for one address from the processor's local event store
+    setDrilldown({ ip, ports: [], events: [] });
     try {
-      setLoading(true);
-      // Mock data for now - in a real implementation, this would come from Splunk
-      setDashboardStats({
-        totalConnections: 1247,
-        activeConnections: 23,
-        totalPackets: 45678,
-        alerts: 3,
-        topSources: [
-          { ip: '192.168.1.100', count: 156 },
-          { ip: '192.168.1.101', count: 89 },
-          { ip: '10.0.0.50', count: 67 }
-        ],
-        topDestinations: [
-          { ip: '8.8.8.8', count: 234 },
-          { ip: '1.1.1.1', count: 189 },
-          { ip: '208.67.222.222', count: 145 }
-        ]
+      const params = `ip=${encodeURIComponent(ip)}&last=${DRILLDOWN_SECONDS}`;
+      const [groupsResponse, eventsResponse] = await Promise.all([
+        fetch(`/api/processor/query?${params}&group_by=id_resp_p,proto&limit=10`),
+        fetch(`/api/processor/query?${params}&limit=20`),
+      ]);
+      if (!groupsResponse.ok) {
+        const body = await groupsResponse.json();
+        setDrilldown({ ip, ports: [], events: [], error: body.error });
+        return;
+      }
+      const groups = await groupsResponse.json();
+      const lines = eventsResponse.ok ? (await eventsResponse.text()).split('\n').filter(Boolean) : [];
+      setDrilldown({
+        ip,
+        ports: groups.groups.map((group: any) => ({
+          port: group.key.id_resp_p,
+          proto: group.key.proto,
+          count: group.count,
+        })),
+        events: lines.map((line) => JSON.parse(line)),
       });
     } catch (error) {
-      console.error('Error loading dashboard stats:', error);
-    } finally {
-      setLoading(false);
+      console.error('Error querying event store:', error);
+      setDrilldown({ ip, ports: [], events: [], error: 'Query failed' });
     }
   };
 
   useEffect(() => {
     checkStatus();
-    loadDashboardStats();
     
     // Set up periodic status checks
     const statusInterval = setInterval(checkStatus, 30000); // Every 30 seconds
+
+    // Statistics and the live tail are pushed by the processor; EventSource reconnects on its own
+    const live = new EventSource('/api/processor/live');
+    live.onopen = () => setLiveConnected(true);
+    live.onerror = () => setLiveConnected(false);
+    live.addEventListener('stats', (message) => {
+      try {
+        applyStats(JSON.parse((message as MessageEvent).data));
+      } catch (error) {
+        console.error('Error reading live stats:', error);
+      }
+    });
+    live.addEventListener('events', (message) => {
+      try {
+        const frame = JSON.parse((message as MessageEvent).data);
+        const events: LiveEvent[] = frame.events;
+        setLiveEvents((previous) => [...events.reverse(), ...previous].slice(0, LIVE_EVENTS_SHOWN));
+        if (frame.dropped) {
+          setLiveDropped((previous) => previous + frame.dropped);
+        }
+      } catch (error) {
+        console.error('Error reading live events:', error);
+      }
+    });
     
-    return () => clearInterval(statusInterval);
+    return () => {
+      clearInterval(statusInterval);
+      live.close();
+    };
   }, []);
 
   const getStatusColor = (status: string) => {
@@ -291,7 +359,8 @@ export default function Dashboard() {
                 <h3 className="font-medium text-gray-700 mb-2">Top Sources</h3>
                 <div className="space-y-2">
                   {dashboardStats.topSources.map((source, index) => (
-                    <div key={index} className="flex justify-between items-center p-2 bg-gray-50 rounded">
+                    <div key={index} className="flex justify-between items-center p-2 bg-gray-50 rounded cursor-pointer hover:bg-gray-100"
+                      onClick={() => drillInto(source.ip)}>
                       <span className="font-mono text-sm">{source.ip}</span>
                       <span className="text-sm text-gray-600">{source.count} connections</span>
                     </div>
@@ -302,7 +371,8 @@ export default function Dashboard() {
                 <h3 className="font-medium text-gray-700 mb-2">Top Destinations</h3>
                 <div className="space-y-2">
                   {dashboardStats.topDestinations.map((dest, index) => (
-                    <div key={index} className="flex justify-between items-center p-2 bg-gray-50 rounded">
+                    <div key={index} className="flex justify-between items-center p-2 bg-gray-50 rounded cursor-pointer hover:bg-gray-100"
+                      onClick={() => drillInto(dest.ip)}>
                       <span className="font-mono text-sm">{dest.ip}</span>
                       <span className="text-sm text-gray-600">{dest.count} connections</span>
                     </div>
@@ -312,6 +382,75 @@ export default function Dashboard() {
             </div>
           </div>
         </div>
+
+        {/* Drilldown */}
+        {drilldown && (
+          <div className="card mt-8">
+            <div className="flex justify-between items-center mb-4">
+              <h2 className="text-xl font-semibold">
+                <span className="font-mono">{drilldown.ip}</span> · last {DRILLDOWN_SECONDS / 60} minutes
+              </h2>
+              <button className="text-sm text-gray-600" onClick={() => setDrilldown(null)}>Close</button>
+            </div>
+            {drilldown.error ? (
+              <p className="text-sm text-red-700">{drilldown.error}</p>
+            ) : (
+              <div className="grid grid-cols-1 lg:grid-cols-3 gap-8">
+                <div>
+                  <h3 className="font-medium text-gray-700 mb-2">Destination Ports</h3>
+                  <div className="space-y-2">
+                    {drilldown.ports.map((port, index) => (
+                      <div key={index} className="flex justify-between items-center p-2 bg-gray-50 rounded">
+                        <span className="font-mono text-sm">{port.port ?? '-'}/{port.proto ?? '-'}</span>
+                        <span className="text-sm text-gray-600">{port.count} events</span>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+                <div className="lg:col-span-2">
+                  <h3 className="font-medium text-gray-700 mb-2">Recent Events</h3>
+                  <div className="space-y-1 max-h-96 overflow-y-auto">
+                    {drilldown.events.map((event, index) => (
+                      <div key={index} className="flex gap-4 p-2 bg-gray-50 rounded font-mono text-xs">
+                        <span className="text-gray-500">{new Date(event.ts * 1000).toLocaleTimeString()}</span>
+                        <span>
+                          {event.id_orig_h ?? '-'}:{event.id_orig_p ?? '-'} → {event.id_resp_h ?? '-'}:{event.id_resp_p ?? '-'}
+                        </span>
+                        <span className="text-gray-600">{event.proto ?? ''} {event.service ?? ''}</span>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+              </div>
+            )}
+          </div>
+        )}
+
+        {/* Live Events */}
+        <div className="card mt-8">
+          <div className="flex justify-between items-center mb-4">
+            <h2 className="text-xl font-semibold">Live Events</h2>
+            <span className="text-sm text-gray-600">
+              {liveConnected ? 'streaming' : 'reconnecting'}
+              {liveDropped > 0 && ` · ${liveDropped.toLocaleString()} dropped`}
+            </span>
+          </div>
+          <div className="space-y-1 max-h-96 overflow-y-auto">
+            {liveEvents.length === 0 ? (
+              <p className="text-sm text-gray-600">Waiting for events...</p>
+            ) : (
+              liveEvents.map((live, index) => (
+                <div key={index} className="flex gap-4 p-2 bg-gray-50 rounded font-mono text-xs">
+                  <span className="text-gray-500">{live.sourcetype.replace(/^zeek_|_enriched$/g, '')}</span>
+                  <span>
+                    {live.event.id_orig_h ?? '-'}:{live.event.id_orig_p ?? '-'} → {live.event.id_resp_h ?? '-'}:{live.event.id_resp_p ?? '-'}
+                  </span>
+                  <span className="text-gray-600">{live.event.proto ?? ''} {live.event.service ?? ''}</span>
+                </div>
+              ))
+            )}
+          </div>
+        </div>
       </div>
     </div>
   );
@@ -0,0 +1,239 @@
+"""
+Streaming Aggregates
+Fixed-memory rolling statistics kept while events are processed: per-window counts,
+bytes and packets, approximate top talkers (Space-Saving) and distinct counts
+(HyperLogLog), served to the dashboard without querying Splunk.
+"""
+
+import hashlib
+import math
+import time
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Snapshots kept for repeated queries; each distinct (windows, top) pair takes one entry
+CACHE_LIMIT = 64
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counter (Space-Saving). At most 2 x capacity items are tracked;
+    when the table is full it is pruned back to the `capacity` largest, and later
+    newcomers start from the largest evicted count. Each count overestimates the true
+    count by at most its `error`, which is bounded by total / capacity.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.floor = 0
+
+    def update(self, items: Iterable[Tuple[str, int]]):
+        counts, errors = self.counts, self.errors
+        for item, count in items:
+            current = counts.get(item)
+            if current is not None:
+                counts[item] = current + count
+            else:
+                counts[item] = self.floor + count
+                errors[item] = self.floor
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        self.floor = max(self.floor, ranked[self.capacity][1])
+        self.counts = dict(ranked[:self.capacity])
+        self.errors = {item: self.errors[item] for item in self.counts}
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """The n largest items as (item, count, error)"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(item, count, self.errors.get(item, 0)) for item, count in ranked]
+
+    @classmethod
+    def merge(cls, sketches: List["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        merged = cls(capacity)
+        for sketch in sketches:
+            for item, count in sketch.counts.items():
+                merged.counts[item] = merged.counts.get(item, 0) + count
+                merged.errors[item] = merged.errors.get(item, 0) + sketch.errors.get(item, 0)
+            merged.floor += sketch.floor
+        if len(merged.counts) > capacity:
+            merged._prune()
+        return merged
+
+
+class HyperLogLog:
+    """Distinct-count estimator with 2^precision one-byte registers (~1.04/sqrt(2^p) error)"""
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add_many(self, values: Iterable[str]):
+        p = self.precision
+        width = 64 - p
+        mask = (1 << width) - 1
+        registers = self.registers
+        for value in values:
+            # Unlike hash(), blake2b is stable across processes, so sketches can be merged
+            h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+            index = h >> width
+            rank = width - (h & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class _Window:
+    """Aggregates for one fixed time window"""
+    __slots__ = ("start", "events", "connections", "bytes", "packets", "sources", "destinations",
+                 "distinct_sources", "distinct_destinations")
+
+    def __init__(self, start: float, top_k: int, precision: int):
+        self.start = start
+        self.events: Dict[str, int] = {}
+        self.connections = 0
+        self.bytes = 0
+        self.packets = 0
+        self.sources = SpaceSaving(top_k)
+        self.destinations = SpaceSaving(top_k)
+        self.distinct_sources = HyperLogLog(precision)
+        self.distinct_destinations = HyperLogLog(precision)
+
+
+def _total(*columns: List[Any]) -> int:
+    return sum(value for column in columns for value in column if type(value) is int)
+
+
+class StreamStats:
+    """
+    Rolling aggregates over the last `windows` windows of `window_seconds` each, by
+    processing time, plus totals since startup. Memory is bounded by the number of windows
+    and the sketch sizes, regardless of traffic. Conn events feed the connection, byte,
+    packet and top-talker figures; every log type is counted.
+    """
+
+    def __init__(self, window_seconds: float = 60.0, windows: int = 60, top_k: int = 100,
+                 precision: int = 12, cache_ttl: float = 1.0):
+        self.window_seconds = window_seconds
+        self.top_k = top_k
+        self.precision = precision
+        self.cache_ttl = cache_ttl
+        self.windows: deque = deque(maxlen=windows)
+        self.started_at = time.time()
+        self.totals: Dict[str, Any] = {"events": {}, "connections": 0, "bytes": 0, "packets": 0}
+        self._cache: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]] = {}
+
+    def _current(self) -> _Window:
+        now = time.time()
+        start = now - now % self.window_seconds
+        if not self.windows or self.windows[-1].start != start:
+            self.windows.append(_Window(start, self.top_k, self.precision))
+        return self.windows[-1]
+
+    def add_events(self, log_type: str, events: List[Dict[str, Any]]):
+        """Aggregate a list of event dicts"""
+        if log_type != "conn":
+            self.add_columns(log_type, len(events), {})
+            return
+        names = ("id_orig_h", "id_resp_h", "orig_bytes", "resp_bytes", "orig_pkts", "resp_pkts")
+        self.add_columns(log_type, len(events), {name: [event.get(name) for event in events] for name in names})
+
+    def add_columns(self, log_type: str, count: int, columns: Dict[str, List[Any]]):
+        """Aggregate a batch given as columns (such as ColumnarBatch.columns)"""
+        if not count:
+            return
+        window = self._current()
+        window.events[log_type] = window.events.get(log_type, 0) + count
+        events = self.totals["events"]
+        events[log_type] = events.get(log_type, 0) + count
+        if log_type != "conn":
+            return
+
+        byte_count = _total(columns.get("orig_bytes", ()), columns.get("resp_bytes", ()))
+        packets = _total(columns.get("orig_pkts", ()), columns.get("resp_pkts", ()))
+        window.connections += count
+        window.bytes += byte_count
+        window.packets += packets
+        self.totals["connections"] += count
+        self.totals["bytes"] += byte_count
+        self.totals["packets"] += packets
+
+        sources = Counter(filter(None, columns.get("id_orig_h", ())))
+        destinations = Counter(filter(None, columns.get("id_resp_h", ())))
+        window.sources.update(sources.items())
+        window.destinations.update(destinations.items())
+        window.distinct_sources.add_many(sources)
+        window.distinct_destinations.add_many(destinations)
+
+    def snapshot(self, windows: Optional[int] = None, top: int = 10) -> Dict[str, Any]:
+        """Totals, the merged last `windows` windows (default: all kept) and a per-window series"""
+        windows = min(windows or self.windows.maxlen, self.windows.maxlen)
+        key = (windows, top)
+        cached = self._cache.get(key)
+        now = time.time()
+        if cached is not None and now - cached[0] < self.cache_ttl:
+            return cached[1]
+
+        since = now - now % self.window_seconds - (windows - 1) * self.window_seconds
+        selected = [window for window in self.windows if window.start >= since]
+        events: Dict[str, int] = {}
+        distinct_sources = HyperLogLog(self.precision)
+        distinct_destinations = HyperLogLog(self.precision)
+        for window in selected:
+            for log_type, count in window.events.items():
+                events[log_type] = events.get(log_type, 0) + count
+            distinct_sources.merge(window.distinct_sources)
+            distinct_destinations.merge(window.distinct_destinations)
+        sources = SpaceSaving.merge([window.sources for window in selected], self.top_k)
+        destinations = SpaceSaving.merge([window.destinations for window in selected], self.top_k)
+
+        result = {
+            "timestamp": now,
+            "window_seconds": self.window_seconds,
+            "range": {"start": since, "end": now, "windows": windows},
+            "totals": {**self.totals, "events": dict(self.totals["events"]), "since": self.started_at},
+            "window": {
+                "events": events,
+                "connections": sum(window.connections for window in selected),
+                "bytes": sum(window.bytes for window in selected),
+                "packets": sum(window.packets for window in selected),
+                "distinct_sources": distinct_sources.count(),
+                "distinct_destinations": distinct_destinations.count(),
+                "top_sources": [
+                    {"ip": ip, "count": count, "error": error} for ip, count, error in sources.top(top)
+                ],
+                "top_destinations": [
+                    {"ip": ip, "count": count, "error": error} for ip, count, error in destinations.top(top)
+                ],
+            },
+            "series": [
+                {
+                    "start": window.start,
+                    "events": sum(window.events.values()),
+                    "connections": window.connections,
+                    "bytes": window.bytes,
+                    "packets": window.packets,
+                }
+                for window in selected
+            ],
+        }
+        if len(self._cache) >= CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[key] = (now, result)
+        return result
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Bulk Backfill
+Re-ingests directory trees of rotated Zeek logs, plain or gzip-compressed, through the
+processor: several files at once, rate limited, and resumable from a manifest.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import requests
+
+from config import (
+    BACKFILL_BATCH_SIZE,
+    BACKFILL_MANIFEST,
+    BACKFILL_RATE,
+    BACKFILL_WORKERS,
+    PROCESSOR_URL,
+)
+from log_parser import path_from_file_name, read_zeek_header
+
+logger = logging.getLogger(__name__)
+
+LOG_SUFFIXES = (".log", ".log.gz")
+MAX_ATTEMPTS = 5
+
+
+def find_logs(roots: List[str], log_types: Optional[Set[str]] = None) -> List[Path]:
+    """Zeek logs (*.log, *.log.gz) under the given files and directories, oldest path first"""
+    found = []
+    for root in roots:
+        root_path = Path(root)
+        candidates = [root_path] if root_path.is_file() else root_path.rglob("*")
+        for path in candidates:
+            if path.is_file() and path.name.endswith(LOG_SUFFIXES):
+                if log_types is None or path_from_file_name(path.name) in log_types:
+                    found.append(path.resolve())
+    return sorted(set(found))
+
+
+class Manifest:
+    """
+    Progress per file, persisted as one JSON file with write-to-temp and rename. Offsets
+    count bytes of decompressed data, so gzip archives resume by decompressing up to them.
+    A file whose size or mtime changed since it was recorded starts over.
+    """
+
+    def __init__(self, path: str, min_interval: float = 2.0):
+        self.path = Path(path)
+        self.min_interval = min_interval
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        try:
+            self.files = json.loads(self.path.read_text()).get("files", {})
+            logger.info(f"Loaded backfill manifest {self.path}: {len(self.files)} files")
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            logger.error(f"Ignoring unreadable backfill manifest {self.path}: {e}")
+
+    def start(self, path: Path) -> Dict[str, Any]:
+        """The entry to resume `path` from, reset if the file changed"""
+        st = path.stat()
+        with self._lock:
+            entry = self.files.get(str(path))
+            if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime:
+                entry = self.files[str(path)] = {
+                    "size": st.st_size, "mtime": st.st_mtime, "offset": 0, "events": 0, "done": False,
+                }
+            return dict(entry)
+
+    def update(self, path: Path, force: bool = False, **values: Any):
+        with self._lock:
+            self.files[str(path)].update(values)
+            if force or time.monotonic() - self._last_flush >= self.min_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"files": self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._last_flush = time.monotonic()
+
+
+class RateLimiter:
+    """Token bucket shared by all workers; `rate` events per second, 0 for no limit"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take the tokens now and sleep off any debt, so waiting workers queue up fairly
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class Backfill:
+    """
+    Sends every event of `paths` to the processor's /process/batch in batches of
+    `batch_size`, `workers` files at a time. A batch's end offset is recorded in the
+    manifest once the processor accepts it; while the processor answers 503 (spool full)
+    the batch is retried after its Retry-After.
+    """
+
+    def __init__(self, paths: List[Path], processor_url: str = PROCESSOR_URL, workers: int = BACKFILL_WORKERS,
+                 rate: float = BACKFILL_RATE, batch_size: int = BACKFILL_BATCH_SIZE,
+                 manifest: str = BACKFILL_MANIFEST):
+        self.paths = paths
+        self.processor_url = processor_url
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate, burst=max(rate, batch_size))
+        self.manifest = Manifest(manifest)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.total_bytes = sum(path.stat().st_size for path in paths)
+        self.bytes_done = 0
+        self.events_sent = 0
+        self.events_failed = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.stopping = threading.Event()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _batches(self, path: Path, offset: int) -> Iterator[Tuple[List[Dict[str, Any]], int, int, str]]:
+        """(events, end offset, on-disk bytes read so far, log type) from `offset` on"""
+        compressed = path.name.endswith(".gz")
+        with (gzip.open(path, "rb") if compressed else open(path, "rb")) as f:
+            schema, data_offset = read_zeek_header(f)
+            if schema is None:
+                raise ValueError("no #fields header or JSON records")
+            log_type = schema.path or path_from_file_name(path.name)
+            # Seeking a gzip file decompresses up to the offset without keeping the data
+            position = max(offset, data_offset)
+            f.seek(position)
+            raw_file = f.fileobj if compressed else f
+            events: List[Dict[str, Any]] = []
+            for raw in f:
+                position += len(raw)
+                if raw.startswith(b"#") or raw.isspace():
+                    continue
+                try:
+                    event = schema.parse(raw.decode("utf-8", errors="replace"))
+                except (ValueError, TypeError):
+                    event = None
+                if event is not None:
+                    events.append(event)
+                if len(events) >= self.batch_size:
+                    yield events, position, raw_file.tell(), log_type
+                    events = []
+            yield events, position, raw_file.tell(), log_type
+
+    def _send(self, events: List[Dict[str, Any]], log_type: str) -> int:
+        """Deliver one batch; returns the number of events the processor rejected"""
+        delay = 1.0
+        attempt = 0
+        while True:
+            try:
+                response = self._session().post(
+                    f"{self.processor_url}/process/batch", params={"log_type": log_type}, json=events, timeout=120,
+                )
+            except requests.RequestException as e:
+                logger.warning(f"Processor unreachable ({e}), retrying in {delay:.0f}s")
+            else:
+                if response.status_code == 200:
+                    return response.json().get("failed", 0)
+                if response.status_code == 503:
+                    # Spool full: wait as long as asked, without using up attempts
+                    time.sleep(float(response.headers.get("Retry-After", 5)))
+                    continue
+                if 400 <= response.status_code < 500:
+                    # Retrying won't help; count the batch as failed and move on
+                    logger.error(f"Processor rejected {len(events)} {log_type} events: {response.text[:200]}")
+                    return len(events)
+                logger.warning(f"Processor error {response.status_code}, retrying in {delay:.0f}s")
+            attempt += 1
+            if attempt == MAX_ATTEMPTS:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+        raise RuntimeError(f"processor failed {MAX_ATTEMPTS} times")
+
+    def process_file(self, path: Path) -> bool:
+        if self.stopping.is_set():
+            return False
+        entry = self.manifest.start(path)
+        if entry["done"]:
+            with self._lock:
+                self.bytes_done += entry["size"]
+                self.files_done += 1
+            return True
+        events_total = entry["events"]
+        counted = 0
+        try:
+            for events, offset, read, log_type in self._batches(path, entry["offset"]):
+                if self.stopping.is_set():
+                    return False
+                if events:
+                    self.limiter.acquire(len(events))
+                    failed = self._send(events, log_type)
+                    events_total += len(events)
+                    with self._lock:
+                        self.events_sent += len(events) - failed
+                        self.events_failed += failed
+                self.manifest.update(path, offset=offset, events=events_total)
+                with self._lock:
+                    self.bytes_done += read - counted
+                counted = read
+        except (OSError, EOFError, ValueError, RuntimeError) as e:
+            logger.error(f"Stopped backfilling {path}: {e}")
+            self.manifest.update(path, force=True, error=str(e))
+            with self._lock:
+                self.files_failed += 1
+            return False
+        self.manifest.update(path, force=True, done=True, error=None)
+        with self._lock:
+            self.bytes_done += entry["size"] - counted
+            self.files_done += 1
+        return True
+
+    def report(self, started: float, previous: Tuple[float, int]) -> Tuple[float, int]:
+        now = time.monotonic()
+        elapsed = now - started
+        then, sent_then = previous
+        recent = (self.events_sent - sent_then) / (now - then) if now > then else 0.0
+        done = self.bytes_done / self.total_bytes if self.total_bytes else 1.0
+        eta = elapsed * (1 - done) / done if 0 < done < 1 else 0.0
+        print(
+            f"[backfill] {self.files_done + self.files_failed}/{len(self.paths)} files, {done:.1%} of bytes, "
+            f"{self.events_sent:,} events sent ({self.events_failed:,} failed), "
+            f"{recent:,.0f} events/s now, {self.events_sent / elapsed if elapsed else 0:,.0f} avg, "
+            f"ETA {eta / 60:.1f} min",
+            flush=True,
+        )
+        return now, self.events_sent
+
+    def run(self, progress_interval: float = 10.0) -> Dict[str, Any]:
+        started = time.monotonic()
+        done = threading.Event()
+
+        def progress():
+            previous = (started, 0)
+            while not done.wait(progress_interval):
+                previous = self.report(started, previous)
+
+        reporter = threading.Thread(target=progress, daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                try:
+                    list(pool.map(self.process_file, self.paths))
+                except KeyboardInterrupt:
+                    # Let workers finish their current batch so the manifest stays exact
+                    self.stopping.set()
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+        finally:
+            done.set()
+            self.manifest.flush()
+        self.report(started, (started, 0))
+        elapsed = time.monotonic() - started
+        return {
+            "files": len(self.paths),
+            "files_done": self.files_done,
+            "files_failed": self.files_failed,
+            "events_sent": self.events_sent,
+            "events_failed": self.events_failed,
+            "elapsed_sec": round(elapsed, 1),
+            "events_per_sec": round(self.events_sent / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Backfill rotated and gzip-compressed Zeek logs through the processor")
+    parser.add_argument("paths", nargs="+", help="log files or directories to search for *.log and *.log.gz")
+    parser.add_argument("--processor", default=PROCESSOR_URL, help="processor URL (default: PROCESSOR_URL)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="files processed at once")
+    parser.add_argument("--rate", type=float, default=BACKFILL_RATE, help="events per second, 0 for no limit")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="events per request")
+    parser.add_argument("--manifest", default=BACKFILL_MANIFEST, help="progress file used to resume")
+    parser.add_argument("--log-types", help="comma-separated log types to include (default: all)")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    log_types = {name.strip() for name in args.log_types.split(",")} if args.log_types else None
+    paths = find_logs(args.paths, log_types)
+    if not paths:
+        print(f"No Zeek logs found under {', '.join(args.paths)}")
+        sys.exit(1)
+    logger.info(f"Backfilling {len(paths)} files with {args.workers} workers")
+    backfill = Backfill(paths, args.processor, args.workers, args.rate, args.batch_size, args.manifest)
+    try:
+        result = backfill.run(args.progress_interval)
+    except KeyboardInterrupt:
+        print("Interrupted; run again with the same --manifest to resume")
+        sys.exit(130)
+    logger.info(f"Backfill finished: {result}")
+    sys.exit(0 if result["files_failed"] == 0 and result["events_failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Cluster Scaling Benchmark
+Starts N processor replicas (separate processes) against a stub HEC server and has
+log_watcher.py processes, one per simulated sensor, partition the same pre-written conn
+and dns logs across them. Reports combined events/sec for each replica count.
+
+    python bench/cluster_scaling.py --replicas 1 2 4 --watchers 2 --events 200000
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSOR_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROCESSOR_DIR)
+
+from hec_stub import HecStub  # noqa: E402
+from results import write_results  # noqa: E402
+from zeek_gen import write_log  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"{url}/", timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"processor at {url} did not start")
+            time.sleep(0.2)
+
+
+def start_replicas(count: int, tmp: str, env: Dict[str, str]) -> Tuple[List[subprocess.Popen], List[str]]:
+    """Start `count` processors in http ingest mode, each with its own spool; returns them once ready"""
+    replicas, urls = [], []
+    for i in range(count):
+        port = free_port()
+        replica_env = dict(env, SPOOL_DIR=os.path.join(tmp, f"spool-{i}"), INGEST_MODE="http")
+        replicas.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=PROCESSOR_DIR, env=replica_env,
+        ))
+        urls.append(f"http://127.0.0.1:{port}")
+    for url in urls:
+        wait_ready(url)
+    return replicas, urls
+
+
+def start_watchers(logs_dirs: List[str], urls: List[str], tmp: str, env: Dict[str, str]) -> List[subprocess.Popen]:
+    watchers = []
+    for i, logs_dir in enumerate(logs_dirs):
+        watcher_env = dict(
+            env,
+            LOGS_DIR=logs_dir,
+            PROCESSOR_URLS=",".join(urls),
+            CHECKPOINT_FILE=os.path.join(tmp, f"checkpoints-{i}.json"),
+            WATCHER_METRICS_PORT="0",
+        )
+        watchers.append(subprocess.Popen(
+            [sys.executable, "log_watcher.py"], cwd=PROCESSOR_DIR, env=watcher_env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    return watchers
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(replicas: int, args, stub: HecStub, tmp: str) -> Dict[str, Any]:
+    """Deliver every sensor's logs through `replicas` processors; throughput is written events / elapsed"""
+    run_dir = os.path.join(tmp, f"replicas-{replicas}")
+    logs_dirs = []
+    written = 0
+    per_sensor = args.events // args.watchers
+    for i in range(args.watchers):
+        logs_dir = os.path.join(run_dir, f"sensor-{i}")
+        os.makedirs(logs_dir)
+        conn = per_sensor - per_sensor // 4
+        written += write_log(os.path.join(logs_dir, "conn.log"), "conn", conn, args.sources, seed=i + 1)
+        written += write_log(os.path.join(logs_dir, "dns.log"), "dns", per_sensor - conn, args.sources, seed=i + 1)
+        logs_dirs.append(logs_dir)
+
+    env = dict(
+        os.environ,
+        SPLUNK_SCHEME="http",
+        SPLUNK_HOST="127.0.0.1",
+        SPLUNK_PORT=str(stub.port),
+        HEC_FLUSH_INTERVAL=str(args.flush_interval),
+        RULES_FILE=os.path.join(tmp, "no-rules.json"),
+        INTEL_DIR=os.path.join(tmp, "no-intel"),
+        STORE_DIR="",
+    )
+    processes, urls = start_replicas(replicas, run_dir, env)
+    baseline = stub.events
+    try:
+        started = time.perf_counter()
+        processes += start_watchers(logs_dirs, urls, run_dir, env)
+        complete = stub.wait_for(baseline + written, args.timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop(processes)
+    return {
+        "replicas": replicas,
+        "watchers": args.watchers,
+        "events": written,
+        "complete": complete,
+        "elapsed_sec": round(elapsed, 3),
+        "events_per_sec": round(written / elapsed, 1) if complete else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--watchers", type=int, default=2, help="log watchers, one per simulated sensor")
+    parser.add_argument("--events", type=int, default=200000, help="events across all sensors, 3/4 conn and 1/4 dns")
+    parser.add_argument("--sources", type=int, default=200, help="distinct source IPs per sensor")
+    parser.add_argument("--flush-interval", type=float, default=0.1, help="HEC_FLUSH_INTERVAL for the replicas")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for delivery")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stub = HecStub().start()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for replicas in args.replicas:
+            result = run(replicas, args, stub, tmp)
+            base = results[0]["events_per_sec"] if results else result["events_per_sec"]
+            result["speedup"] = round(result["events_per_sec"] / base, 2) if base else 0.0
+            results.append(result)
+            print(
+                f"{replicas} replica(s), {args.watchers} watcher(s): {result['events']} events in "
+                f"{result['elapsed_sec']}s ({result['events_per_sec']:,.0f} events/sec, {result['speedup']}x)"
+            )
+    stub.stop()
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results(args.output, "cluster_scaling", params, results)
+    sys.exit(0 if all(result["complete"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare Benchmark Results
+Compares two result files written by the benchmarks and flags regressions.
+
+    python bench/compare.py baseline.json current.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+
+def direction(key: str) -> int:
+    """1 if a larger value is better (throughput), -1 if smaller is better (time), 0 to skip"""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("per_sec") or leaf == "speedup":
+        return 1
+    if leaf.endswith("_sec") or leaf == "ns_per_event" or ".latency_ms." in f".{key}":
+        return -1
+    return 0
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of a results document, keyed by dotted path"""
+    flat: Dict[str, float] = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = item.get("workers", i) if isinstance(item, dict) else i
+            flat.update(flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = float(value)
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("benchmark") != current.get("benchmark"):
+        print(f"Different benchmarks: {baseline.get('benchmark')} vs {current.get('benchmark')}")
+        sys.exit(2)
+
+    before = flatten(baseline["results"])
+    after = flatten(current["results"])
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        better = direction(key)
+        if not better or before[key] == 0:
+            continue
+        change = (after[key] - before[key]) / before[key] * 100
+        worse = -change * better
+        flag = ""
+        if worse > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif worse < -args.threshold:
+            flag = "  improved"
+        print(f"{key:48s} {before[key]:>14,.2f} -> {after[key]:>14,.2f}  {change:+7.1f}%{flag}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
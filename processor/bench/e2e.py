@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+End-to-end Benchmark
+Runs the processor against a stub HEC server, appends synthetic Zeek events to live log
+files at a fixed rate and measures throughput and the latency from each line being
+written to the HEC request carrying it being received.
+
+    python bench/e2e.py --mode direct --events 100000 --rate 10000 --output e2e.json
+    python bench/e2e.py --mode http --events 20000 --rate 0
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from itertools import cycle
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from hec_stub import HecStub  # noqa: E402
+from results import write_results  # noqa: E402
+from zeek_gen import LOG_TYPES, header, lines_for  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * (len(values) - 1) + 0.5))]
+
+
+def configure(tmp: str, stub: HecStub, args) -> str:
+    """Point the processor at the stub and temporary directories; must run before importing main"""
+    port = free_port()
+    os.environ.update(
+        SPLUNK_SCHEME="http",
+        SPLUNK_HOST="127.0.0.1",
+        SPLUNK_PORT=str(stub.port),
+        HEC_FLUSH_INTERVAL=str(args.flush_interval),
+        LOGS_DIR=os.path.join(tmp, "logs"),
+        SPOOL_DIR=os.path.join(tmp, "spool"),
+        CHECKPOINT_FILE=os.path.join(tmp, "state", "checkpoints.json"),
+        INGEST_MODE=args.mode,
+        PROCESSOR_URL=f"http://127.0.0.1:{port}",
+        WATCHER_METRICS_PORT="0",
+    )
+    os.makedirs(os.environ["LOGS_DIR"])
+    return os.environ["PROCESSOR_URL"]
+
+
+def start_processor(processor_url: str):
+    import uvicorn
+
+    import main
+    port = int(processor_url.rsplit(":", 1)[1])
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True, name="processor")
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+def start_watcher(logs_dir: str, processor_url: str):
+    from checkpoint import CheckpointStore
+    from config import CHECKPOINT_FILE
+    from log_watcher import LogWatcher
+    watcher = LogWatcher(logs_dir, processor_url, checkpoints=CheckpointStore(CHECKPOINT_FILE))
+    threading.Thread(target=watcher.run, daemon=True, name="log-watcher").start()
+    return watcher
+
+
+def write_events(logs_dir: str, args) -> int:
+    """Append events round-robin across the log types at args.rate events/sec (0 = unthrottled)"""
+    per_type = -(-args.events // len(args.types))
+    bodies = {
+        log_type: [line.split("\t", 1)[1] for line in lines_for(log_type)(per_type, args.sources, args.destinations)]
+        for log_type in args.types
+    }
+    files = {}
+    for log_type in args.types:
+        f = open(os.path.join(logs_dir, f"{log_type}.log"), "a")
+        f.write(header(log_type, LOG_TYPES[log_type][0]))
+        f.flush()
+        files[log_type] = f
+    time.sleep(0.5)  # let the tailer pick up the new files
+
+    tick = 0.01
+    burst = max(1, int(args.rate * tick)) if args.rate else 1000
+    positions = dict.fromkeys(args.types, 0)
+    order = cycle(args.types)
+    written = 0
+    started = time.perf_counter()
+    try:
+        while written < args.events:
+            log_type = next(order)
+            n = min(burst, args.events - written, per_type - positions[log_type])
+            if n <= 0:
+                continue
+            now = f"{time.time():.6f}\t"
+            lines = bodies[log_type][positions[log_type]:positions[log_type] + n]
+            files[log_type].write("".join(now + body for body in lines))
+            files[log_type].flush()
+            positions[log_type] += n
+            written += n
+            if args.rate:
+                delay = started + written / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        for f in files.values():
+            f.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["direct", "http"], default="direct",
+                        help="direct: processor tails the logs; http: log_watcher posts to /process/batch")
+    parser.add_argument("--events", type=int, default=50000, help="total events across all types")
+    parser.add_argument("--rate", type=float, default=5000, help="events/sec written (0 = as fast as possible)")
+    parser.add_argument("--types", nargs="+", choices=sorted(LOG_TYPES), default=["conn", "dns", "http"])
+    parser.add_argument("--flush-interval", type=float, default=0.1, help="HEC_FLUSH_INTERVAL for the run")
+    parser.add_argument("--sources", type=int, default=200, help="distinct source IPs")
+    parser.add_argument("--destinations", type=int, default=2000, help="distinct destination IPs")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for delivery")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stub = HecStub(track_latency=True).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        processor_url = configure(tmp, stub, args)
+        server, thread = start_processor(processor_url)
+        logging.getLogger().setLevel(logging.WARNING)
+        if args.mode == "http":
+            start_watcher(os.environ["LOGS_DIR"], processor_url)
+
+        started = time.perf_counter()
+        written = write_events(os.environ["LOGS_DIR"], args)
+        write_sec = time.perf_counter() - started
+        complete = stub.wait_for(written, args.timeout)
+        elapsed = time.perf_counter() - started
+
+        server.should_exit = True
+        thread.join(timeout=10)
+    stub.stop()
+
+    latencies = sorted(stub.latencies)
+    results: Dict[str, Any] = {
+        "events_written": written,
+        "events_delivered": stub.events,
+        "complete": complete,
+        "write_sec": round(write_sec, 3),
+        "elapsed_sec": round(elapsed, 3),
+        "events_per_sec": round(stub.events / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90": round(percentile(latencies, 0.90) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "hec": stub.stats(),
+    }
+    print(
+        f"{args.mode}: {results['events_delivered']}/{written} events in {results['elapsed_sec']}s "
+        f"({results['events_per_sec']:,.0f} events/sec), latency p50={results['latency_ms']['p50']}ms "
+        f"p99={results['latency_ms']['p99']}ms"
+    )
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results(args.output, "e2e", params, results)
+    sys.exit(0 if complete else 1)
+
+
+if __name__ == "__main__":
+    main()
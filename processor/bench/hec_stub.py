@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Stub Splunk HEC Server
+Accepts /services/collector/event requests on localhost, acknowledges them immediately
+and records request, event and byte counts. With latency tracking on, each event's
+`ts` is read as the time it was written, giving write-to-ack latency.
+
+    python bench/hec_stub.py --port 8088
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class HecStub:
+    """A threaded stub HEC endpoint; `port=0` picks a free port"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, track_latency: bool = False,
+                 status: int = 200):
+        self.track_latency = track_latency
+        self.status = status
+        self.requests = 0
+        self.events = 0
+        self.bytes = 0
+        self.latencies: List[float] = []
+        self.sourcetypes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._reply(200, b'{"text":"HEC is healthy","code":17}')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.record(body, time.time())
+                self._reply(stub.status, b'{"text":"Success","code":0}')
+
+            def _reply(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def record(self, body: bytes, received: float):
+        lines = body.split(b"\n")
+        latencies = []
+        sourcetypes: Dict[str, int] = {}
+        if self.track_latency:
+            for line in lines:
+                payload = json.loads(line)
+                sourcetype = payload.get("sourcetype", "")
+                sourcetypes[sourcetype] = sourcetypes.get(sourcetype, 0) + 1
+                ts = payload.get("event", {}).get("ts")
+                if ts is not None:
+                    latencies.append(received - float(ts))
+        with self._lock:
+            self.requests += 1
+            self.events += len(lines)
+            self.bytes += len(body)
+            self.latencies.extend(latencies)
+            for sourcetype, count in sourcetypes.items():
+                self.sourcetypes[sourcetype] = self.sourcetypes.get(sourcetype, 0) + count
+
+    def start(self) -> "HecStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="hec-stub")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.events = self.bytes = 0
+            self.latencies = []
+            self.sourcetypes = {}
+
+    def wait_for(self, events: int, timeout: float) -> bool:
+        """Wait until at least `events` events have arrived"""
+        deadline = time.monotonic() + timeout
+        while self.events < events:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "events": self.events,
+                "bytes": self.bytes,
+                "events_per_request": round(self.events / self.requests, 1) if self.requests else 0.0,
+                "sourcetypes": dict(self.sourcetypes),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between stats lines")
+    args = parser.parse_args()
+
+    stub = HecStub(args.host, args.port, status=args.status).start()
+    print(f"Stub HEC listening on http://{args.host}:{stub.port}/services/collector/event")
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(json.dumps(stub.stats()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
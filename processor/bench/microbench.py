@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks
+Times the per-event hot paths on synthetic conn, dns and http logs: parsing, GeoIP
+enrichment, HEC serialization and the columnar enrich+encode path used for batches, for
+TSV and for JSON logs.
+
+    python bench/microbench.py --events 50000 --output micro.json
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import ColumnarBatch, enrich_and_encode  # noqa: E402
+from config import GEOIP_ASN_DB_PATH, GEOIP_CACHE_SIZE, GEOIP_DB_PATH  # noqa: E402
+from enrichment import enrich_event  # noqa: E402
+from geoip import GeoIPEngine  # noqa: E402
+from hec_sender import encode_event  # noqa: E402
+from log_parser import JsonSchema, ZeekLogParser, read_zeek_header  # noqa: E402
+from log_types import log_type_for  # noqa: E402
+from results import write_results  # noqa: E402
+from zeek_gen import LOG_TYPES, header, lines_for, to_json  # noqa: E402
+
+
+def measure(run: Callable[[], Any], events: int, repeat: int) -> Dict[str, Any]:
+    """Run a benchmark `repeat` times; throughput is taken from the fastest run"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "events": events,
+        "best_sec": round(best, 6),
+        "median_sec": round(statistics.median(timings), 6),
+        "events_per_sec": round(events / best, 1) if best > 0 else 0.0,
+        "ns_per_event": round(best / events * 1e9, 1) if events else 0.0,
+    }
+
+
+def bench_log_type(log_type: str, args, engine: GeoIPEngine) -> Dict[str, Dict[str, Any]]:
+    fields = LOG_TYPES[log_type][0]
+    lines = list(lines_for(log_type)(args.events, args.sources, args.destinations, args.seed))
+    schema, _ = read_zeek_header(io.BytesIO(header(log_type, fields).encode()))
+    zeek_type = log_type_for(schema)
+    parse = schema.parse
+    events: List[Dict[str, Any]] = [parse(line) for line in lines]
+    count = len(events)
+    results = {}
+
+    def run_parse():
+        for line in lines:
+            parse(line)
+    results[f"parse.{log_type}"] = measure(run_parse, count, args.repeat)
+
+    if log_type == "conn":
+        parser = ZeekLogParser()
+        field_names = [name for name, _ in fields]
+
+        def run_parse_zeek_line():
+            for line in lines:
+                parser.parse_zeek_line(line, field_names)
+        results["parse_zeek_line.conn"] = measure(run_parse_zeek_line, count, args.repeat)
+
+    ip_fields = zeek_type.ip_fields
+
+    def run_enrich():
+        for event in events:
+            enrich_event(event, engine, ip_fields)
+    run_enrich()  # warm the GeoIP cache so runs are comparable
+    results[f"enrich.{log_type}"] = measure(run_enrich, count, args.repeat)
+
+    sourcetype = zeek_type.sourcetype
+
+    def run_serialize():
+        for event in events:
+            encode_event(event, "main", "zeek_processor", sourcetype)
+    results[f"serialize.{log_type}"] = measure(run_serialize, count, args.repeat)
+
+    raw = [parse(line) for line in lines]
+    columns = zeek_type.schema_columns(schema)
+    batches = [raw[i:i + args.batch_size] for i in range(0, count, args.batch_size)]
+
+    def run_columnar():
+        for records in batches:
+            enrich_and_encode(ColumnarBatch(records, columns, validate=False), engine, zeek_type,
+                              "main", "zeek_processor")
+    results[f"columnar.{log_type}"] = measure(run_columnar, count, args.repeat)
+
+    json_schema = JsonSchema(log_type)
+    json_batches = [
+        [to_json(line, fields).rstrip("\n") for line in lines[i:i + args.batch_size]]
+        for i in range(0, count, args.batch_size)
+    ]
+
+    def run_parse_json():
+        for json_lines in json_batches:
+            json_schema.parse_lines(json_lines)
+    results[f"parse_json.{log_type}"] = measure(run_parse_json, count, args.repeat)
+
+    parsed = [json_schema.parse_lines(json_lines) for json_lines in json_batches]
+    json_columns = [zeek_type.batch_columns(records) for records, _ in parsed]
+
+    def run_columnar_json():
+        # Records are shipped as their rewritten lines, as direct ingest does
+        for (records, texts), batch_columns in zip(parsed, json_columns):
+            batch = ColumnarBatch(records, batch_columns, validate=False)
+            batch.raw = texts
+            enrich_and_encode(batch, engine, zeek_type, "main", "zeek_processor")
+    results[f"columnar_json.{log_type}"] = measure(run_columnar_json, count, args.repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50000, help="events per log type")
+    parser.add_argument("--types", nargs="+", choices=sorted(LOG_TYPES), default=sorted(LOG_TYPES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1000, help="events per columnar batch")
+    parser.add_argument("--sources", type=int, default=200, help="distinct source IPs")
+    parser.add_argument("--destinations", type=int, default=2000, help="distinct destination IPs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--geoip-db", default=GEOIP_DB_PATH)
+    parser.add_argument("--geoip-asn-db", default=GEOIP_ASN_DB_PATH)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    engine = GeoIPEngine(args.geoip_db, args.geoip_asn_db, cache_size=GEOIP_CACHE_SIZE)
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for log_type in args.types:
+            results.update(bench_log_type(log_type, args, engine))
+    finally:
+        engine.close()
+
+    for name, result in results.items():
+        print(f"{name:24s} {result['events_per_sec']:>14,.0f} events/sec  {result['ns_per_event']:>10,.0f} ns/event")
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    params["geoip_loaded"] = os.path.exists(args.geoip_db)
+    write_results(args.output, "microbench", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Pipeline Scaling Benchmark
+Runs the multi-process pipeline (parse + enrich + encode, no HEC) over a synthetic
+conn.log with increasing worker counts and reports events/sec and speedup.
+
+    python bench/pipeline_scaling.py --events 500000 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import Pipeline  # noqa: E402
+from results import write_results  # noqa: E402
+from zeek_gen import write_conn_log  # noqa: E402
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--chunk-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "conn.log")
+        write_conn_log(path, args.events)
+        results = []
+        for workers in args.workers:
+            result = asyncio.run(Pipeline(workers, args.chunk_bytes).run([path]))
+            result["speedup"] = round(result["events_per_sec"] / results[0]["events_per_sec"], 2) if results else 1.0
+            results.append(result)
+            print(f"workers={workers:3d}  {result['events_per_sec']:>12,.0f} events/sec  speedup x{result['speedup']}")
+
+    params = {"events": args.events, "workers": args.workers, "chunk_bytes": args.chunk_bytes}
+    write_results(args.output, "pipeline_scaling", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark Results
+Common JSON layout for benchmark output, so runs can be compared with compare.py.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Dict, Optional
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path: Optional[str], benchmark: str, params: Dict[str, Any], results: Any) -> Dict[str, Any]:
+    """Wrap results with the benchmark name, parameters and environment; write them if path is set"""
+    document = {"benchmark": benchmark, "params": params, "environment": environment(), "results": results}
+    if path:
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {path}")
+    return document
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Synthetic Zeek Log Generator
+Writes realistic-looking Zeek conn, dns and http logs for benchmarks, as TSV or as JSON
+(LogAscii::use_json).
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, Dict, Iterator, List
+
+CONN_FIELDS = [
+    ("ts", "time"), ("uid", "string"), ("id.orig_h", "addr"), ("id.orig_p", "port"),
+    ("id.resp_h", "addr"), ("id.resp_p", "port"), ("proto", "enum"), ("service", "string"),
+    ("duration", "interval"), ("orig_bytes", "count"), ("resp_bytes", "count"),
+    ("conn_state", "string"), ("local_orig", "bool"), ("local_resp", "bool"),
+    ("missed_bytes", "count"), ("history", "string"), ("orig_pkts", "count"),
+    ("orig_ip_bytes", "count"), ("resp_pkts", "count"), ("resp_ip_bytes", "count"),
+    ("tunnel_parents", "set[string]"),
+]
+
+DNS_FIELDS = [
+    ("ts", "time"), ("uid", "string"), ("id.orig_h", "addr"), ("id.orig_p", "port"),
+    ("id.resp_h", "addr"), ("id.resp_p", "port"), ("proto", "enum"), ("trans_id", "count"),
+    ("rtt", "interval"), ("query", "string"), ("qclass", "count"), ("qclass_name", "string"),
+    ("qtype", "count"), ("qtype_name", "string"), ("rcode", "count"), ("rcode_name", "string"),
+    ("AA", "bool"), ("TC", "bool"), ("RD", "bool"), ("RA", "bool"), ("Z", "count"),
+    ("answers", "vector[string]"), ("TTLs", "vector[interval]"), ("rejected", "bool"),
+]
+
+HTTP_FIELDS = [
+    ("ts", "time"), ("uid", "string"), ("id.orig_h", "addr"), ("id.orig_p", "port"),
+    ("id.resp_h", "addr"), ("id.resp_p", "port"), ("trans_depth", "count"), ("method", "string"),
+    ("host", "string"), ("uri", "string"), ("referrer", "string"), ("version", "string"),
+    ("user_agent", "string"), ("origin", "string"), ("request_body_len", "count"),
+    ("response_body_len", "count"), ("status_code", "count"), ("status_msg", "string"),
+    ("info_code", "count"), ("info_msg", "string"), ("tags", "set[enum]"), ("username", "string"),
+    ("password", "string"), ("proxied", "set[string]"), ("orig_fuids", "vector[string]"),
+    ("orig_filenames", "vector[string]"), ("orig_mime_types", "vector[string]"),
+    ("resp_fuids", "vector[string]"), ("resp_filenames", "vector[string]"),
+    ("resp_mime_types", "vector[string]"),
+]
+
+SERVICES = [(53, "udp", "dns"), (443, "tcp", "ssl"), (80, "tcp", "http"), (123, "udp", "ntp"), (22, "tcp", "ssh")]
+CONN_STATES = ["SF", "SF", "SF", "S0", "REJ", "RSTO", "OTH"]
+UID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+DOMAINS = ["example.com", "google.com", "github.com", "cdn.jsdelivr.net", "api.slack.com",
+           "update.microsoft.com", "s3.amazonaws.com", "login.live.com", "pypi.org", "npmjs.org"]
+QTYPES = [(1, "A"), (1, "A"), (28, "AAAA"), (5, "CNAME"), (16, "TXT"), (15, "MX"), (12, "PTR")]
+RCODES = [(0, "NOERROR"), (0, "NOERROR"), (0, "NOERROR"), (3, "NXDOMAIN"), (2, "SERVFAIL")]
+METHODS = ["GET", "GET", "GET", "POST", "PUT", "HEAD"]
+STATUSES = [(200, "OK"), (200, "OK"), (304, "Not Modified"), (301, "Moved Permanently"),
+            (404, "Not Found"), (500, "Internal Server Error")]
+USER_AGENTS = ["Mozilla/5.0 (Windows NT 10.0; Win64; x64)", "curl/8.4.0", "python-requests/2.31.0",
+               "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_0)"]
+MIME_TYPES = ["text/html", "application/json", "image/png", "application/octet-stream"]
+
+
+def header(path: str, fields) -> str:
+    names = "\t".join(name for name, _ in fields)
+    types = "\t".join(kind for _, kind in fields)
+    opened = time.strftime("%Y-%m-%d-%H-%M-%S")
+    return (
+        "#separator \\x09\n#set_separator\t,\n#empty_field\t(empty)\n#unset_field\t-\n"
+        f"#path\t{path}\n#open\t{opened}\n#fields\t{names}\n#types\t{types}\n"
+    )
+
+
+def make_ips(count: int, rng: random.Random, private: bool) -> List[str]:
+    if private:
+        return [f"192.168.{rng.randrange(256)}.{rng.randrange(1, 255)}" for _ in range(count)]
+    return [f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+            for _ in range(count)]
+
+
+def make_uid(rng: random.Random, prefix: str = "C") -> str:
+    return prefix + "".join(rng.choice(UID_CHARS) for _ in range(17))
+
+
+def conn_lines(count: int, sources: int = 200, destinations: int = 2000, seed: int = 1,
+               start_ts: float = 1700000000.0) -> Iterator[str]:
+    """Yield conn.log data lines with the given IP cardinalities"""
+    rng = random.Random(seed)
+    src_ips = make_ips(sources, rng, private=True)
+    dst_ips = make_ips(destinations, rng, private=False)
+    ts = start_ts
+    for _ in range(count):
+        ts += rng.expovariate(100.0)
+        port, proto, service = rng.choice(SERVICES)
+        orig_bytes = rng.randrange(40, 4000)
+        resp_bytes = rng.randrange(0, 60000)
+        orig_pkts = rng.randrange(1, 40)
+        resp_pkts = rng.randrange(0, 60)
+        yield "\t".join((
+            f"{ts:.6f}",
+            make_uid(rng),
+            rng.choice(src_ips), str(rng.randrange(1024, 65536)),
+            rng.choice(dst_ips), str(port), proto, service,
+            f"{rng.random() * 5:.6f}", str(orig_bytes), str(resp_bytes),
+            rng.choice(CONN_STATES), "T", "F", "0", "ShADadFf",
+            str(orig_pkts), str(orig_bytes + 40 * orig_pkts),
+            str(resp_pkts), str(resp_bytes + 40 * resp_pkts), "(empty)",
+        )) + "\n"
+
+
+def dns_lines(count: int, sources: int = 200, destinations: int = 20, seed: int = 1,
+              start_ts: float = 1700000000.0) -> Iterator[str]:
+    """Yield dns.log data lines; destinations are resolvers, answers come from a larger pool"""
+    rng = random.Random(seed)
+    src_ips = make_ips(sources, rng, private=True)
+    resolvers = make_ips(destinations, rng, private=False)
+    answer_ips = make_ips(max(destinations * 50, 100), rng, private=False)
+    ts = start_ts
+    for _ in range(count):
+        ts += rng.expovariate(100.0)
+        qtype, qtype_name = rng.choice(QTYPES)
+        rcode, rcode_name = rng.choice(RCODES)
+        if rcode == 0:
+            answers = rng.sample(answer_ips, rng.randrange(1, 4))
+            ttls = ",".join(f"{rng.choice((60, 300, 3600)):.6f}" for _ in answers)
+            answers = ",".join(answers)
+        else:
+            answers = ttls = "-"
+        yield "\t".join((
+            f"{ts:.6f}", make_uid(rng), rng.choice(src_ips), str(rng.randrange(1024, 65536)),
+            rng.choice(resolvers), "53", "udp", str(rng.randrange(65536)), f"{rng.random() / 20:.6f}",
+            rng.choice(DOMAINS), "1", "C_INTERNET", str(qtype), qtype_name, str(rcode), rcode_name,
+            "F", "F", "T", "T", "0", answers, ttls, "F",
+        )) + "\n"
+
+
+def http_lines(count: int, sources: int = 200, destinations: int = 2000, seed: int = 1,
+               start_ts: float = 1700000000.0) -> Iterator[str]:
+    """Yield http.log data lines with the given IP cardinalities"""
+    rng = random.Random(seed)
+    src_ips = make_ips(sources, rng, private=True)
+    dst_ips = make_ips(destinations, rng, private=False)
+    ts = start_ts
+    for _ in range(count):
+        ts += rng.expovariate(100.0)
+        status, status_msg = rng.choice(STATUSES)
+        host = rng.choice(DOMAINS)
+        body_len = rng.randrange(0, 200000) if status == 200 else 0
+        resp_fuid = make_uid(rng, "F") if body_len else "-"
+        yield "\t".join((
+            f"{ts:.6f}", make_uid(rng), rng.choice(src_ips), str(rng.randrange(1024, 65536)),
+            rng.choice(dst_ips), "80", "1", rng.choice(METHODS), host,
+            f"/{rng.choice(('index.html', 'api/v1/items', 'static/app.js', 'login'))}?id={rng.randrange(10000)}",
+            "-", "1.1", rng.choice(USER_AGENTS), "-", "0", str(body_len), str(status), status_msg,
+            "-", "-", "(empty)", "-", "-", "-", "-", "-", "-",
+            resp_fuid, "-", rng.choice(MIME_TYPES) if body_len else "-",
+        )) + "\n"
+
+
+def _json_value(kind: str, value: str):
+    if kind.startswith(("set[", "vector[")):
+        inner = kind[kind.index("[") + 1:-1]
+        return [] if value == "(empty)" else [_json_value(inner, item) for item in value.split(",")]
+    if kind in ("count", "int", "port"):
+        return int(value)
+    if kind in ("time", "interval", "double"):
+        return float(value)
+    if kind == "bool":
+        return value == "T"
+    return value
+
+
+def to_json(line: str, fields) -> str:
+    """A TSV data line as Zeek writes it with LogAscii::use_json: unset fields are left out"""
+    record = {
+        name: _json_value(kind, value)
+        for (name, kind), value in zip(fields, line.rstrip("\n").split("\t"))
+        if value != "-"
+    }
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+LOG_TYPES: Dict[str, tuple] = {
+    "conn": (CONN_FIELDS, conn_lines),
+    "dns": (DNS_FIELDS, dns_lines),
+    "http": (HTTP_FIELDS, http_lines),
+}
+
+
+def lines_for(log_type: str) -> Callable[..., Iterator[str]]:
+    return LOG_TYPES[log_type][1]
+
+
+def write_log(path: str, log_type: str, count: int, sources: int = 200, destinations: int = 2000,
+              seed: int = 1, max_bytes: int = 0, json_format: bool = False) -> int:
+    """
+    Write a log of the given type with a header (TSV) or as JSON lines; stops after `count`
+    events or, if set, once the file reaches `max_bytes`. Returns the number of events written.
+    """
+    fields, generate = LOG_TYPES[log_type]
+    written = 0
+    with open(path, "w") as f:
+        size = 0 if json_format else f.write(header(log_type, fields))
+        for line in generate(count, sources, destinations, seed):
+            size += f.write(to_json(line, fields) if json_format else line)
+            written += 1
+            if max_bytes and size >= max_bytes:
+                break
+    return written
+
+
+def write_conn_log(path: str, count: int, sources: int = 200, destinations: int = 2000, seed: int = 1):
+    write_log(path, "conn", count, sources, destinations, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Zeek conn, dns or http log")
+    parser.add_argument("output")
+    parser.add_argument("--type", choices=sorted(LOG_TYPES), default="conn", help="log type")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--size-mb", type=float, default=0, help="stop once the file reaches this size")
+    parser.add_argument("--sources", type=int, default=200, help="distinct source IPs")
+    parser.add_argument("--destinations", type=int, default=2000, help="distinct destination IPs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="write JSON lines, as with LogAscii::use_json")
+    args = parser.parse_args()
+    count = args.events
+    if args.size_mb:
+        count = 1 << 62
+    written = write_log(args.output, args.type, count, args.sources, args.destinations, args.seed,
+                        max_bytes=int(args.size_mb * 1024 * 1024), json_format=args.json)
+    print(f"Wrote {written} {args.type} events to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Checkpoint Store
+Crash-safe record of how far each tailed log file has been acknowledged by the processor.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of leading bytes hashed to tell a file apart from a later file reusing its inode.
+# Zeek headers carry an #open timestamp, so this is unique per log file.
+FINGERPRINT_BYTES = 1024
+
+
+def fingerprint_fd(fd: int, size: int) -> str:
+    """Hash the first `size` bytes of an open file"""
+    return hashlib.sha1(os.pread(fd, size, 0)).hexdigest()
+
+
+class Checkpoint(NamedTuple):
+    dev: int
+    inode: int
+    offset: int
+    fingerprint: str
+    fingerprint_size: int
+
+
+class CheckpointStore:
+    """
+    Checkpoints keyed by live log path, persisted as one JSON file.
+
+    Updates are kept in memory and written with write-to-temp, fsync and rename, so the
+    file on disk is always a complete earlier or later version. `min_interval` limits how
+    often the file is rewritten; with the default of 0 it is written once per
+    acknowledged batch.
+    """
+
+    def __init__(self, path: str, min_interval: float = 0.0):
+        self.path = Path(path)
+        self.min_interval = min_interval
+        self.checkpoints: Dict[str, Checkpoint] = {}
+        self._dirty = False
+        self._last_flush = 0.0
+        self.load()
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as e:
+            logger.error(f"Ignoring unreadable checkpoint file {self.path}: {e}")
+            return
+        for key, values in data.get("files", {}).items():
+            try:
+                self.checkpoints[key] = Checkpoint(**values)
+            except TypeError:
+                logger.warning(f"Ignoring malformed checkpoint for {key}")
+        logger.info(f"Loaded {len(self.checkpoints)} checkpoints from {self.path}")
+
+    def get(self, key: str) -> Optional[Checkpoint]:
+        return self.checkpoints.get(key)
+
+    def update(self, key: str, checkpoint: Checkpoint):
+        if self.checkpoints.get(key) != checkpoint:
+            self.checkpoints[key] = checkpoint
+            self._dirty = True
+
+    def remove(self, key: str):
+        if self.checkpoints.pop(key, None) is not None:
+            self._dirty = True
+
+    def flush(self, force: bool = False):
+        """Atomically write checkpoints to disk if anything changed"""
+        if not self._dirty:
+            return
+        if not force and time.monotonic() - self._last_flush < self.min_interval:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        data = {"files": {key: cp._asdict() for key, cp in self.checkpoints.items()}}
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        dir_fd = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._dirty = False
+        self._last_flush = time.monotonic()
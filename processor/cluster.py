@@ -0,0 +1,208 @@
+"""
+Processor Cluster
+Partitions events across processor replicas with a consistent hash ring. Every record of
+a source IP lands on the same replica, and so does every record of a uid (all of a
+connection's records share its source), so correlation, flow rollup, detection and stats
+keep working when ingest is spread over several processors.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Fields hashed to pick a replica, in order of preference, for each partition key
+PARTITION_KEYS = {
+    "source": ("id_orig_h", "uid"),
+    "uid": ("uid", "id_orig_h"),
+}
+
+CACHE_LIMIT = 65536
+
+
+def stable_hash(key: str) -> int:
+    """64-bit hash that is the same in every process, so all watchers agree on placement"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def parse_members(value: str) -> List[str]:
+    """Replica URLs from a comma- or newline-separated list; blank entries and # comments are skipped"""
+    members = []
+    for line in value.replace(",", "\n").splitlines():
+        member = line.split("#", 1)[0].strip().rstrip("/")
+        if member and member not in members:
+            members.append(member)
+    return members
+
+
+class HashRing:
+    """
+    Consistent hash ring with `vnodes` points per node. Adding or removing a node only
+    moves the keys between its points and their neighbours, about 1/N of them.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 160):
+        self.nodes = sorted(set(nodes))
+        self.vnodes = vnodes
+        points = sorted(
+            (stable_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """The node owning a key: the first point at or after its hash, wrapping around"""
+        if not self._points:
+            raise ValueError("hash ring has no nodes")
+        i = bisect.bisect_left(self._points, stable_hash(key))
+        return self._owners[i if i < len(self._owners) else 0]
+
+
+class ClusterSender:
+    """
+    Sends event batches to processor replicas, split by the consistent hash of each
+    event's partition key. Each replica has its own keep-alive session (one connection)
+    and its own sending thread, so replicas ingest in parallel.
+
+    Membership is `members`, or the replica URLs listed in `members_file` when it exists;
+    the file is re-read when its mtime or size changes (checked at most every
+    `reload_interval` seconds). Every watcher must list the same URLs, in any order.
+    """
+
+    def __init__(self, members: List[str], partition_key: str = "source", vnodes: int = 160,
+                 members_file: str = "", reload_interval: float = 5.0, timeout: float = 30.0):
+        if partition_key not in PARTITION_KEYS:
+            raise ValueError(f"partition key must be one of: {', '.join(PARTITION_KEYS)}")
+        self.static_members = parse_members(",".join(members))
+        self.key_fields = PARTITION_KEYS[partition_key]
+        self.partition_key = partition_key
+        self.vnodes = vnodes
+        self.members_file = members_file
+        self.reload_interval = reload_interval
+        self.timeout = timeout
+        self.ring = HashRing([], vnodes)
+        self.sessions: Dict[str, requests.Session] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.rebalances = 0
+        self._cache: Dict[str, str] = {}
+        self._signature: Optional[Tuple[float, int]] = None
+        self._checked = 0.0
+        self._set_members(self.static_members)
+        self.reload()
+
+    @property
+    def members(self) -> List[str]:
+        return self.ring.nodes
+
+    def _set_members(self, members: List[str]):
+        if not members:
+            logger.error("No processor replicas configured, keeping the current members")
+            return
+        if sorted(members) == self.ring.nodes:
+            return
+        if self.ring.nodes:
+            self.rebalances += 1
+            logger.info(f"Processor replicas changed to {', '.join(sorted(members))}")
+        self.ring = HashRing(members, self.vnodes)
+        self._cache = {}
+        for member in list(self.sessions):
+            if member not in members:
+                self.sessions.pop(member).close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.ring.nodes), thread_name_prefix="replica")
+
+    def reload(self) -> bool:
+        """Re-read the members file if it changed; True if membership changed"""
+        self._checked = time.monotonic()
+        if not self.members_file:
+            return False
+        try:
+            st = os.stat(self.members_file)
+        except OSError:
+            st = None
+        signature = (st.st_mtime, st.st_size) if st is not None else None
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        members = self.static_members
+        if st is not None:
+            try:
+                with open(self.members_file) as f:
+                    members = parse_members(f.read())
+            except OSError as e:
+                logger.error(f"Keeping current processor replicas, cannot read {self.members_file}: {e}")
+                return False
+        before = self.ring.nodes
+        self._set_members(members)
+        return self.ring.nodes != before
+
+    def current(self) -> HashRing:
+        if self.members_file and time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+        return self.ring
+
+    def partition(self, events: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Split events by the replica owning their partition key, keeping their order"""
+        ring = self.current()
+        if len(ring.nodes) == 1:
+            return {ring.nodes[0]: events} if events else {}
+        first, second = self.key_fields
+        cache = self._cache
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            key = event.get(first) or event.get(second)
+            key = key if type(key) is str else "" if key is None else str(key)
+            node = cache.get(key)
+            if node is None:
+                if len(cache) >= CACHE_LIMIT:
+                    cache.clear()
+                node = cache[key] = ring.node_for(key)
+            group = partitions.get(node)
+            if group is None:
+                group = partitions[node] = []
+            group.append(event)
+        return partitions
+
+    def session(self, member: str) -> requests.Session:
+        session = self.sessions.get(member)
+        if session is None:
+            session = self.sessions[member] = requests.Session()
+            session.mount(member, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return session
+
+    def post(self, member: str, path: str, **kwargs) -> requests.Response:
+        return self.session(member).post(f"{member}{path}", timeout=self.timeout, **kwargs)
+
+    def map(self, fn, partitions: Dict[str, Any]) -> Dict[str, Any]:
+        """Run fn(member, value) for each partition, each replica on its own thread"""
+        if len(partitions) == 1:
+            ((member, value),) = partitions.items()
+            return {member: fn(member, value)}
+        futures = {member: self.executor.submit(fn, member, value) for member, value in partitions.items()}
+        return {member: future.result() for member, future in futures.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "members": self.ring.nodes,
+            "partition_key": self.partition_key,
+            "members_file": self.members_file or None,
+            "rebalances": self.rebalances,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
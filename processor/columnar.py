@@ -0,0 +1,158 @@
+"""
+Columnar Batch Enrichment
+Processes a /process/batch body column by column: typed columns are checked in bulk,
+IPs are deduplicated and looked up once per batch, and HEC payloads are assembled from
+pre-serialized fragments.
+"""
+
+import json
+import re
+import time
+from array import array
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from enrichment import PROCESSOR_VERSION
+from geoip import GeoIPEngine
+from log_types import LOG_TYPES, LogType
+
+NoneType = type(None)
+
+# Column name and kind for conn events, in ZeekEvent field order
+CONN_COLUMNS = LOG_TYPES["conn"].columns
+
+# Python types each column kind accepts without coercion
+ALLOWED_TYPES = {
+    "time": {float, int, str, NoneType},
+    "str": {str, NoneType},
+    "int": {int, NoneType},
+    "float": {float, int, NoneType},
+    "bool": {bool, NoneType},
+    "any": None,
+}
+
+
+class ColumnTypeError(ValueError):
+    """A column holds values that need per-event validation and coercion"""
+
+
+class ColumnarBatch:
+    """
+    A batch of events stored as one list per column.
+
+    Construction checks each column's value types in bulk, unless `validate` is False
+    for records that come straight from our own parser.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], columns: List[Tuple[str, str]] = CONN_COLUMNS,
+                 validate: bool = True):
+        if validate and not all(type(event) is dict for event in events):
+            raise ColumnTypeError("batch items must be objects")
+        self.size = len(events)
+        self.names = [name for name, _ in columns]
+        self.kinds = dict(columns)
+        self.columns: Dict[str, list] = {}
+        for name, kind in columns:
+            values = [event.get(name) for event in events]
+            if not validate:
+                self.columns[name] = values
+                continue
+            allowed = ALLOWED_TYPES[kind]
+            if allowed is None:
+                self.columns[name] = values
+                continue
+            found = set(map(type, values))
+            if not found <= allowed:
+                raise ColumnTypeError(f"column {name} has types {sorted(t.__name__ for t in found)}")
+            if kind == "float" and int in found:
+                values = [float(v) if type(v) is int else v for v in values]
+            self.columns[name] = values
+        # Events' own JSON, when they arrived as JSON and can be shipped as-is
+        self.raw: Optional[List[str]] = None
+
+    def index(self, name: str) -> Tuple[array, List[Optional[str]]]:
+        """Dictionary-encode a column: per-row indexes into a list of its unique values"""
+        uniques: Dict[Optional[str], int] = {}
+        setdefault = uniques.setdefault
+        codes = array("I", [setdefault(v, len(uniques)) for v in self.columns[name]])
+        return codes, list(uniques)
+
+    def take(self, positions: List[int]) -> "ColumnarBatch":
+        """A new batch with the rows at `positions`"""
+        batch = ColumnarBatch([], list(self.kinds.items()), validate=False)
+        batch.size = len(positions)
+        batch.columns = {name: [values[i] for i in positions] for name, values in self.columns.items()}
+        if self.raw is not None:
+            batch.raw = [self.raw[i] for i in positions]
+        return batch
+
+    def rows(self):
+        """Rows as dicts with every column present, like ZeekEvent.dict()"""
+        names = self.names
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+
+def _geoip_fragments(engine: GeoIPEngine, ips: List[Optional[str]], key: str) -> List[str]:
+    """Serialized `"<key>":{...}` fragments for each unique IP, empty when the IP is missing"""
+    prefix = f',"{key}":'
+    return [prefix + engine.lookup_json(ip) if ip else "" for ip in ips]
+
+
+# Keys every payload gets after the event's own
+META_KEYS = ("processed_at", "processor_version")
+
+
+def _without_keys(bodies: Iterable[str], keys: Sequence[str]) -> Iterator[str]:
+    """
+    Event JSON texts with `keys` removed, so enrichment can append them without duplicates.
+    A text that may hold one of them (or an escaped key), or is an empty object, is
+    decoded and encoded again; the rest pass through unchanged.
+    """
+    alternatives = [r"\\u", r"^\{\s*\}$"] + [re.escape(json.dumps(key)) + r"\s*:" for key in keys]
+    search = re.compile("|".join(alternatives)).search
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    for body in bodies:
+        if search(body):
+            event = json.loads(body)
+            for key in keys:
+                event.pop(key, None)
+            body = encode(event)
+        yield body
+
+
+def enrich_and_encode(batch: ColumnarBatch, engine: GeoIPEngine, log_type: LogType, index: str,
+                      source: str, extra: Optional[List[str]] = None, extra_keys: Sequence[str] = ()) -> List[bytes]:
+    """
+    Enrich a batch and build HEC payloads. GeoIP data is looked up and serialized once per
+    unique IP and spliced into each event's JSON, so that part scales with unique IPs.
+    `extra` holds further pre-serialized `,"key":value` fragments, one per row, for the
+    keys in `extra_keys`. Events in `batch.raw` are spliced in as they are instead of
+    re-encoded, unless they already hold a key enrichment adds; enrichment replaces it.
+    """
+    per_field = []
+    for field, key in log_type.ip_fields:
+        if field in batch.columns:
+            codes, ips = batch.index(field)
+            fragments = _geoip_fragments(engine, ips, key)
+            per_field.append([fragments[code] for code in codes])
+    if extra is not None:
+        per_field.append(extra)
+    geo = map("".join, zip(*per_field)) if per_field else repeat("")
+    meta = f',"processed_at":{json.dumps(time.time())},"processor_version":{json.dumps(PROCESSOR_VERSION)}}}'
+    envelope = log_type.envelope(index, source)
+    added = [key for field, key in log_type.ip_fields if field in batch.columns] + list(META_KEYS)
+    added += extra_keys if extra is not None else ()
+    if batch.raw is not None:
+        bodies = _without_keys(batch.raw, added)
+    else:
+        rows = batch.rows()
+        if not set(added).isdisjoint(batch.names):
+            rows = ({name: value for name, value in row.items() if name not in added} for row in rows)
+        bodies = map(json.JSONEncoder(separators=(",", ":")).encode, rows)
+    # Every fragment and `meta` start with a comma, which an empty event can't be followed by
+    return [
+        ('{"event":{' + (fragments + meta)[1:] + envelope if body == "{}" else
+         '{"event":' + body[:-1] + fragments + meta + envelope).encode()
+        for body, fragments in zip(bodies, geo)
+    ]
@@ -0,0 +1,82 @@
+"""
+Processor Configuration
+Environment-driven settings shared by the API, the pipeline and the ingest tools.
+"""
+
+import os
+
+SPLUNK_HOST = os.getenv("SPLUNK_HOST", "splunk")
+SPLUNK_PORT = os.getenv("SPLUNK_PORT", "8088")
+SPLUNK_TOKEN = os.getenv("SPLUNK_TOKEN", "00000000-0000-0000-0000-000000000000")
+SPLUNK_INDEX = os.getenv("SPLUNK_INDEX", "main")
+SPLUNK_PASSWORD = os.getenv("SPLUNK_PASSWORD", "admin")  # For REST fallback
+SPLUNK_SCHEME = os.getenv("SPLUNK_SCHEME", "https")  # http or https
+SPLUNK_VERIFY_SSL = os.getenv("SPLUNK_VERIFY_SSL", "false").lower() in ("1", "true", "yes")
+HEC_URL = f"{SPLUNK_SCHEME}://{SPLUNK_HOST}:{SPLUNK_PORT}/services/collector/event"
+HEC_BATCH_EVENTS = int(os.getenv("HEC_BATCH_EVENTS", "500"))
+HEC_BATCH_BYTES = int(os.getenv("HEC_BATCH_BYTES", str(1024 * 1024)))
+HEC_FLUSH_INTERVAL = float(os.getenv("HEC_FLUSH_INTERVAL", "1.0"))
+HEC_MAX_IN_FLIGHT = int(os.getenv("HEC_MAX_IN_FLIGHT", "4"))
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "false").lower() in ("1", "true", "yes")
+SPOOL_RETRY_MAX = float(os.getenv("SPOOL_RETRY_MAX", "30"))
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "/app/geoip/GeoLite2-City.mmdb")
+GEOIP_ASN_DB_PATH = os.getenv("GEOIP_ASN_DB_PATH", "/app/geoip/GeoLite2-ASN.mmdb")
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "65536"))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+PIPELINE_CHUNK_BYTES = int(os.getenv("PIPELINE_CHUNK_BYTES", str(4 * 1024 * 1024)))
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "0"))  # 0 = 2 x workers
+# A spool of its own, so the CLI never writes a segment the processor is replaying
+PIPELINE_SPOOL_DIR = os.getenv("PIPELINE_SPOOL_DIR", os.path.join(SPOOL_DIR, "pipeline"))
+LOGS_DIR = os.getenv("LOGS_DIR", "/app/logs")
+PROCESSOR_URL = os.getenv("PROCESSOR_URL", "http://127.0.0.1:8001")
+PROCESSOR_URLS = os.getenv("PROCESSOR_URLS", PROCESSOR_URL)  # comma-separated replicas for log_watcher.py
+CLUSTER_MEMBERS_FILE = os.getenv("CLUSTER_MEMBERS_FILE", "")  # one replica URL per line; overrides PROCESSOR_URLS
+CLUSTER_PARTITION_KEY = os.getenv("CLUSTER_PARTITION_KEY", "source")  # source (id.orig_h) or uid
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "160"))
+CLUSTER_RELOAD_INTERVAL = float(os.getenv("CLUSTER_RELOAD_INTERVAL", "5"))
+CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "state/log_watcher.json")
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "0"))
+INGEST_MODE = os.getenv("INGEST_MODE", "http")  # http (log_watcher.py) or direct (in-process)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+WATCHER_METRICS_PORT = int(os.getenv("WATCHER_METRICS_PORT", "9101"))  # 0 disables log_watcher /metrics
+STATS_WINDOW_SECONDS = int(os.getenv("STATS_WINDOW_SECONDS", "60"))
+STATS_WINDOWS = int(os.getenv("STATS_WINDOWS", "60"))
+STATS_TOP_K = int(os.getenv("STATS_TOP_K", "100"))
+LIVE_BUFFER_EVENTS = int(os.getenv("LIVE_BUFFER_EVENTS", "1000"))
+LIVE_FRAME_INTERVAL = float(os.getenv("LIVE_FRAME_INTERVAL", "0.25"))
+LIVE_STATS_INTERVAL = float(os.getenv("LIVE_STATS_INTERVAL", "5"))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "50"))
+RULES_FILE = os.getenv("RULES_FILE", "/app/configs/processor_rules.json")  # missing file = keep everything
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "5"))
+ROLLUP_WINDOW = float(os.getenv("ROLLUP_WINDOW", "60"))  # seconds a flow is folded before its summary is sent
+ROLLUP_MAX_FLOWS = int(os.getenv("ROLLUP_MAX_FLOWS", "100000"))
+ROLLUP_SAMPLE_UIDS = int(os.getenv("ROLLUP_SAMPLE_UIDS", "5"))
+INTEL_DIR = os.getenv("INTEL_DIR", "/app/configs/intel")  # one indicator feed per file; missing = no matching
+INTEL_RELOAD_INTERVAL = float(os.getenv("INTEL_RELOAD_INTERVAL", "60"))
+STORE_DIR = os.getenv("STORE_DIR", "")  # empty = no local event store (and no /query)
+STORE_RETENTION_HOURS = float(os.getenv("STORE_RETENTION_HOURS", "24"))
+STORE_MAX_BYTES = int(os.getenv("STORE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "30"))
+STORE_SEGMENT_EVENTS = int(os.getenv("STORE_SEGMENT_EVENTS", "50000"))
+STORE_CACHE_COLUMNS = int(os.getenv("STORE_CACHE_COLUMNS", "256"))
+CORRELATION_TTL = float(os.getenv("CORRELATION_TTL", "600"))  # seconds dns/http/ssl records wait for their conn
+CORRELATION_MAX_UIDS = int(os.getenv("CORRELATION_MAX_UIDS", "100000"))
+CORRELATION_MAX_RECORDS = int(os.getenv("CORRELATION_MAX_RECORDS", "5"))  # per protocol and uid
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+BACKFILL_RATE = float(os.getenv("BACKFILL_RATE", "0"))  # events/sec across all backfill workers; 0 = unlimited
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "1000"))
+BACKFILL_MANIFEST = os.getenv("BACKFILL_MANIFEST", "state/backfill.json")
+DETECTION_ENABLED = os.getenv("DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+SCAN_WINDOW = float(os.getenv("SCAN_WINDOW", "300"))  # seconds of event time a source's fan-out is counted over
+SCAN_HOST_THRESHOLD = int(os.getenv("SCAN_HOST_THRESHOLD", "100"))
+SCAN_PORT_THRESHOLD = int(os.getenv("SCAN_PORT_THRESHOLD", "100"))
+SCAN_MAX_SOURCES = int(os.getenv("SCAN_MAX_SOURCES", "20000"))
+BEACON_MIN_EVENTS = int(os.getenv("BEACON_MIN_EVENTS", "8"))
+BEACON_MIN_INTERVAL = float(os.getenv("BEACON_MIN_INTERVAL", "10"))
+BEACON_MAX_JITTER = float(os.getenv("BEACON_MAX_JITTER", "0.1"))  # interval stddev / mean
+BEACON_MAX_PAIRS = int(os.getenv("BEACON_MAX_PAIRS", "100000"))
+DETECTION_COOLDOWN = float(os.getenv("DETECTION_COOLDOWN", "3600"))  # seconds before a source or pair is reported again
@@ -0,0 +1,145 @@
+"""
+UID Correlation
+Joins application-layer records (dns, http, ssl) to their connection through Zeek's `uid`,
+so each conn event ships with the DNS query, HTTP host/URI and TLS SNI of its flow.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import REGISTRY
+
+# Fields kept from each application-layer record
+CORRELATED_FIELDS = {
+    "dns": ("query", "qtype_name", "rcode_name", "answers"),
+    "http": ("method", "host", "uri", "status_code", "user_agent"),
+    "ssl": ("server_name", "version", "ja3", "established"),
+}
+
+CORRELATION_JOINS = REGISTRY.counter(
+    "correlation_joins_total", "Conn events by whether their application-layer records were found", ["result"]
+)
+
+
+class CorrelationCache:
+    """
+    Application-layer records by uid, kept for `ttl` seconds. They stay after a conn event
+    is joined, so a conn that is encoded again (a batch resent after a failed delivery)
+    is joined again too.
+
+    Zeek writes conn.log when a connection ends, so for most flows the dns, http and ssl
+    records arrive first; `ttl` should cover the longest expected gap (the inactivity
+    timeouts, plus log rotation and batching delays). At most `max_uids` uids are kept,
+    the least recently updated going first, and `max_records` records per protocol.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_uids: int = 100000, max_records: int = 5):
+        self.ttl = ttl
+        self.max_uids = max_uids
+        self.max_records = max_records
+        # uid -> (expiry, {protocol: [record, ...]}), oldest expiry first
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.recorded = 0
+        self.joined = 0
+        self.missed = 0
+        self.expired = 0
+        self.evicted = 0
+        REGISTRY.callback("correlation_cache_uids", "Uids with application-layer records held for joining",
+                          lambda: len(self.entries))
+
+    def _expire(self, now: float):
+        entries = self.entries
+        while entries:
+            uid, (expiry, _) = next(iter(entries.items()))
+            if expiry > now:
+                break
+            del entries[uid]
+            self.expired += 1
+
+    def record(self, log_type: str, events: List[Dict[str, Any]]):
+        """Remember the correlated fields of application-layer events; other types are ignored"""
+        fields = CORRELATED_FIELDS.get(log_type)
+        if fields is None or not events:
+            return
+        now = time.monotonic()
+        self._expire(now)
+        entries = self.entries
+        expiry = now + self.ttl
+        for event in events:
+            uid = event.get("uid")
+            if not uid or type(uid) is not str:
+                continue
+            record = {name: event[name] for name in fields if event.get(name) is not None}
+            if not record:
+                continue
+            entry = entries.pop(uid, None)
+            protocols = entry[1] if entry is not None else {}
+            records = protocols.setdefault(log_type, [])
+            if len(records) < self.max_records:
+                records.append(record)
+            entries[uid] = (expiry, protocols)
+            self.recorded += 1
+        while len(entries) > self.max_uids:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    def _find(self, uid: Any, service: Any) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        entry = self.entries.get(uid) if uid and type(uid) is str else None
+        if entry is not None and entry[0] <= time.monotonic():
+            del self.entries[uid]
+            self.expired += 1
+            entry = None
+        if entry is not None:
+            self.joined += 1
+            return entry[1]
+        # Only conns whose service says an application log should exist count as misses
+        if service and type(service) is str and any(name in service for name in CORRELATED_FIELDS):
+            self.missed += 1
+        return None
+
+    def join(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach the records for a conn event's uid as `correlated`, in place"""
+        counts = self.joined, self.missed
+        joined = self._find(event.get("uid"), event.get("service"))
+        if joined is not None:
+            # A copy, as the cached lists keep growing while the uid is held
+            event["correlated"] = {protocol: list(records) for protocol, records in joined.items()}
+        self._count(*counts)
+        return event
+
+    def fragments(self, uids: List[Any], services: List[Any]) -> Optional[List[str]]:
+        """
+        Per-row `,"correlated":{...}` JSON fragments for a batch of conn events given as
+        columns, or None when no row has records
+        """
+        counts = self.joined, self.missed
+        fragments = None
+        for row, (uid, service) in enumerate(zip(uids, services)):
+            joined = self._find(uid, service)
+            if joined is not None:
+                if fragments is None:
+                    fragments = [""] * len(uids)
+                fragments[row] = ',"correlated":' + json.dumps(joined, separators=(",", ":"))
+        self._count(*counts)
+        return fragments
+
+    def _count(self, joined: int, missed: int):
+        """Add what a call joined and missed to the metrics, once per batch"""
+        if self.joined > joined:
+            CORRELATION_JOINS.inc("joined", amount=self.joined - joined)
+        if self.missed > missed:
+            CORRELATION_JOINS.inc("missed", amount=self.missed - missed)
+
+    def stats(self) -> Dict[str, Any]:
+        joined, missed = self.joined, self.missed
+        return {
+            "uids": len(self.entries),
+            "recorded": self.recorded,
+            "joined": joined,
+            "missed": missed,
+            "join_rate": round(joined / (joined + missed), 3) if joined + missed else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,309 @@
+"""
+Scan and Beacon Detection
+Inline detections over conn events: sources fanning out to many destination hosts or
+ports (scans) and connection pairs that recur at a steady interval (beaconing). State is
+fixed-size, so detection keeps up with ingest instead of running as scheduled searches.
+"""
+
+import math
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aggregates import HyperLogLog
+from log_parser import event_time
+from metrics import REGISTRY
+
+# 128 one-byte registers (~9% error) per sketch keeps a tracked source at about 1.5 KB
+SKETCH_PRECISION = 7
+_REGISTERS = 1 << SKETCH_PRECISION
+_WIDTH = 64 - SKETCH_PRECISION
+_MASK = (1 << _WIDTH) - 1
+_BITS = (1 << 64) - 1
+
+DETECTIONS = REGISTRY.counter("detections_total", "Scan and beacon detections emitted", ["detection"])
+
+
+def _add(registers: bytearray, value: Any) -> bool:
+    """
+    Add a value to a sketch; returns True if a register grew. The sketches never leave
+    the process, so the built-in string hash (SipHash, cached on each string) is used
+    instead of a stable one. Integers hash to themselves, so ports are hashed as text.
+    """
+    h = hash(value if type(value) is str else str(value)) & _BITS
+    index = h >> _WIDTH
+    rank = _WIDTH - (h & _MASK).bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+        return True
+    return False
+
+
+def _bucket_estimate(registers: bytearray) -> float:
+    """
+    Linear-counting estimate of one bucket, infinite once it has no empty registers.
+    Buckets overlap, so their sum is an upper bound on the window's distinct count.
+    """
+    zeros = registers.count(0)
+    return _REGISTERS * math.log(_REGISTERS / zeros) if zeros else math.inf
+
+
+def _window_count(buckets: List[bytearray]) -> int:
+    """Distinct count over several buckets, merging their registers in one pass"""
+    merged = HyperLogLog(SKETCH_PRECISION)
+    merged.registers = bytearray(map(max, *buckets)) if len(buckets) > 1 else bytearray(buckets[0])
+    return merged.count()
+
+
+def _severity(ratio: float) -> str:
+    """Severity from how far a measurement is past its threshold (1 = just past it)"""
+    if ratio >= 4:
+        return "high"
+    if ratio >= 2:
+        return "medium"
+    return "low"
+
+
+class _Source:
+    """
+    Fan-out of one source over a sliding window: a ring of buckets, each with its own
+    sketches of destination hosts and ports, so the window slides a bucket at a time
+    """
+    __slots__ = ("buckets", "hosts", "ports", "conns", "last_ts", "uid", "alerted_until", "batch")
+
+    def __init__(self, buckets: int):
+        self.buckets = [-1] * buckets
+        self.hosts = [bytearray(_REGISTERS) for _ in range(buckets)]
+        self.ports = [bytearray(_REGISTERS) for _ in range(buckets)]
+        self.conns = [0] * buckets
+        self.last_ts = 0.0
+        self.uid: Optional[str] = None
+        self.alerted_until = 0.0
+        self.batch = -1
+
+
+class _Pair:
+    """Start times of the last `history` connections between a source and a destination port"""
+    __slots__ = ("times", "count", "first_ts", "uid", "alerted_until")
+
+    def __init__(self, history: int, first_ts: float):
+        self.times = array("d", [first_ts] * history)
+        self.count = 1
+        self.first_ts = first_ts
+        self.uid: Optional[str] = None
+        self.alerted_until = 0.0
+
+
+class Detector:
+    """
+    Scan detection: each source's distinct destination hosts and ports are counted with
+    HyperLogLog sketches over the last `scan_window` seconds of event time, in
+    `scan_buckets` buckets. A source reaching `scan_hosts` hosts or `scan_ports` ports is
+    reported. At most `max_sources` sources are tracked, least recently seen going first.
+
+    Beacon detection: each (source, destination, port) pair keeps the start times of its
+    last `beacon_history` connections in a ring. Once it has `beacon_min_events`, a pair
+    whose mean interval is at least `beacon_min_interval` seconds and whose intervals vary
+    by at most `beacon_max_jitter` (standard deviation / mean) is reported. A pair is only
+    tracked from its second connection, after a probation list of first sightings, so scan
+    fan-out can't push long-lived pairs out; each list holds at most `max_pairs`.
+
+    A source or pair is reported again only after `cooldown` seconds of event time.
+    """
+
+    def __init__(self, scan_window: float = 300.0, scan_buckets: int = 5, scan_hosts: int = 100,
+                 scan_ports: int = 100, max_sources: int = 20000, beacon_history: int = 16,
+                 beacon_min_events: int = 8, beacon_min_interval: float = 10.0,
+                 beacon_max_jitter: float = 0.1, max_pairs: int = 100000, cooldown: float = 3600.0):
+        self.scan_window = scan_window
+        self.scan_buckets = scan_buckets
+        self.bucket_seconds = scan_window / scan_buckets
+        self.scan_hosts = scan_hosts
+        self.scan_ports = scan_ports
+        self.max_sources = max_sources
+        self.beacon_history = beacon_history
+        self.beacon_min_events = max(3, min(beacon_min_events, beacon_history))
+        # Interval statistics are recomputed every quarter ring, not on every connection
+        self.beacon_check_every = max(1, beacon_history // 4)
+        self.beacon_min_interval = beacon_min_interval
+        self.beacon_max_jitter = beacon_max_jitter
+        self.max_pairs = max_pairs
+        self.cooldown = cooldown
+        self.sources: "OrderedDict[str, _Source]" = OrderedDict()
+        self.pairs: "OrderedDict[Tuple, _Pair]" = OrderedDict()
+        self.probation: "OrderedDict[Tuple, float]" = OrderedDict()
+        self._ready: List[Dict[str, Any]] = []
+        self.events_in = 0
+        self.batches = 0
+        self.detections = {"scan": 0, "beacon": 0}
+        REGISTRY.callback("detection_tracked", "Sources and pairs held by scan and beacon detection",
+                          lambda: {("sources",): len(self.sources), ("pairs",): len(self.pairs)}, ["kind"])
+
+    def add(self, events: List[Dict[str, Any]]):
+        """Update the detection state with conn events; detections are collected by `ready`"""
+        now = time.time()
+        self.batches += 1
+        batch = self.batches
+        sources = self.sources
+        bucket_seconds, ring = self.bucket_seconds, self.scan_buckets
+        add_pair = self._add_pair
+        changed = set()
+        for event in events:
+            source = event.get("id_orig_h")
+            if not source or type(source) is not str:
+                continue
+            ts = event.get("ts")
+            if type(ts) is not float:
+                ts = event_time(ts, now)
+            host, port, uid = event.get("id_resp_h"), event.get("id_resp_p"), event.get("uid")
+            if host and type(host) is str:
+                add_pair((source, host, port), ts, uid, event.get("proto"))
+
+            state = sources.get(source)
+            if state is None:
+                if len(sources) >= self.max_sources:
+                    sources.popitem(last=False)
+                state = sources[source] = _Source(ring)
+            if state.batch != batch:
+                # Recency only needs refreshing once per batch
+                sources.move_to_end(source)
+                state.batch = batch
+            bucket = int(ts // bucket_seconds)
+            slot = bucket % ring
+            if state.buckets[slot] != bucket:
+                if state.buckets[slot] > bucket:
+                    # Older than the window this slot now holds
+                    continue
+                state.buckets[slot] = bucket
+                state.hosts[slot] = bytearray(_REGISTERS)
+                state.ports[slot] = bytearray(_REGISTERS)
+                state.conns[slot] = 0
+            state.conns[slot] += 1
+            if ts >= state.last_ts:
+                state.last_ts = ts
+                state.uid = uid or state.uid
+            grew = host is not None and _add(state.hosts[slot], host)
+            if port is not None and _add(state.ports[slot], port):
+                grew = True
+            if grew:
+                changed.add(source)
+        for source in changed:
+            self._check_scan(source)
+        self.events_in += len(events)
+
+    def _check_scan(self, source: str):
+        state = self.sources[source]
+        if state.last_ts < state.alerted_until:
+            return
+        latest = int(state.last_ts // self.bucket_seconds)
+        slots = [slot for slot, bucket in enumerate(state.buckets) if latest - self.scan_buckets < bucket <= latest]
+        # Most sources are ruled out by their connection count or the per-bucket bound,
+        # without merging sketches
+        if sum(state.conns[slot] for slot in slots) < min(self.scan_hosts, self.scan_ports):
+            return
+        if (sum(_bucket_estimate(state.hosts[slot]) for slot in slots) < self.scan_hosts
+                and sum(_bucket_estimate(state.ports[slot]) for slot in slots) < self.scan_ports):
+            return
+        distinct_hosts = _window_count([state.hosts[slot] for slot in slots])
+        distinct_ports = _window_count([state.ports[slot] for slot in slots])
+        conns = sum(state.conns[slot] for slot in slots)
+        ratio = max(distinct_hosts / self.scan_hosts, distinct_ports / self.scan_ports)
+        if ratio < 1:
+            return
+        state.alerted_until = state.last_ts + self.cooldown
+        self._emit({
+            "ts": state.last_ts,
+            "uid": state.uid,
+            "detection": "scan",
+            "severity": _severity(ratio),
+            "description": f"{source} connected to ~{distinct_hosts} hosts on ~{distinct_ports} ports "
+                           f"in {self.scan_window:g}s",
+            "id_orig_h": source,
+            "distinct_hosts": distinct_hosts,
+            "distinct_ports": distinct_ports,
+            "window": self.scan_window,
+            "conn_count": conns,
+        })
+
+    def _add_pair(self, key: Tuple, ts: float, uid: Optional[str], proto: Any):
+        pairs = self.pairs
+        pair = pairs.get(key)
+        if pair is None:
+            probation = self.probation
+            first_ts = probation.pop(key, None)
+            if first_ts is None:
+                if len(probation) >= self.max_pairs:
+                    probation.popitem(last=False)
+                probation[key] = ts
+                return
+            if len(pairs) >= self.max_pairs:
+                pairs.popitem(last=False)
+            pair = pairs[key] = _Pair(self.beacon_history, first_ts)
+        else:
+            pairs.move_to_end(key)
+        pair.times[pair.count % self.beacon_history] = ts
+        pair.count += 1
+        pair.uid = uid or pair.uid
+        if pair.count >= self.beacon_min_events and pair.count % self.beacon_check_every == 0:
+            self._check_beacon(key, pair, proto)
+
+    def _check_beacon(self, key: Tuple, pair: _Pair, proto: Any):
+        # Zeek writes conn records as connections end, so start times arrive out of order
+        times = sorted(pair.times[:min(pair.count, self.beacon_history)])
+        last_ts = times[-1]
+        if last_ts < pair.alerted_until:
+            return
+        intervals = [later - earlier for earlier, later in zip(times, times[1:])]
+        mean = sum(intervals) / len(intervals)
+        if mean < self.beacon_min_interval:
+            return
+        stddev = math.sqrt(sum((interval - mean) ** 2 for interval in intervals) / len(intervals))
+        jitter = stddev / mean
+        if jitter > self.beacon_max_jitter:
+            return
+        pair.alerted_until = last_ts + self.cooldown
+        source, host, port = key
+        # Timing tighter than the threshold is stronger evidence; a quarter of it is high
+        ratio = self.beacon_max_jitter / jitter if jitter else math.inf
+        self._emit({
+            "ts": last_ts,
+            "uid": pair.uid,
+            "detection": "beacon",
+            "severity": _severity(ratio),
+            "description": f"{source} connected to {host}:{port} every {mean:.1f}s "
+                           f"(jitter {jitter:.1%}) over {pair.count} connections",
+            "id_orig_h": source,
+            "id_resp_h": host,
+            "id_resp_p": port,
+            "proto": proto,
+            "conn_count": pair.count,
+            "interval": round(mean, 3),
+            "interval_stddev": round(stddev, 3),
+            "jitter": round(jitter, 4),
+            "first_ts": pair.first_ts,
+            "last_ts": last_ts,
+        })
+
+    def _emit(self, detection: Dict[str, Any]):
+        self._ready.append(detection)
+        self.detections[detection["detection"]] += 1
+        DETECTIONS.inc(detection["detection"])
+
+    def ready(self) -> List[Dict[str, Any]]:
+        """Detections made since the last call"""
+        ready, self._ready = self._ready, []
+        return ready
+
+    def requeue(self, detections: List[Dict[str, Any]]):
+        """Return detections that could not be delivered, to be handed out again by `ready`"""
+        self._ready.extend(detections)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sources": len(self.sources),
+            "pairs": len(self.pairs),
+            "probation": len(self.probation),
+            "events_in": self.events_in,
+            "detections": dict(self.detections),
+        }
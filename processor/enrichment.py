@@ -0,0 +1,26 @@
+"""
+Event Enrichment
+Per-event enrichment shared by the API and the multi-process pipeline.
+"""
+
+import time
+from typing import Any, Dict, List, Tuple
+
+from geoip import GeoIPEngine
+
+PROCESSOR_VERSION = "1.0.0"
+
+# Address fields looked up in GeoIP and the key each result is stored under
+GEOIP_FIELDS = [("id_orig_h", "orig_geoip"), ("id_resp_h", "resp_geoip")]
+
+
+def enrich_event(event: Dict[str, Any], geoip: GeoIPEngine,
+                 ip_fields: List[Tuple[str, str]] = GEOIP_FIELDS) -> Dict[str, Any]:
+    """Enrich a parsed Zeek event dict in place with GeoIP data and processing metadata"""
+    for field, key in ip_fields:
+        ip = event.get(field)
+        if ip:
+            event[key] = geoip.lookup(ip)
+    event["processed_at"] = time.time()
+    event["processor_version"] = PROCESSOR_VERSION
+    return event
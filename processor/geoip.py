@@ -0,0 +1,175 @@
+"""
+GeoIP Engine
+MaxMind database lookups behind a bounded LRU cache, with a prebuilt table of special-purpose networks.
+"""
+
+import ipaddress
+import json
+import logging
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import geoip2.database
+import geoip2.errors
+from maxminddb import MODE_MMAP, InvalidDatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Networks that never resolve in a GeoIP database, with the label reported as "isp"
+SPECIAL_NETWORKS = [
+    ("10.0.0.0/8", "Private Network"),
+    ("172.16.0.0/12", "Private Network"),
+    ("192.168.0.0/16", "Private Network"),
+    ("100.64.0.0/10", "Carrier-Grade NAT"),
+    ("127.0.0.0/8", "Loopback"),
+    ("169.254.0.0/16", "Link-Local"),
+    ("0.0.0.0/8", "Unspecified"),
+    ("224.0.0.0/4", "Multicast"),
+    ("255.255.255.255/32", "Broadcast"),
+    ("fc00::/7", "Private Network"),
+    ("fe80::/10", "Link-Local"),
+    ("::1/128", "Loopback"),
+    ("::/128", "Unspecified"),
+    ("ff00::/8", "Multicast"),
+]
+
+
+class NetworkTable:
+    """Sorted, non-overlapping integer ranges searched with bisect, one table per IP version"""
+
+    def __init__(self, networks: List[Tuple[str, str]]):
+        self._starts: Dict[int, List[int]] = {4: [], 6: []}
+        self._ends: Dict[int, List[int]] = {4: [], 6: []}
+        self._labels: Dict[int, List[str]] = {4: [], 6: []}
+        parsed = sorted(
+            ((ipaddress.ip_network(cidr), label) for cidr, label in networks),
+            key=lambda item: (item[0].version, int(item[0].network_address)),
+        )
+        for network, label in parsed:
+            self._starts[network.version].append(int(network.network_address))
+            self._ends[network.version].append(int(network.broadcast_address))
+            self._labels[network.version].append(label)
+
+    def lookup(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Optional[str]:
+        """Return the label of the network containing address, if any"""
+        value = int(address)
+        starts = self._starts[address.version]
+        i = bisect_right(starts, value) - 1
+        if i >= 0 and value <= self._ends[address.version][i]:
+            return self._labels[address.version][i]
+        return None
+
+
+class GeoIPEngine:
+    """
+    Resolves IPs against MaxMind-format databases opened once in memory-mapped mode.
+
+    Results are cached per IP in a bounded LRU, so repeated addresses cost a dict lookup.
+    Returned dicts are shared between callers and must not be modified.
+    """
+
+    def __init__(self, city_db_path: Optional[str] = None, asn_db_path: Optional[str] = None,
+                 cache_size: int = 65536):
+        self.city_db_path = city_db_path
+        self.asn_db_path = asn_db_path
+        self.cache_size = cache_size
+        self.special_networks = NetworkTable(SPECIAL_NETWORKS)
+        self._city_reader = self._open(city_db_path)
+        self._asn_reader = self._open(asn_db_path)
+        self._city_method = None
+        if self._city_reader is not None:
+            database_type = self._city_reader.metadata().database_type
+            self._city_method = self._city_reader.city if "City" in database_type else self._city_reader.country
+        self._cached_lookup = lru_cache(maxsize=cache_size)(self._lookup)
+        self._cached_json = lru_cache(maxsize=cache_size)(self._lookup_json)
+
+    def _open(self, path: Optional[str]) -> Optional[geoip2.database.Reader]:
+        if not path:
+            return None
+        if not os.path.exists(path):
+            logger.warning(f"GeoIP database not found: {path}")
+            return None
+        logger.info(f"Opening GeoIP database {path}")
+        try:
+            return geoip2.database.Reader(path, mode=MODE_MMAP)
+        except (InvalidDatabaseError, OSError, ValueError) as e:
+            # Enrichment carries on without this database rather than failing startup
+            logger.error(f"GeoIP database {path} is unreadable, ignoring it: {e}")
+            return None
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        """Get GeoIP data for an IP address"""
+        return self._cached_lookup(ip)
+
+    def lookup_json(self, ip: str) -> str:
+        """GeoIP data for an IP address, serialized as a JSON object"""
+        return self._cached_json(ip)
+
+    def _lookup_json(self, ip: str) -> str:
+        return json.dumps(self.lookup(ip), separators=(",", ":"))
+
+    def _lookup(self, ip: str) -> Dict[str, Any]:
+        result = {
+            "country": None,
+            "city": None,
+            "latitude": None,
+            "longitude": None,
+            "isp": None,
+        }
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return result
+
+        label = self.special_networks.lookup(address)
+        if label is not None:
+            result.update(country="Private", city="Private", isp=label)
+            return result
+
+        if self._city_method is not None:
+            try:
+                record = self._city_method(ip)
+                result["country"] = record.country.iso_code
+                city = getattr(record, "city", None)
+                if city is not None:
+                    result["city"] = city.name
+                    result["latitude"] = record.location.latitude
+                    result["longitude"] = record.location.longitude
+            except (geoip2.errors.AddressNotFoundError, ValueError):
+                pass
+
+        if self._asn_reader is not None:
+            try:
+                result["isp"] = self._asn_reader.asn(ip).autonomous_system_organization
+            except (geoip2.errors.AddressNotFoundError, ValueError):
+                pass
+        return result
+
+    def cache_counters(self) -> Dict[str, Tuple[int, int]]:
+        """Hits and misses of the lookup cache and of the serialized-JSON cache"""
+        lookup = self._cached_lookup.cache_info()
+        serialized = self._cached_json.cache_info()
+        return {"lookup": (lookup.hits, lookup.misses), "json": (serialized.hits, serialized.misses)}
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters and database status"""
+        info = self._cached_lookup.cache_info()
+        total = info.hits + info.misses
+        return {
+            "database": self.city_db_path if self._city_reader is not None else None,
+            "asn_database": self.asn_db_path if self._asn_reader is not None else None,
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+            "cache_size": info.currsize,
+            "cache_max_size": info.maxsize,
+            "hit_rate": round(info.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        self._cached_lookup.cache_clear()
+        self._cached_json.cache_clear()
+        for reader in (self._city_reader, self._asn_reader):
+            if reader is not None:
+                reader.close()
@@ -0,0 +1,275 @@
+"""
+Splunk HEC Sender
+Batches enriched events into newline-concatenated HEC requests over a pooled async client.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from metrics import REGISTRY, SIZE_BUCKETS, log_sampled, stage_cpu
+
+logger = logging.getLogger(__name__)
+
+HEC_REQUEST_SECONDS = REGISTRY.histogram("hec_request_seconds", "HEC request latency", ["status"])
+HEC_BATCH_SIZE = REGISTRY.histogram("hec_batch_events", "Events per HEC request", buckets=SIZE_BUCKETS)
+HEC_BATCH_BYTES = REGISTRY.histogram(
+    "hec_batch_bytes", "HEC request body size",
+    buckets=(1024, 16384, 65536, 262144, 524288, 1048576, 4194304),
+)
+
+
+def encode_event(event: Dict[str, Any], index: str, source: str, sourcetype: str) -> bytes:
+    """Wrap an event in the HEC envelope and encode it"""
+    payload = {
+        "event": event,
+        "source": source,
+        "sourcetype": sourcetype,
+        "index": index,
+    }
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+class _Ack:
+    """
+    Tracks delivery of the payloads submitted by a single caller, which may be split over
+    several batches; resolves to the payloads whose batch failed, in submission order
+    """
+    __slots__ = ("payloads", "remaining", "failed", "future")
+
+    def __init__(self, payloads: List[bytes], future: asyncio.Future):
+        self.payloads = payloads
+        self.remaining = len(payloads)
+        self.failed: List[int] = []
+        self.future = future
+
+    def resolve(self, positions: List[int], ok: bool):
+        self.remaining -= len(positions)
+        if not ok:
+            self.failed.extend(positions)
+        if self.remaining <= 0 and not self.future.done():
+            self.future.set_result([self.payloads[i] for i in sorted(self.failed)])
+
+
+class HecSender:
+    """
+    Async output stage for Splunk HEC.
+
+    Events are encoded once on submit and buffered. The buffer is flushed as a single
+    /services/collector/event request when it reaches `max_batch_events` or
+    `max_batch_bytes`, or when `flush_interval` seconds have passed. At most
+    `max_in_flight` requests are outstanding at any time; further flushes wait for a slot.
+    The sender starts on first use if `start` was not called; `stop` flushes and closes it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        index: str,
+        source: str = "zeek_processor",
+        sourcetype: str = "zeek_conn_enriched",
+        verify_ssl: bool = False,
+        max_batch_events: int = 500,
+        max_batch_bytes: int = 1024 * 1024,
+        flush_interval: float = 1.0,
+        max_in_flight: int = 4,
+        timeout: float = 10.0,
+        fallback: Optional[Callable[[bytes], Awaitable[bool]]] = None,
+    ):
+        self.url = url
+        self.token = token
+        self.index = index
+        self.source = source
+        self.sourcetype = sourcetype
+        self.verify_ssl = verify_ssl
+        self.max_batch_events = max_batch_events
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.fallback = fallback
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+
+        self._buffer: List[bytes] = []
+        self._buffer_acks: Dict[_Ack, List[int]] = {}
+        self._buffer_bytes = 0
+
+        self.started_at = 0.0
+        self.events_sent = 0
+        self.events_failed = 0
+        self.bytes_sent = 0
+        self.requests_sent = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self.last_latency = 0.0
+
+    async def start(self):
+        """Open the connection pool and start the periodic flusher"""
+        if self._client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=self.max_in_flight,
+            max_keepalive_connections=self.max_in_flight,
+        )
+        self._client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Splunk {self.token}",
+                "Content-Type": "application/json",
+            },
+            limits=limits,
+            timeout=self.timeout,
+            verify=self.verify_ssl,
+        )
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.started_at = time.time()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(
+            f"HEC sender started: batch={self.max_batch_events} events/{self.max_batch_bytes} bytes, "
+            f"interval={self.flush_interval}s, in_flight={self.max_in_flight}"
+        )
+
+    async def stop(self):
+        """Flush whatever is buffered, wait for outstanding requests and close the pool"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def encode(self, event: Dict[str, Any], sourcetype: Optional[str] = None) -> bytes:
+        """Wrap an event in the HEC envelope and encode it"""
+        return encode_event(event, self.index, self.source, sourcetype or self.sourcetype)
+
+    async def send(self, event: Dict[str, Any], sourcetype: Optional[str] = None) -> bool:
+        """Submit one event and wait until the batch carrying it is acknowledged"""
+        return await self.send_many([event], sourcetype)
+
+    async def send_many(self, events: Iterable[Dict[str, Any]], sourcetype: Optional[str] = None) -> bool:
+        """Submit events and wait until every batch carrying them is acknowledged"""
+        return await self.send_encoded([self.encode(event, sourcetype) for event in events])
+
+    async def send_encoded(self, payloads: List[bytes]) -> bool:
+        """Submit pre-encoded HEC payloads and wait for their acknowledgement"""
+        return not await self.send_encoded_failures(payloads)
+
+    async def send_encoded_failures(self, payloads: List[bytes]) -> List[bytes]:
+        """
+        Submit pre-encoded HEC payloads and wait for every batch carrying them. Returns the
+        payloads that were not accepted (empty when all were), so only those need retrying.
+        """
+        if not payloads:
+            return []
+        ack = _Ack(payloads, asyncio.get_running_loop().create_future())
+        for position, payload in enumerate(payloads):
+            await self._append(payload, ack, position)
+        return await ack.future
+
+    async def enqueue(self, event: Dict[str, Any], sourcetype: Optional[str] = None):
+        """Submit one event without waiting for delivery"""
+        await self._append(self.encode(event, sourcetype), None)
+
+    async def _append(self, payload: bytes, ack: Optional[_Ack], position: int = 0):
+        if self._client is None:
+            # Callers outside the app's lifecycle (CLI tools, tests) need not start the sender
+            await self.start()
+        if self._buffer and self._buffer_bytes + len(payload) + 1 > self.max_batch_bytes:
+            await self.flush()
+        self._buffer.append(payload)
+        self._buffer_bytes += len(payload) + 1
+        if ack is not None:
+            self._buffer_acks.setdefault(ack, []).append(position)
+        if len(self._buffer) >= self.max_batch_events:
+            await self.flush()
+
+    async def flush(self):
+        """Hand the current buffer to a request, waiting for an in-flight slot if needed"""
+        if not self._buffer:
+            return
+        batch, acks = self._buffer, self._buffer_acks
+        self._buffer, self._buffer_acks, self._buffer_bytes = [], {}, 0
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._post(batch, acks))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing HEC buffer: {e}")
+
+    async def _post(self, batch: List[bytes], acks: Dict[_Ack, List[int]]):
+        with stage_cpu("output"):
+            body = b"\n".join(batch)
+        HEC_BATCH_SIZE.observe(value=len(batch))
+        HEC_BATCH_BYTES.observe(value=len(body))
+        ok = False
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(self.url, content=body)
+            ok = response.status_code == 200
+            if not ok:
+                log_sampled(logger, logging.ERROR, "hec_status",
+                            f"Failed to send batch to Splunk HEC: {response.status_code} - {response.text}")
+        except Exception as e:
+            log_sampled(logger, logging.ERROR, "hec_error", f"Error sending batch to Splunk HEC: {str(e)}")
+        finally:
+            self.last_latency = time.perf_counter() - started
+            HEC_REQUEST_SECONDS.observe("ok" if ok else "failed", value=self.last_latency)
+            self.in_flight -= 1
+            self._slots.release()
+
+        if not ok and self.fallback is not None:
+            log_sampled(logger, logging.INFO, "hec_fallback", "Trying REST API as fallback...")
+            try:
+                ok = await self.fallback(body)
+            except Exception as e:
+                logger.error(f"Error in HEC fallback: {str(e)}")
+                ok = False
+
+        self.requests_sent += 1
+        if ok:
+            self.events_sent += len(batch)
+            self.bytes_sent += len(body)
+        else:
+            self.requests_failed += 1
+            self.events_failed += len(batch)
+
+        for ack, positions in acks.items():
+            ack.resolve(positions, ok)
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput and queue counters for health reporting"""
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "events_sent": self.events_sent,
+            "events_failed": self.events_failed,
+            "bytes_sent": self.bytes_sent,
+            "requests_sent": self.requests_sent,
+            "requests_failed": self.requests_failed,
+            "buffered_events": len(self._buffer),
+            "in_flight": self.in_flight,
+            "last_latency_ms": round(self.last_latency * 1000, 2),
+            "events_per_sec": round(self.events_sent / elapsed, 2) if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,288 @@
+"""
+Direct Ingest
+Runs tailing, parsing, enrichment and HEC output inside the processor's event loop,
+passing parsed records between stages over bounded queues instead of HTTP.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from watchdog.observers import Observer
+
+from checkpoint import Checkpoint, CheckpointStore
+from log_parser import LogSchema, read_zeek_header
+from log_watcher import LogEventHandler, TailedFile, is_live_log, resume_tailed
+from metrics import EVENTS_PARSED, log_sampled, stage_cpu
+from spool import SpoolFullError
+
+logger = logging.getLogger(__name__)
+
+# A batch that fails to encode this many times is encoded one event at a time instead
+MAX_ENCODE_ATTEMPTS = 3
+ENCODE_RETRY_DELAY = 1.0
+
+
+class _TailState:
+    """Read position and compiled schema for one tailed file"""
+    __slots__ = ("tailed", "schema", "read_offset")
+
+    def __init__(self, tailed: TailedFile):
+        self.tailed = tailed
+        self.schema: Optional[LogSchema] = None
+        self.read_offset = tailed.offset
+
+    def load_schema(self) -> Optional[LogSchema]:
+        if self.schema is None:
+            self.schema, data_offset = read_zeek_header(self.tailed.handle)
+            self.read_offset = max(self.read_offset, data_offset)
+        return self.schema
+
+
+class _Batch:
+    """Records read from one file, carried through the stages with the checkpoint they complete"""
+    __slots__ = ("key", "schema", "records", "lines", "checkpoint", "payloads")
+
+    def __init__(self, key: str, schema: LogSchema, records: List[Dict[str, Any]], lines: Optional[List[str]],
+                 checkpoint: Checkpoint):
+        self.key = key
+        self.schema = schema
+        self.records = records
+        self.lines = lines
+        self.checkpoint = checkpoint
+        self.payloads: List[bytes] = []
+
+
+class DirectIngest:
+    """
+    In-process ingest: tail -> parse -> (queue) -> enrich/encode -> (queue) -> deliver.
+
+    `encode` turns parsed records, with the schema they were read with and, for JSON logs,
+    the lines they were decoded from, into HEC payloads and `deliver` ships them with their log type (raising SpoolFullError when the output
+    cannot accept more). Both queues are bounded, so a
+    slow output stalls reading instead of growing memory. Checkpoints advance only after
+    a batch has been delivered. A batch that keeps failing to encode is encoded one event
+    at a time, and only the events that still fail are dropped.
+    """
+
+    def __init__(self, logs_dir: str,
+                 encode: Callable[[List[Dict[str, Any]], LogSchema, Optional[List[str]]], List[bytes]],
+                 deliver: Callable[[List[bytes], str], Awaitable[str]],
+                 checkpoints: Optional[CheckpointStore] = None, batch_size: int = 1000,
+                 queue_size: int = 8, sweep_interval: float = 5.0, coalesce_delay: float = 0.05):
+        self.logs_dir = Path(logs_dir)
+        self.encode = encode
+        self.deliver = deliver
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self.coalesce_delay = coalesce_delay
+        self.parsed: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.encoded: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.files: Dict[str, _TailState] = {}
+        self.events_read = 0
+        self.events_delivered = 0
+        self.encode_failures = 0
+        self.events_dropped = 0
+        self._dirty: Set[str] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._observer: Optional[Observer] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._observer = Observer()
+        self._observer.schedule(
+            LogEventHandler(lambda path: loop.call_soon_threadsafe(self._mark_dirty, path)),
+            str(self.logs_dir), recursive=False,
+        )
+        self._observer.start()
+        self._tasks = [
+            asyncio.create_task(self._tail_loop()),
+            asyncio.create_task(self._encode_loop()),
+            asyncio.create_task(self._output_loop()),
+        ]
+        logger.info(f"Direct ingest started for {self.logs_dir}")
+
+    async def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.checkpoints is not None:
+            self.checkpoints.flush(force=True)
+        for state in self.files.values():
+            state.tailed.close()
+        self.files.clear()
+
+    def _mark_dirty(self, path: str):
+        if is_live_log(Path(path)):
+            self._dirty.add(path)
+            self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self.files),
+            "events_read": self.events_read,
+            "events_delivered": self.events_delivered,
+            "encode_failures": self.encode_failures,
+            "events_dropped": self.events_dropped,
+            "parsed_queue": self.parsed.qsize(),
+            "encoded_queue": self.encoded.qsize(),
+        }
+
+    def lag(self) -> Dict[str, int]:
+        """Bytes between each file's read offset and its current EOF"""
+        lag = {}
+        for key, state in list(self.files.items()):
+            try:
+                lag[key] = max(state.tailed.size() - state.read_offset, 0)
+            except (OSError, ValueError):
+                continue
+        return lag
+
+    async def _tail_loop(self):
+        pending = {str(path) for path in self.logs_dir.glob("*.log") if is_live_log(path)}
+        while True:
+            if not pending:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.sweep_interval)
+                    await asyncio.sleep(self.coalesce_delay)
+                except asyncio.TimeoutError:
+                    pending = {str(path) for path in self.logs_dir.glob("*.log") if is_live_log(path)}
+                    pending |= set(self.files)
+                self._wake.clear()
+            pending |= self._dirty
+            self._dirty = set()
+            for key in sorted(pending):
+                try:
+                    await self._read_file(Path(key))
+                except Exception as e:
+                    logger.error(f"Error reading {key}: {e}")
+            pending = set()
+
+    def _open(self, file_path: Path) -> Optional[_TailState]:
+        key = str(file_path)
+        checkpoint = self.checkpoints.get(key) if self.checkpoints is not None else None
+        tailed = resume_tailed(file_path, checkpoint)
+        if tailed is None:
+            return None
+        if tailed.is_truncated():
+            tailed.offset = 0
+        state = self.files[key] = _TailState(tailed)
+        return state
+
+    async def _read_file(self, file_path: Path):
+        """Queue everything between the read offset and EOF, following rotation"""
+        key = str(file_path)
+        state = self.files.get(key) or self._open(file_path)
+        if state is None:
+            return
+        if state.tailed.size() < state.read_offset:
+            logger.info(f"{file_path.name} was truncated, restarting from the beginning")
+            state.schema, state.read_offset = None, 0
+        await self._drain(key, state)
+
+        if state.tailed.is_replaced():
+            logger.info(f"{file_path.name} was rotated, switching to the new file")
+            await self._drain(key, state)
+            state.tailed.close()
+            del self.files[key]
+            if file_path.exists():
+                try:
+                    self.files[key] = state = _TailState(TailedFile(file_path))
+                except FileNotFoundError:
+                    return
+                await self._drain(key, state)
+
+    async def _drain(self, key: str, state: _TailState):
+        schema = state.load_schema()
+        if schema is None:
+            return
+        while True:
+            lines, pos = state.tailed.read_lines(self.batch_size, state.read_offset)
+            if not lines:
+                return
+            with stage_cpu("parse"):
+                records, record_lines = schema.parse_lines(lines)
+            state.read_offset = pos
+            self.events_read += len(records)
+            EVENTS_PARSED.inc(schema.path, amount=len(records))
+            await self.parsed.put(_Batch(key, schema, records, record_lines, state.tailed.checkpoint(pos)))
+
+    async def _encode_loop(self):
+        while True:
+            batch = await self.parsed.get()
+            if batch.records:
+                batch.payloads = await self._encode_batch(batch)
+            await self.encoded.put(batch)
+
+    async def _encode_batch(self, batch: _Batch) -> List[bytes]:
+        """
+        Payloads for a batch. Passing a batch on commits its checkpoint, so a failing one is
+        retried (holding back ingest like a full output does) before falling back to single
+        events, which drops only the events that cannot be encoded.
+        """
+        delay = ENCODE_RETRY_DELAY
+        for attempt in range(1, MAX_ENCODE_ATTEMPTS + 1):
+            try:
+                return self.encode(batch.records, batch.schema, batch.lines)
+            except Exception as e:
+                self.encode_failures += 1
+                log_sampled(logger, logging.ERROR, "ingest_encode",
+                            f"Error enriching batch from {batch.key} (attempt {attempt} of {MAX_ENCODE_ATTEMPTS}): {e}")
+            if attempt < MAX_ENCODE_ATTEMPTS:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        payloads = []
+        for position, record in enumerate(batch.records):
+            lines = None if batch.lines is None else [batch.lines[position]]
+            try:
+                payloads.extend(self.encode([record], batch.schema, lines))
+            except Exception as e:
+                self.events_dropped += 1
+                log_sampled(logger, logging.ERROR, "ingest_drop",
+                            f"Dropping event {record.get('uid')} from {batch.key}, it cannot be enriched: {e}")
+        return payloads
+
+    async def _output_loop(self):
+        delay = 1.0
+        while True:
+            # Deliver every batch that is ready together, so their events share HEC requests
+            # instead of each batch waiting out the sender's flush interval on its own
+            batches = [await self.encoded.get()]
+            while not self.encoded.empty():
+                batches.append(self.encoded.get_nowait())
+            pending: Dict[str, List[bytes]] = {}
+            for batch in batches:
+                if batch.payloads:
+                    pending.setdefault(batch.schema.path, []).extend(batch.payloads)
+            while pending:
+                results = await asyncio.gather(
+                    *(self.deliver(payloads, log_type) for log_type, payloads in pending.items()),
+                    return_exceptions=True,
+                )
+                failed = {}
+                for (log_type, payloads), result in zip(pending.items(), results):
+                    if isinstance(result, BaseException):
+                        failed[log_type] = payloads
+                        if not isinstance(result, SpoolFullError):
+                            logger.error(f"Error delivering {log_type} events: {result}")
+                    else:
+                        self.events_delivered += len(payloads)
+                pending = failed
+                if pending:
+                    logger.warning(f"Output is full, pausing ingest for {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+                else:
+                    delay = 1.0
+            if self.checkpoints is not None:
+                for batch in batches:
+                    self.checkpoints.update(batch.key, batch.checkpoint)
+                self.checkpoints.flush()
@@ -0,0 +1,396 @@
+"""
+Threat Intelligence Matching
+Loads local indicator feeds (IPs, CIDRs, domains, domain wildcards and hashes such as JA3),
+compiles them into compact lookup tables and tags matching events with the indicator's
+metadata.
+
+Feeds are the files in INTEL_DIR. Either Zeek Intel framework files (a `#fields` header with
+indicator, indicator_type, meta.source, meta.desc, ...) or plain lists with one
+`indicator[,severity[,description]]` per line; `*.example.com` matches every subdomain.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import time
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Event fields checked for each kind of indicator
+DOMAIN_FIELDS = ("query", "host", "server_name")
+HASH_FIELDS = ("ja3", "ja3s", "md5", "sha1", "sha256")
+
+_HASH = re.compile(r"[0-9a-fA-F]{32}|[0-9a-fA-F]{40}|[0-9a-fA-F]{64}")
+_DOMAIN = re.compile(r"(\*\.)?[A-Za-z0-9_-]+(\.[A-Za-z0-9_-]+)*\.?")
+ZEEK_TYPES = {
+    "Intel::ADDR": "ip",
+    "Intel::SUBNET": "cidr",
+    "Intel::DOMAIN": "domain",
+    "Intel::FILE_HASH": "hash",
+    "Intel::CERT_HASH": "hash",
+    "Intel::PUBKEY_HASH": "hash",
+}
+
+INTEL_MATCHES = REGISTRY.counter("intel_matches_total", "Event fields that matched an indicator", ["feed", "type"])
+
+
+def ip_to_int(address: str) -> Tuple[int, int]:
+    """(IP version, integer value) of an address; raises OSError or ValueError if it isn't one"""
+    if ":" in address:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, address.split("%", 1)[0]), "big")
+    return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+
+
+def int_to_ip(version: int, value: int) -> str:
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+
+
+def normalize_domain(value: str) -> str:
+    """Lowercase, without a trailing dot or a :port suffix (as in HTTP Host headers)"""
+    value = value.lower()
+    if ":" in value and not value.startswith("["):
+        value = value.rsplit(":", 1)[0]
+    return value.rstrip(".")
+
+
+class _Ranges:
+    """
+    IP and CIDR indicators of one IP version as disjoint ranges in sorted arrays. Nested
+    CIDRs are split so each address maps to its most specific indicator, and a lookup is
+    a single bisect.
+    """
+
+    def __init__(self, version: int, networks: List[Tuple[int, int, int]]):
+        self.version = version
+        bits = 32 if version == 4 else 128
+        # 'Q' holds IPv4 compactly; IPv6 values need Python ints
+        starts: Any = array("Q") if version == 4 else []
+        ends: Any = array("Q") if version == 4 else []
+        self.entries = array("I")
+        self.networks: Any = array("Q") if version == 4 else []
+        self.lengths = array("B")
+        self.metas = array("I")
+        intervals = []
+        for i, (network, length, meta) in enumerate(networks):
+            self.networks.append(network)
+            self.lengths.append(length)
+            self.metas.append(meta)
+            size = 1 << (bits - length)
+            intervals.append((network, network + size - 1, i))
+        # CIDRs are either nested or disjoint, so a stack sweep yields the innermost cover
+        intervals.sort(key=lambda item: (item[0], -item[1]))
+        stack: List[Tuple[int, int, int]] = []
+        cursor = 0
+
+        def emit(start: int, end: int, entry: int):
+            if start <= end:
+                starts.append(start)
+                ends.append(end)
+                self.entries.append(entry)
+
+        for start, end, entry in intervals:
+            while stack and stack[-1][1] < start:
+                _, top_end, top_entry = stack.pop()
+                emit(cursor, top_end, top_entry)
+                cursor = max(cursor, top_end + 1)
+            if stack:
+                emit(cursor, start - 1, stack[-1][2])
+            cursor = start
+            stack.append((start, end, entry))
+        while stack:
+            _, top_end, top_entry = stack.pop()
+            emit(cursor, top_end, top_entry)
+            cursor = max(cursor, top_end + 1)
+        self.starts = starts
+        self.ends = ends
+
+    def lookup(self, value: int) -> Optional[int]:
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.entries[i]
+        return None
+
+    def indicator(self, entry: int) -> Tuple[str, str]:
+        length = self.lengths[entry]
+        address = int_to_ip(self.version, self.networks[entry])
+        if length == (32 if self.version == 4 else 128):
+            return address, "ip"
+        return f"{address}/{length}", "cidr"
+
+
+class IntelIndex:
+    """An immutable compiled set of indicators; build a new one to change it"""
+
+    def __init__(self):
+        self.metas: List[Tuple[str, str, str]] = []
+        self.ranges: Dict[int, _Ranges] = {}
+        self.domains: Dict[str, int] = {}
+        self.wildcards: Dict[str, Any] = {}
+        self.hashes: Dict[str, int] = {}
+        self.counts = {"ip": 0, "cidr": 0, "domain": 0, "wildcard": 0, "hash": 0, "invalid": 0}
+
+    @classmethod
+    def build(cls, feeds: Dict[str, Iterator[Tuple[str, Optional[str], str, str]]]) -> "IntelIndex":
+        """Compile feeds of (indicator, type or None to detect it, severity, description)"""
+        index = cls()
+        meta_ids: Dict[Tuple[str, str, str], int] = {}
+        networks: Dict[int, Dict[Tuple[int, int], int]] = {4: {}, 6: {}}
+        for feed, indicators in feeds.items():
+            for value, kind, severity, description in indicators:
+                meta = (feed, severity, description)
+                meta_id = meta_ids.get(meta)
+                if meta_id is None:
+                    meta_id = meta_ids[meta] = len(index.metas)
+                    index.metas.append(meta)
+                kind = index._add(value.strip(), kind, meta_id, networks)
+                index.counts[kind] += 1
+        index.ranges = {
+            version: _Ranges(version, [(network, length, meta) for (network, length), meta in table.items()])
+            for version, table in networks.items() if table
+        }
+        return index
+
+    def _add(self, value: str, kind: Optional[str], meta_id: int,
+             networks: Dict[int, Dict[Tuple[int, int], int]]) -> str:
+        if kind in (None, "ip", "cidr") and (":" in value or value[:1].isdigit()):
+            address, _, length = value.partition("/")
+            try:
+                version, number = ip_to_int(address)
+                bits = 32 if version == 4 else 128
+                prefix = int(length) if length else bits
+                if not 0 <= prefix <= bits:
+                    return "invalid"
+            except (OSError, ValueError):
+                # A malformed address such as 300.1.1.1 would otherwise pass as a domain
+                if kind is not None or value.replace(".", "").replace("/", "").isdigit():
+                    return "invalid"
+            else:
+                number &= ~((1 << (bits - prefix)) - 1)
+                networks[version][(number, prefix)] = meta_id
+                return "ip" if prefix == bits else "cidr"
+        if kind in (None, "hash") and _HASH.fullmatch(value):
+            self.hashes[value.lower()] = meta_id
+            return "hash"
+        if kind in (None, "domain") and _DOMAIN.fullmatch(value):
+            domain = normalize_domain(value)
+            if domain.startswith("*."):
+                node = self.wildcards
+                for label in reversed(domain[2:].split(".")):
+                    node = node.setdefault(label, {})
+                node[""] = meta_id
+                return "wildcard"
+            self.domains[domain] = meta_id
+            return "domain"
+        return "invalid"
+
+    def match_ip(self, address: str) -> Optional[Tuple[str, str, int]]:
+        try:
+            version, value = ip_to_int(address)
+        except (OSError, ValueError):
+            return None
+        ranges = self.ranges.get(version)
+        entry = ranges.lookup(value) if ranges is not None else None
+        if entry is None:
+            return None
+        indicator, kind = ranges.indicator(entry)
+        return indicator, kind, ranges.metas[entry]
+
+    def match_domain(self, value: str) -> Optional[Tuple[str, str, int]]:
+        domain = normalize_domain(value)
+        meta_id = self.domains.get(domain)
+        if meta_id is not None:
+            return domain, "domain", meta_id
+        node = self.wildcards
+        found = None
+        labels = domain.split(".")
+        for depth, label in enumerate(reversed(labels)):
+            node = node.get(label)
+            if node is None:
+                break
+            # Deepest wildcard wins; `*.example.com` doesn't match example.com itself
+            if "" in node and depth < len(labels) - 1:
+                found = (depth, node[""])
+        if found is None:
+            return None
+        depth, meta_id = found
+        return "*." + ".".join(labels[-depth - 1:]), "domain", meta_id
+
+    def match_hash(self, value: str) -> Optional[Tuple[str, str, int]]:
+        meta_id = self.hashes.get(value.lower())
+        return (value.lower(), "hash", meta_id) if meta_id is not None else None
+
+    def tag(self, field: str, match: Tuple[str, str, int]) -> Dict[str, Any]:
+        indicator, kind, meta_id = match
+        feed, severity, description = self.metas[meta_id]
+        INTEL_MATCHES.inc(feed, kind)
+        tag = {"indicator": indicator, "type": kind, "field": field, "feed": feed}
+        if severity:
+            tag["severity"] = severity
+        if description:
+            tag["description"] = description
+        return tag
+
+    def checks(self, ip_fields: List[str]) -> List[Tuple[str, Any]]:
+        """(field, matcher) pairs for an event type with these address fields"""
+        checks: List[Tuple[str, Any]] = []
+        if self.ranges:
+            checks.extend((field, self.match_ip) for field in ip_fields)
+        if self.domains or self.wildcards:
+            checks.extend((field, self.match_domain) for field in DOMAIN_FIELDS)
+        if self.hashes:
+            checks.extend((field, self.match_hash) for field in HASH_FIELDS)
+        return checks
+
+    def match_event(self, event: Dict[str, Any], ip_fields: List[str]) -> List[Dict[str, Any]]:
+        tags = []
+        for field, matcher in self.checks(ip_fields):
+            value = event.get(field)
+            if value and isinstance(value, str):
+                match = matcher(value)
+                if match is not None:
+                    tags.append(self.tag(field, match))
+        return tags
+
+    def match_columns(self, columns: Dict[str, list], size: int, ip_fields: List[str]) -> Optional[List[str]]:
+        """
+        Per-row `,"intel":[...]` JSON fragments for a batch given as columns, or None when
+        nothing matched. Each distinct value is looked up once per batch.
+        """
+        hits: Dict[int, List[Dict[str, Any]]] = {}
+        for field, matcher in self.checks(ip_fields):
+            values = columns.get(field)
+            if values is None:
+                continue
+            found: Dict[Any, Optional[Tuple[str, str, int]]] = {}
+            for row, value in enumerate(values):
+                if not value or type(value) is not str:
+                    continue
+                match = found.get(value, False)
+                if match is False:
+                    match = found[value] = matcher(value)
+                if match is not None:
+                    hits.setdefault(row, []).append(self.tag(field, match))
+        if not hits:
+            return None
+        fragments = [""] * size
+        for row, tags in hits.items():
+            fragments[row] = ',"intel":' + json.dumps(tags, separators=(",", ":"))
+        return fragments
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+
+def read_feed(path: str) -> Iterator[Tuple[str, Optional[str], str, str]]:
+    """Indicators in a feed file, as (indicator, type or None, severity, description)"""
+    fields: Optional[List[str]] = None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if line.startswith("#fields"):
+                fields = line.split("\t")[1:]
+                continue
+            if line[0] == "#":
+                continue
+            if fields is not None:
+                row = dict(zip(fields, line.split("\t")))
+                value = row.get("indicator", "")
+                kind = ZEEK_TYPES.get(row.get("indicator_type", ""))
+                if kind is None and row.get("indicator_type", "").startswith("Intel::"):
+                    kind = "hash" if _HASH.fullmatch(value) else None
+                description = row.get("meta.desc", "")
+                severity = row.get("meta.severity", "")
+                yield value, kind, "" if severity == "-" else severity, "" if description == "-" else description
+            else:
+                parts = [part.strip() for part in line.split(",", 2)]
+                parts += [""] * (3 - len(parts))
+                yield parts[0], None, parts[1], parts[2]
+
+
+def feed_files(directory: str) -> Dict[str, str]:
+    """Feed name (file name without extension) -> path, for the visible files in a directory"""
+    if not directory or not os.path.isdir(directory):
+        return {}
+    return {
+        os.path.splitext(name)[0]: os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if not name.startswith(".") and os.path.isfile(os.path.join(directory, name))
+    }
+
+
+def load_index(directory: str) -> IntelIndex:
+    return IntelIndex.build({feed: read_feed(path) for feed, path in feed_files(directory).items()})
+
+
+class IntelEngine:
+    """
+    The current indicator index for the feeds in `directory`. `watch` rebuilds it in a
+    worker thread when a feed file changes and swaps the reference in one assignment, so
+    events are matched against either the old or the new index, never a mix.
+    """
+
+    def __init__(self, directory: str, reload_interval: float = 60.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.index = IntelIndex()
+        self.loaded_at = 0.0
+        self.error: Optional[str] = None
+        self._signature: Optional[tuple] = None
+        REGISTRY.callback(
+            "intel_indicators", "Indicators loaded, by type",
+            lambda: {(kind,): count for kind, count in self.index.counts.items()}, ["type"],
+        )
+
+    def _feeds_signature(self) -> tuple:
+        signature = []
+        for feed, path in feed_files(self.directory).items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature.append((feed, st.st_mtime, st.st_size))
+        return tuple(signature)
+
+    async def reload(self) -> bool:
+        """Rebuild the index if any feed changed; True if a new index was swapped in"""
+        signature = await asyncio.to_thread(self._feeds_signature)
+        if signature == self._signature:
+            return False
+        try:
+            index = await asyncio.to_thread(load_index, self.directory)
+        except OSError as e:
+            self.error = str(e)
+            logger.error(f"Keeping previous intel indicators, failed to load {self.directory}: {e}")
+            return False
+        self.index = index
+        self._signature = signature
+        self.error = None
+        self.loaded_at = time.time()
+        if signature:
+            logger.info(f"Loaded intel indicators from {len(signature)} feeds: {index.counts}")
+        return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "indicators": self.index.stats(),
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
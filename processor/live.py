@@ -0,0 +1,147 @@
+"""
+Live Event Stream
+Fans enriched events and aggregate updates out to dashboard subscribers as Server-Sent
+Events, with per-subscriber filters and bounded buffers so slow clients never hold up
+processing.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from log_types import LogType
+from metrics import REGISTRY
+
+PORT_FIELDS = ("id_orig_p", "id_resp_p", "p")
+
+LIVE_DROPPED = REGISTRY.counter("live_events_dropped_total", "Live events dropped for slow subscribers")
+
+
+class Subscriber:
+    """
+    One live client. Matching events are buffered as their HEC payloads; when the buffer is
+    full the oldest are dropped and counted, and the next frame reports how many were lost.
+    """
+
+    def __init__(self, log_types: Optional[Set[str]] = None, ips: Optional[Set[str]] = None,
+                 ports: Optional[Set[int]] = None, buffer_size: int = 1000):
+        self.log_types = log_types
+        self.ips = ips
+        self.ports = ports
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def select(self, log_type: LogType, events: List[Dict[str, Any]], payloads: List[bytes]) -> List[bytes]:
+        """The payloads of the events this subscriber asked for"""
+        if self.log_types is not None and log_type.name not in self.log_types:
+            return []
+        if self.ips is None and self.ports is None:
+            return payloads
+        ip_fields = [field for field, _ in log_type.ip_fields]
+        selected = []
+        for event, payload in zip(events, payloads):
+            if self.ips is not None and not any(event.get(field) in self.ips for field in ip_fields):
+                continue
+            if self.ports is not None and not any(event.get(field) in self.ports for field in PORT_FIELDS):
+                continue
+            selected.append(payload)
+        return selected
+
+    def push(self, payloads: List[bytes]):
+        overflow = len(self.buffer) + len(payloads) - self.buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            LIVE_DROPPED.inc(amount=overflow)
+        self.buffer.extend(payloads)
+        self.ready.set()
+
+    def take(self) -> bytes:
+        """Everything buffered as one `events` frame body, resetting the drop count"""
+        payloads = list(self.buffer)
+        self.buffer.clear()
+        self.ready.clear()
+        dropped, self.dropped = self.dropped, 0
+        return b'{"dropped":%d,"events":[%s]}' % (dropped, b",".join(payloads))
+
+
+class LiveHub:
+    """
+    Registry of live subscribers. `publish` is called on the event loop with each processed
+    batch and costs nothing without subscribers. `snapshot` returns the aggregates sent in
+    every `stats` frame.
+    """
+
+    def __init__(self, snapshot: Callable[[], Dict[str, Any]], buffer_size: int = 1000,
+                 frame_interval: float = 0.25, stats_interval: float = 5.0, heartbeat: float = 15.0,
+                 max_subscribers: int = 50):
+        self.snapshot = snapshot
+        self.buffer_size = buffer_size
+        self.frame_interval = frame_interval
+        self.stats_interval = stats_interval
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.subscribers: Set[Subscriber] = set()
+
+    def full(self) -> bool:
+        """Whether the subscriber limit is reached"""
+        return len(self.subscribers) >= self.max_subscribers
+
+    def publish(self, log_type: LogType, events: List[Dict[str, Any]], payloads: List[bytes]):
+        """Offer a batch of events and their HEC payloads (in the same order) to every subscriber"""
+        for subscriber in self.subscribers:
+            selected = subscriber.select(log_type, events, payloads)
+            if selected:
+                subscriber.push(selected)
+
+    def _stats_frame(self, previous: Optional[Dict[str, Any]]) -> Tuple[bytes, Dict[str, Any]]:
+        """A `stats` frame body with the change in totals since `previous`"""
+        snapshot = self.snapshot()
+        totals = snapshot["totals"]
+        delta: Dict[str, Any] = {
+            key: totals[key] - (previous[key] if previous else 0) for key in ("connections", "bytes", "packets")
+        }
+        before = previous["events"] if previous else {}
+        delta["events"] = {name: count - before.get(name, 0) for name, count in totals["events"].items()}
+        return json.dumps({**snapshot, "delta": delta}).encode(), totals
+
+    async def stream(self, log_types: Optional[Set[str]] = None, ips: Optional[Set[str]] = None,
+                     ports: Optional[Set[int]] = None) -> AsyncIterator[bytes]:
+        """
+        The SSE body for a new subscriber: a `stats` frame right away and every `stats_interval`,
+        buffered events coalesced into one `events` frame per `frame_interval`, and comment
+        lines as heartbeats while idle. The subscriber is registered only once the body is
+        read and removed when the client goes away, so a response that is never sent leaves
+        nothing behind.
+        """
+        subscriber = Subscriber(log_types, ips, ports, self.buffer_size)
+        try:
+            self.subscribers.add(subscriber)
+            yield b"retry: 3000\n\n"
+            body, totals = self._stats_frame(None)
+            yield b"event: stats\ndata: " + body + b"\n\n"
+            next_stats = time.monotonic() + self.stats_interval
+            while True:
+                timeout = min(self.heartbeat, max(0.0, next_stats - time.monotonic()))
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), timeout)
+                    # Let more events arrive so they go out in one frame
+                    await asyncio.sleep(self.frame_interval)
+                    yield b"event: events\ndata: " + subscriber.take() + b"\n\n"
+                except asyncio.TimeoutError:
+                    if time.monotonic() < next_stats:
+                        yield b": keepalive\n\n"
+                if time.monotonic() >= next_stats:
+                    body, totals = self._stats_frame(totals)
+                    yield b"event: stats\ndata: " + body + b"\n\n"
+                    next_stats = time.monotonic() + self.stats_interval
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "buffered_events": sum(len(subscriber.buffer) for subscriber in self.subscribers),
+        }
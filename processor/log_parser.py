@@ -1,25 +1,274 @@
 #!/usr/bin/env python3
 """
 Zeek Log Parser
-Reads Zeek log files and sends events to the FastAPI processor for enrichment.
+Reads Zeek log files of any type and sends events to the FastAPI processor for enrichment.
 """
 
+import math
 import os
 import sys
 import time
 import json
 import requests
-from typing import Dict, List, Any
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 import logging
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+from metrics import log_sampled
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Dotted Zeek field names that map to a specific processor schema name
+FIELD_NAME_MAP = {
+    "id.orig_h": "id_orig_h",
+    "id.orig_p": "id_orig_p",
+    "id.resp_h": "id_resp_h",
+    "id.resp_p": "id_resp_p",
+}
+
+_BOOL_VALUES = {"T": True, "F": False}
+
+# Converters for Zeek #types; types not listed here (string, addr, subnet, enum,
+# set[...], vector[...]) are passed through as strings
+TYPE_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "count": int,
+    "int": int,
+    "port": int,
+    "double": float,
+    "interval": float,
+    "time": float,
+    "bool": _BOOL_VALUES.get,
+}
+
+def map_field_name(name: str) -> str:
+    """Map a dotted Zeek field name to the processor schema"""
+    return FIELD_NAME_MAP.get(name) or name.replace('.', '_')
+
+def path_from_file_name(file_name: str) -> str:
+    """Zeek #path for a log file without one in its header (conn.log, conn.2024-...log -> conn)"""
+    return os.path.basename(file_name).split('.', 1)[0]
+
+def guess_value(value: str) -> Any:
+    """Convert a value of unknown type, for logs without a #types header"""
+    try:
+        if '.' in value:
+            return float(value)
+        return int(value)
+    except (ValueError, TypeError):
+        return value
+
+def event_time(ts: Any, default: float) -> float:
+    """Epoch seconds of an event's ts, which TSV logs keep as a string; `default` if it has none"""
+    if type(ts) is str:
+        try:
+            ts = float(ts)
+        except ValueError:
+            return default
+    return ts if type(ts) in (int, float) and math.isfinite(ts) else default
+
+class ZeekSchema:
+    """Column layout and per-column converters compiled once per Zeek log header"""
+
+    def __init__(self, field_names: List[str], field_types: Optional[List[str]] = None,
+                 separator: str = '\t', unset_field: str = '-', empty_field: str = '(empty)',
+                 path: Optional[str] = None):
+        self.field_names = field_names
+        self.field_types = field_types
+        self.separator = separator
+        self.unset_field = unset_field
+        self.empty_field = empty_field
+        self.path = path
+        self.width = len(field_names)
+        self.names = [map_field_name(name) for name in field_names]
+        self.converters: List[Optional[Callable[[str], Any]]] = []
+        for i, name in enumerate(field_names):
+            if name == "ts":
+                # Keep ts as the original string for API compatibility
+                self.converters.append(None)
+            elif field_types is None:
+                self.converters.append(guess_value)
+            else:
+                self.converters.append(TYPE_CONVERTERS.get(field_types[i]))
+
+    def parse(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse one data line; returns None if the column count doesn't match"""
+        values = line.rstrip('\r\n').split(self.separator)
+        if len(values) != self.width:
+            log_sampled(logger, logging.WARNING, "field_count",
+                        f"Field count mismatch in {self.path} log: {len(values)} vs {self.width}")
+            return None
+        unset, empty = self.unset_field, self.empty_field
+        event: Dict[str, Any] = {}
+        for name, convert, value in zip(self.names, self.converters, values):
+            if value == unset or value == empty:
+                event[name] = None
+            elif convert is None:
+                event[name] = value
+            else:
+                event[name] = convert(value)
+        return event
+
+    def parse_lines(self, lines: List[str]) -> Tuple[List[Dict[str, Any]], None]:
+        """Parse a batch of lines, skipping headers and malformed lines"""
+        parse = self.parse
+        records = []
+        for line in lines:
+            if not line or line[0] == '#':
+                continue
+            try:
+                record = parse(line)
+            except (ValueError, TypeError):
+                continue
+            if record is not None:
+                records.append(record)
+        return records, None
+
+class JsonSchema:
+    """
+    Zeek JSON logs (LogAscii::use_json): one object per line, typed by the JSON itself and
+    with unset fields left out. Dotted keys are renamed in the line text before it is
+    decoded, so records come out with processor schema names and no copy, and the line
+    itself is the event as it should be shipped.
+    """
+
+    field_types = None
+
+    def __init__(self, path: str):
+        self.path = path
+        # Keys seen so far (after renaming), and the text replacements for dotted keys
+        self.keys: Set[str] = set()
+        self.renamed: Dict[str, str] = {}
+        self.replacements: List[Tuple[str, str]] = []
+        # Cleared once the text rewrite misses a key, after which lines aren't shipped as-is
+        self.verbatim = True
+
+    def rewrite(self, line: str) -> str:
+        """The line with the dotted keys seen so far renamed (id.orig_h -> id_orig_h)"""
+        line = line.rstrip()
+        for dotted, name in self.replacements:
+            line = line.replace(dotted, name)
+        return line
+
+    def _learn(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Note keys not seen before; returns True if one was dotted, so the lines need
+        rewriting again. Dotted keys the rewrite missed (unusual spacing) are renamed in place.
+        """
+        keys, renamed = self.keys, self.renamed
+        found = missed = False
+        for record in records:
+            if keys.issuperset(record):
+                continue
+            for key in list(record):
+                if key in keys:
+                    continue
+                if '.' not in key:
+                    keys.add(key)
+                elif key in renamed:
+                    record[renamed[key]] = record.pop(key)
+                    missed = True
+                else:
+                    renamed[key] = map_field_name(key)
+                    keys.add(renamed[key])
+                    self.replacements.append((json.dumps(key) + ':', json.dumps(renamed[key]) + ':'))
+                    found = True
+        if missed and not found:
+            self.verbatim = False
+        return found
+
+    def parse(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse one line; returns None if it isn't a JSON object"""
+        record = _json_loads(self.rewrite(line))
+        if type(record) is not dict:
+            return None
+        if self._learn([record]):
+            record = _json_loads(self.rewrite(line))
+            self._learn([record])
+        return record
+
+    def parse_lines(self, lines: List[str]) -> Tuple[List[Dict[str, Any]], Optional[List[str]]]:
+        """
+        Parse a batch of lines with one call into the decoder; returns the records and the
+        rewritten lines they came from, which can be shipped without encoding them again
+        (None if the rewrite can't be relied on for this log)
+        """
+        texts = [self.rewrite(line) for line in lines if line and line[0] == '{']
+        try:
+            records = _json_loads('[' + ','.join(texts) + ']')
+        except ValueError:
+            records = None
+        if records is None or len(records) != len(texts) or not all(type(record) is dict for record in records):
+            # A malformed line spoils the whole array; fall back to decoding line by line
+            records, kept = [], []
+            for text in texts:
+                try:
+                    record = _json_loads(text)
+                except ValueError:
+                    continue
+                if type(record) is dict:
+                    records.append(record)
+                    kept.append(text)
+            texts = kept
+        if self._learn(records):
+            return self.parse_lines(lines)
+        return records, texts if self.verbatim else None
+
+LogSchema = Union[ZeekSchema, JsonSchema]
+
+def read_zeek_header(f: BinaryIO) -> Tuple[Optional[LogSchema], int]:
+    """
+    Read the header block at the start of a binary Zeek log; returns the schema and data
+    offset. A file whose first line is a JSON object is a Zeek JSON log.
+    """
+    separator = '\t'
+    header: Dict[str, str] = {}
+    field_names: Optional[List[str]] = None
+    field_types: Optional[List[str]] = None
+    offset = 0
+    f.seek(0)
+    for raw in f:
+        if not raw.startswith(b'#'):
+            if offset == 0 and raw.startswith(b'{'):
+                return JsonSchema(path_from_file_name(getattr(f, 'name', '') or 'conn')), 0
+            break
+        offset += len(raw)
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if line.startswith('#separator'):
+            separator = line.split(' ', 1)[1].strip().encode().decode('unicode_escape')
+            continue
+        key, _, value = line.partition(separator)
+        if key == '#fields':
+            field_names = value.split(separator)
+        elif key == '#types':
+            field_types = value.split(separator)
+        else:
+            header[key] = value
+    if not field_names:
+        return None, offset
+    if field_types is not None and len(field_types) != len(field_names):
+        field_types = None
+    schema = ZeekSchema(
+        field_names, field_types, separator,
+        unset_field=header.get('#unset_field', '-'),
+        empty_field=header.get('#empty_field', '(empty)'),
+        path=header.get('#path') or path_from_file_name(getattr(f, 'name', '') or 'conn'),
+    )
+    return schema, offset
+
 class ZeekLogParser:
-    def __init__(self, processor_url: str = "http://localhost:8001"):
+    def __init__(self, processor_url: str = "http://localhost:8001", chunk_size: int = 1000):
         self.processor_url = processor_url
+        self.chunk_size = chunk_size
         self.field_names = []
+        self.log_type = "conn"
+        self._schema_cache: Dict[tuple, LogSchema] = {}
         
     def parse_zeek_header(self, header_lines: List[str]) -> List[str]:
         """Parse Zeek log header to extract field names"""
@@ -35,103 +284,121 @@ class ZeekLogParser:
         return field_names
     
     def parse_zeek_line(self, line: str, field_names: List[str]) -> Dict[str, Any]:
-        """Parse a single Zeek log line into a dictionary"""
+        """Parse a single Zeek log line, TSV or JSON, into a dictionary"""
         if line.startswith('#') or not line.strip():
             return None
-            
-        values = line.strip().split('\t')
-        
-        if len(values) != len(field_names):
-            logger.warning(f"Field count mismatch: {len(values)} vs {len(field_names)}")
+        if line.startswith('{'):
+            schema = self._schema_cache.get(("json", self.log_type))
+            if schema is None:
+                schema = self._schema_cache[("json", self.log_type)] = JsonSchema(self.log_type)
+        else:
+            key = tuple(field_names)
+            schema = self._schema_cache.get(key)
+            if schema is None:
+                schema = self._schema_cache[key] = ZeekSchema(field_names)
+        try:
+            return schema.parse(line)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Skipping malformed line: {e}")
             return None
-            
-        raw_event: Dict[str, Any] = {}
-        for i, field_name in enumerate(field_names):
-            value = values[i]
-            if value == "(empty)" or value == "-":
-                value = None
-            else:
-                # Keep ts as string if it has a dot; else try numeric
-                if field_name == "ts":
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        pass
-                else:
-                    try:
-                        if '.' in value:
-                            value = float(value)
-                        else:
-                            value = int(value)
-                    except (ValueError, TypeError):
-                        pass
-            raw_event[field_name] = value
-        
-        # Map dotted Zeek fields to processor schema
-        mapped: Dict[str, Any] = {}
-        mapping = {
-            "id.orig_h": "id_orig_h",
-            "id.orig_p": "id_orig_p",
-            "id.resp_h": "id_resp_h",
-            "id.resp_p": "id_resp_p",
-        }
-        for k, v in raw_event.items():
-            if k in mapping:
-                mapped[mapping[k]] = v
-            else:
-                mapped[k.replace('.', '_')] = v
+    
+    def iter_zeek_file(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream events from a Zeek log file, compiling the schema from its header"""
+        separator = '\t'
+        header: Dict[str, str] = {}
+        field_names: Optional[List[str]] = None
+        field_types: Optional[List[str]] = None
+        schema: Optional[LogSchema] = None
+        skipped = 0
         
-        # Ensure ts is a string for API compatibility
-        if 'ts' in mapped and mapped['ts'] is not None:
-            mapped['ts'] = str(mapped['ts'])
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.startswith('#'):
+                    if line.startswith('#separator'):
+                        separator = line.split(' ', 1)[1].strip().encode().decode('unicode_escape')
+                        continue
+                    key, _, value = line.rstrip('\r\n').partition(separator)
+                    if key == '#fields':
+                        field_names = value.split(separator)
+                        field_types = None
+                        schema = None
+                    elif key == '#types':
+                        field_types = value.split(separator)
+                        schema = None
+                    else:
+                        header[key] = value
+                    continue
+                if schema is None and not field_names and line.startswith('{'):
+                    schema = JsonSchema(path_from_file_name(file_path))
+                    self.log_type = schema.path
+                    logger.info(f"Reading {file_path} as a Zeek JSON log")
+                if schema is None:
+                    if not field_names:
+                        continue
+                    if field_types is not None and len(field_types) != len(field_names):
+                        field_types = None
+                    schema = ZeekSchema(
+                        field_names, field_types, separator,
+                        unset_field=header.get('#unset_field', '-'),
+                        empty_field=header.get('#empty_field', '(empty)'),
+                        path=header.get('#path') or path_from_file_name(file_path),
+                    )
+                    self.field_names = field_names
+                    self.log_type = schema.path
+                    logger.info(f"Parsed {len(field_names)} fields: {field_names}")
+                if line.isspace():
+                    continue
+                try:
+                    event = schema.parse(line)
+                except (ValueError, TypeError):
+                    skipped += 1
+                    continue
+                if event:
+                    yield event
         
-        return mapped
+        if field_names is None and schema is None:
+            logger.error("Could not parse field names from header")
+        if skipped:
+            logger.warning(f"Skipped {skipped} malformed lines in {file_path}")
+    
+    def iter_zeek_chunks(self, file_path: str, chunk_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Stream events from a Zeek log file in lists of at most chunk_size"""
+        chunk_size = chunk_size or self.chunk_size
+        chunk: List[Dict[str, Any]] = []
+        for event in self.iter_zeek_file(file_path):
+            chunk.append(event)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
     
     def parse_zeek_file(self, file_path: str) -> List[Dict[str, Any]]:
         """Parse a Zeek log file and return list of events"""
-        events = []
-        
         try:
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-                
-            # Parse header to get field names
-            header_lines = [line for line in lines if line.startswith('#')]
-            field_names = self.parse_zeek_header(header_lines)
-            
-            if not field_names:
-                logger.error("Could not parse field names from header")
-                return []
-                
-            logger.info(f"Parsed {len(field_names)} fields: {field_names}")
-            
-            # Parse data lines
-            for line in lines:
-                if not line.startswith('#') and line.strip():
-                    event = self.parse_zeek_line(line, field_names)
-                    if event:
-                        events.append(event)
-                        
+            events = list(self.iter_zeek_file(file_path))
             logger.info(f"Parsed {len(events)} events from {file_path}")
             return events
-            
         except Exception as e:
             logger.error(f"Error parsing file {file_path}: {str(e)}")
             return []
     
-    def send_to_processor(self, events: List[Dict[str, Any]]) -> bool:
-        """Send events to the FastAPI processor"""
+    def send_to_processor(self, events: List[Dict[str, Any]], log_type: str = "conn") -> bool:
+        """Send events of one log type to the FastAPI processor"""
         if not events:
             return True
             
         try:
             url = f"{self.processor_url}/process/batch"
-            response = requests.post(url, json=events, timeout=30)
+            response = requests.post(url, params={"log_type": log_type}, json=events, timeout=30)
             
             if response.status_code == 200:
                 result = response.json()
-                logger.info(f"Successfully sent {result['successful']}/{result['total_events']} events to processor")
-                return result['successful'] == result['total_events']
+                logger.info(
+                    f"Sent {result['successful']}/{result['total_events']} events to processor "
+                    f"({result.get('spooled', 0)} spooled)"
+                )
+                return result['failed'] == 0
             else:
                 logger.error(f"Failed to send to processor: {response.status_code} - {response.text}")
                 return False
@@ -141,18 +408,25 @@ class ZeekLogParser:
             return False
     
     def process_log_file(self, file_path: str) -> bool:
-        """Process a single Zeek log file"""
+        """Process a single Zeek log file, streaming it to the processor in chunks"""
         logger.info(f"Processing log file: {file_path}")
         
-        # Parse the file
-        events = self.parse_zeek_file(file_path)
+        total = 0
+        success = True
+        try:
+            for chunk in self.iter_zeek_chunks(file_path):
+                total += len(chunk)
+                if not self.send_to_processor(chunk, self.log_type):
+                    success = False
+        except Exception as e:
+            logger.error(f"Error parsing file {file_path}: {str(e)}")
+            return False
         
-        if not events:
+        if not total:
             logger.warning(f"No events found in {file_path}")
-            return True
-            
-        # Send to processor
-        return self.send_to_processor(events)
+        else:
+            logger.info(f"Parsed {total} events from {file_path}")
+        return success
 
 def main():
     """Main function for command-line usage"""
@@ -0,0 +1,171 @@
+"""
+Log Type Registry
+Maps each Zeek log type (the #path header) to its columns, the address fields that get
+GeoIP enrichment and the Splunk sourcetype its events are indexed under.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from enrichment import GEOIP_FIELDS
+from log_parser import LogSchema, ZeekSchema, map_field_name
+
+Column = Tuple[str, str]
+
+# Column kind for each Zeek #type; everything else (string, addr, enum, set[...],
+# vector[...]) arrives from the parser as a string
+ZEEK_TYPE_KINDS = {
+    "count": "int",
+    "int": "int",
+    "port": "int",
+    "double": "float",
+    "interval": "float",
+    "time": "time",
+    "bool": "bool",
+}
+
+_LOG_TYPE_NAME = re.compile(r"[a-z0-9_]+")
+
+
+def _columns(spec: str) -> List[Column]:
+    """Columns from a "<zeek field>:<zeek type> ..." spec, in Zeek's default field order"""
+    columns = []
+    for item in spec.split():
+        name, _, zeek_type = item.partition(":")
+        columns.append((map_field_name(name), ZEEK_TYPE_KINDS.get(zeek_type, "str")))
+    return columns
+
+
+_CONN_ID = "ts:time uid:string id.orig_h:addr id.orig_p:port id.resp_h:addr id.resp_p:port"
+
+
+class LogType:
+    """
+    One Zeek log type. `columns` are the fields we know for it (Zeek's defaults), used
+    for batches that arrive without a header; files are always read with the columns
+    from their own #fields/#types header.
+    """
+
+    def __init__(self, name: str, columns: Optional[List[Column]] = None,
+                 ip_fields: List[Tuple[str, str]] = GEOIP_FIELDS, sourcetype: Optional[str] = None):
+        self.name = name
+        self.columns = columns or []
+        self.kinds = dict(self.columns)
+        self.ip_fields = ip_fields
+        self.sourcetype = sourcetype or f"zeek_{name}_enriched"
+        self._envelopes: Dict[Tuple[str, str], str] = {}
+
+    def envelope(self, index: str, source: str) -> str:
+        """Serialized HEC envelope that closes each of this type's payloads"""
+        key = (index, source)
+        envelope = self._envelopes.get(key)
+        if envelope is None:
+            envelope = self._envelopes[key] = (
+                f',"source":{json.dumps(source)},"sourcetype":{json.dumps(self.sourcetype)},'
+                f'"index":{json.dumps(index)}}}'
+            )
+        return envelope
+
+    def batch_columns(self, events: List[Any]) -> List[Column]:
+        """Known columns, followed by any other keys the events carry (left unchecked)"""
+        extra = {}
+        for event in events:
+            if type(event) is dict:
+                extra.update(dict.fromkeys(event))
+        addresses = {field for field, _ in self.ip_fields}
+        columns = list(self.columns)
+        columns.extend(
+            (name, "str" if name in addresses else "any") for name in extra if name not in self.kinds
+        )
+        return columns
+
+    def schema_columns(self, schema: ZeekSchema) -> List[Column]:
+        """Columns of a file as described by its header"""
+        if schema.field_types is None:
+            return [(name, self.kinds.get(name, "any")) for name in schema.names]
+        return [
+            (name, ZEEK_TYPE_KINDS.get(zeek_type, "str"))
+            for name, zeek_type in zip(schema.names, schema.field_types)
+        ]
+
+
+LOG_TYPES: Dict[str, LogType] = {
+    log_type.name: log_type
+    for log_type in [
+        LogType("conn", _columns(
+            f"{_CONN_ID} proto:enum service:string duration:interval orig_bytes:count "
+            "resp_bytes:count conn_state:string local_orig:bool local_resp:bool missed_bytes:count "
+            "history:string orig_pkts:count orig_ip_bytes:count resp_pkts:count resp_ip_bytes:count "
+            "tunnel_parents:set[string]"
+        )),
+        LogType("dns", _columns(
+            f"{_CONN_ID} proto:enum trans_id:count rtt:interval query:string qclass:count "
+            "qclass_name:string qtype:count qtype_name:string rcode:count rcode_name:string AA:bool "
+            "TC:bool RD:bool RA:bool Z:count answers:vector[string] TTLs:vector[interval] rejected:bool"
+        )),
+        LogType("http", _columns(
+            f"{_CONN_ID} trans_depth:count method:string host:string uri:string referrer:string "
+            "version:string user_agent:string origin:string request_body_len:count "
+            "response_body_len:count status_code:count status_msg:string info_code:count "
+            "info_msg:string tags:set[enum] username:string password:string proxied:set[string] "
+            "orig_fuids:vector[string] orig_filenames:vector[string] orig_mime_types:vector[string] "
+            "resp_fuids:vector[string] resp_filenames:vector[string] resp_mime_types:vector[string]"
+        )),
+        LogType("ssl", _columns(
+            f"{_CONN_ID} version:string cipher:string curve:string server_name:string resumed:bool "
+            "last_alert:string next_protocol:string established:bool ssl_history:string "
+            "cert_chain_fps:vector[string] client_cert_chain_fps:vector[string] sni_matches_cert:bool"
+        )),
+        LogType("files", _columns(
+            f"{_CONN_ID} fuid:string source:string depth:count analyzers:set[string] "
+            "mime_type:string filename:string duration:interval local_orig:bool is_orig:bool "
+            "seen_bytes:count total_bytes:count missing_bytes:count overflow_bytes:count "
+            "timedout:bool parent_fuid:string md5:string sha1:string sha256:string extracted:string "
+            "extracted_cutoff:bool extracted_size:count"
+        )),
+        LogType("notice", _columns(
+            f"{_CONN_ID} fuid:string file_mime_type:string file_desc:string proto:enum note:enum "
+            "msg:string sub:string src:addr dst:addr p:port n:count peer_descr:string "
+            "actions:set[enum] email_dest:set[string] suppress_for:interval "
+            "remote_location.country_code:string remote_location.region:string "
+            "remote_location.city:string remote_location.latitude:double "
+            "remote_location.longitude:double"
+        ), ip_fields=GEOIP_FIELDS + [("src", "src_geoip"), ("dst", "dst_geoip")]),
+        LogType("weird", _columns(
+            f"{_CONN_ID} name:string addl:string notice:bool peer:string source:string"
+        )),
+        # Not a Zeek log: one event per conn flow folded by rollup.py
+        LogType("conn_summary", _columns(
+            "ts:time uid:string id.orig_h:addr id.resp_h:addr id.resp_p:port proto:enum "
+            "service:string duration:interval orig_bytes:count resp_bytes:count orig_pkts:count "
+            "resp_pkts:count conn_count:count first_ts:time last_ts:time sample_uids:vector[string]"
+        )),
+        # Not a Zeek log: scans and beacons found in conn events by detection.py
+        LogType("detection", _columns(
+            "ts:time uid:string detection:string severity:string description:string id.orig_h:addr "
+            "id.resp_h:addr id.resp_p:port proto:enum distinct_hosts:count distinct_ports:count "
+            "window:interval conn_count:count interval:interval interval_stddev:interval "
+            "jitter:double first_ts:time last_ts:time"
+        )),
+    ]
+}
+
+
+def get_log_type(name: str) -> LogType:
+    """
+    The registered type for a Zeek #path. Other logs (ssh, ftp, smtp, kerberos, ...) get a
+    type of their own on first use, with columns taken from their header or events.
+    Raises ValueError for names that can't be a Zeek path.
+    """
+    log_type = LOG_TYPES.get(name)
+    if log_type is None:
+        if not _LOG_TYPE_NAME.fullmatch(name):
+            raise ValueError(f"invalid log type: {name!r}")
+        log_type = LOG_TYPES[name] = LogType(name)
+    return log_type
+
+
+def log_type_for(schema: LogSchema) -> LogType:
+    """The log type of a parsed file; schemas without a #path are treated as conn"""
+    return get_log_type(schema.path or "conn")
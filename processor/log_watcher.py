@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
 """
 Log Watcher for Mini SOC
-Monitors Zeek log files and sends new entries to the processor API
+Monitors Zeek log files and sends new entries to the processor API, partitioned across
+processor replicas when several are configured
 """
 
 import os
 import time
-import requests
-import json
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import logging
 
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from checkpoint import FINGERPRINT_BYTES, Checkpoint, CheckpointStore, fingerprint_fd
+from cluster import ClusterSender
+from config import (
+    CHECKPOINT_FILE,
+    CHECKPOINT_INTERVAL,
+    CLUSTER_MEMBERS_FILE,
+    CLUSTER_PARTITION_KEY,
+    CLUSTER_RELOAD_INTERVAL,
+    CLUSTER_VNODES,
+    LOGS_DIR,
+    PROCESSOR_URLS,
+    WATCHER_METRICS_PORT,
+)
+from log_parser import LogSchema, read_zeek_header
+from metrics import EVENTS_PARSED, REGISTRY, log_sampled, serve_metrics, stage_cpu
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,136 +40,491 @@ logging.basicConfig(
     ]
 )
 
+class TailedFile:
+    """
+    An open log file followed by inode, so reads continue across renames.
+    `path` is the live log name; `source` is where the file was opened from, which
+    differs when resuming a file that was rotated while the watcher was down.
+    """
+
+    def __init__(self, path: Path, offset: int = 0, source: Optional[Path] = None):
+        self.path = path
+        self.handle = open(source or path, 'rb')
+        st = os.fstat(self.handle.fileno())
+        self.dev = st.st_dev
+        self.inode = st.st_ino
+        self.offset = offset
+        self._fingerprint: Optional[Tuple[str, int]] = None
+
+    def size(self) -> int:
+        return os.fstat(self.handle.fileno()).st_size
+
+    def is_truncated(self) -> bool:
+        """True if the file shrank below our offset (copytruncate-style rotation)"""
+        return self.size() < self.offset
+
+    def is_replaced(self) -> bool:
+        """True if the path no longer refers to the inode we have open"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (st.st_dev, st.st_ino) != (self.dev, self.inode)
+
+    def fingerprint(self) -> Tuple[str, int]:
+        """Hash of the file's leading bytes and how many were hashed"""
+        if self._fingerprint is not None:
+            return self._fingerprint
+        size = min(self.size(), FINGERPRINT_BYTES)
+        fingerprint = (fingerprint_fd(self.handle.fileno(), size), size)
+        if size == FINGERPRINT_BYTES:
+            self._fingerprint = fingerprint
+        return fingerprint
+
+    def matches(self, checkpoint: Checkpoint) -> bool:
+        """True if the checkpoint was taken from this file"""
+        return (
+            (self.dev, self.inode) == (checkpoint.dev, checkpoint.inode)
+            and self.size() >= checkpoint.offset
+            and fingerprint_fd(self.handle.fileno(), checkpoint.fingerprint_size) == checkpoint.fingerprint
+        )
+
+    def checkpoint(self, offset: int) -> Checkpoint:
+        fingerprint, fingerprint_size = self.fingerprint()
+        return Checkpoint(self.dev, self.inode, offset, fingerprint, fingerprint_size)
+
+    def read_lines(self, max_lines: int, offset: Optional[int] = None) -> Tuple[List[str], int]:
+        """Read up to max_lines complete lines after offset; returns lines and the offset after them"""
+        pos = self.offset if offset is None else offset
+        self.handle.seek(pos)
+        readline = self.handle.readline
+        lines = []
+        for _ in range(max_lines):
+            line = readline()
+            if not line.endswith(b'\n'):
+                break
+            pos += len(line)
+            lines.append(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+        return lines, pos
+
+    def close(self):
+        self.handle.close()
+
+def is_live_log(file_path: Path) -> bool:
+    """Live Zeek logs are named <path>.log; rotated copies carry a timestamp (conn.2024-...log)"""
+    return (
+        file_path.suffix == ".log"
+        and '.' not in file_path.stem
+        and file_path.name not in [".status", "log_watcher.log"]
+    )
+
+def find_rotated(file_path: Path, checkpoint: Checkpoint) -> Optional[TailedFile]:
+    """Find the rotated copy (e.g. conn.2024-...log) of a checkpointed file, if still present"""
+    for candidate in file_path.parent.glob(f"{file_path.stem}.*{file_path.suffix}"):
+        try:
+            st = candidate.stat()
+        except FileNotFoundError:
+            continue
+        if (st.st_dev, st.st_ino) != (checkpoint.dev, checkpoint.inode):
+            continue
+        tailed = TailedFile(file_path, checkpoint.offset, source=candidate)
+        if tailed.matches(checkpoint):
+            return tailed
+        tailed.close()
+    return None
+
+def resume_tailed(file_path: Path, checkpoint: Optional[Checkpoint]) -> Optional[TailedFile]:
+    """
+    Open a live log positioned according to its checkpoint. If the file was rotated while
+    we were down, the rotated copy is returned instead; the caller finishes it and then
+    switches to the new file once is_replaced() reports the change.
+    """
+    try:
+        tailed = TailedFile(file_path)
+    except FileNotFoundError:
+        return None
+    if checkpoint is None:
+        return tailed
+    if tailed.matches(checkpoint):
+        tailed.offset = checkpoint.offset
+        logging.info(f"Resuming {file_path.name} at offset {checkpoint.offset}")
+        return tailed
+    rotated = find_rotated(file_path, checkpoint)
+    if rotated is not None:
+        logging.info(f"Resuming rotated {file_path.name} at offset {checkpoint.offset}")
+        tailed.close()
+        return rotated
+    logging.warning(f"Checkpoint for {file_path.name} no longer matches any file, starting at 0")
+    return tailed
+
+class LogEventHandler(FileSystemEventHandler):
+    """Forwards filesystem events for the logs directory to a callback taking the path"""
+
+    def __init__(self, mark_dirty: Callable[[str], None]):
+        self.mark_dirty = mark_dirty
+
+    def on_any_event(self, event: FileSystemEvent):
+        if event.is_directory:
+            return
+        self.mark_dirty(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.mark_dirty(dest_path)
+
 class LogWatcher:
-    def __init__(self, logs_dir: str = "/app/logs", processor_url: str = "http://localhost:8001"):
+    """
+    Tails the live logs in `logs_dir` and posts their events to `processor_url`, which may
+    list several comma-separated replicas; events are then partitioned by `partition_key`
+    (see cluster.py). `members_file`, when it exists, overrides the list and is reloaded.
+    """
+
+    def __init__(self, logs_dir: str = "/app/logs", processor_url: str = "http://localhost:8001",
+                 batch_size: int = 1000, coalesce_delay: float = 0.05,
+                 checkpoints: Optional[CheckpointStore] = None, partition_key: str = "source",
+                 members_file: str = "", vnodes: int = 160, members_reload_interval: float = 5.0):
         self.logs_dir = Path(logs_dir)
         self.processor_url = processor_url
+        self.sender = ClusterSender(
+            processor_url.split(","),
+            partition_key=partition_key,
+            vnodes=vnodes,
+            members_file=members_file,
+            reload_interval=members_reload_interval,
+        )
+        self.batch_size = batch_size
+        self.coalesce_delay = coalesce_delay
+        self.checkpoints = checkpoints
         self.processed_files = set()
         self.file_positions = {}
+        self.backoff_until = 0.0
+        self.tailed: Dict[str, TailedFile] = {}
+        self.schemas: Dict[str, LogSchema] = {}
+        # Per file: events read but not yet accepted by every replica they belong to
+        self.unsent: Dict[str, Tuple[str, Dict[str, List[Dict]], int]] = {}
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+        self._wake = threading.Event()
+        self.send_seconds = REGISTRY.histogram("watcher_send_seconds", "Latency of /process/batch requests", ["status"])
+        self.events_sent = REGISTRY.counter(
+            "watcher_events_sent_total", "Events accepted by the processor, by log type and replica",
+            ["log_type", "replica"],
+        )
+        self.events_rejected = REGISTRY.counter(
+            "watcher_events_rejected_total", "Events the processor refused with a 4xx and that were skipped",
+            ["log_type", "replica"],
+        )
+        REGISTRY.callback(
+            "watcher_lag_bytes", "Bytes between each tailed file's acknowledged offset and its EOF",
+            lambda: {(key,): lag for key, lag in self.lag().items()}, ["file"],
+        )
         
     def get_log_files(self) -> List[Path]:
-        """Get all Zeek log files (excluding .status and log_watcher.log)"""
+        """Get all live Zeek log files (excluding .status, log_watcher.log and rotated files)"""
         log_files = []
         for file_path in self.logs_dir.glob("*.log"):
-            if file_path.name not in [".status", "log_watcher.log"]:
+            if is_live_log(file_path):
                 log_files.append(file_path)
         return log_files
     
-    def read_new_lines(self, file_path: Path) -> List[str]:
-        """Read new lines from a file since last check"""
+    def mark_dirty(self, path: str):
+        """Queue a path for reading and wake the main loop (called from the observer thread)"""
+        file_path = Path(path)
+        if not is_live_log(file_path):
+            return
+        with self._dirty_lock:
+            self._dirty.add(str(file_path))
+        self._wake.set()
+    
+    def take_dirty(self) -> Set[str]:
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+    
+    def lag(self) -> Dict[str, int]:
+        """Bytes between each file's acknowledged offset and its current EOF"""
+        lag = {}
+        for key, tailed in list(self.tailed.items()):
+            try:
+                lag[key] = max(tailed.size() - tailed.offset, 0)
+            except (OSError, ValueError):
+                continue
+        return lag
+    
+    def open_tailed(self, file_path: Path) -> Optional[TailedFile]:
+        """Start following a file, resuming from its checkpoint or a known offset"""
+        key = str(file_path)
+        if key in self.file_positions or self.checkpoints is None:
+            try:
+                tailed = TailedFile(file_path, self.file_positions.get(key, 0))
+            except FileNotFoundError:
+                return None
+        else:
+            tailed = resume_tailed(file_path, self.checkpoints.get(key))
+            if tailed is None:
+                return None
+            self.file_positions[key] = tailed.offset
+        
+        if tailed.is_truncated():
+            tailed.offset = 0
+        self.tailed[key] = tailed
+        return tailed
+    
+    def read_new_lines(self, file_path: Path) -> Tuple[List[str], int]:
+        """Read new lines from a file since last check; returns lines and the offset after them"""
+        key = str(file_path)
         try:
-            current_pos = self.file_positions.get(str(file_path), 0)
-            
-            with open(file_path, 'r') as f:
-                f.seek(current_pos)
-                new_lines = f.readlines()
-                self.file_positions[str(file_path)] = f.tell()
-                
-            return new_lines
+            tailed = self.tailed.get(key) or self.open_tailed(file_path)
+            if tailed is None:
+                return [], self.file_positions.get(key, 0)
+            # A batch per replica, so each replica's requests stay full as the cluster grows
+            return tailed.read_lines(self.batch_size * len(self.sender.members))
         except Exception as e:
             logging.error(f"Error reading {file_path}: {e}")
-            return []
+            return [], self.file_positions.get(key, 0)
     
-    def parse_zeek_line(self, line: str) -> Optional[Dict]:
-        """Parse a Zeek log line into structured data"""
+    def get_schema(self, file_path: Path) -> Optional[LogSchema]:
+        """Compiled schema from the #fields/#types header of the file being tailed"""
+        key = str(file_path)
+        schema = self.schemas.get(key)
+        tailed = self.tailed.get(key)
+        if schema is None and tailed is not None:
+            schema, _ = read_zeek_header(tailed.handle)
+            if schema is not None:
+                self.schemas[key] = schema
+        return schema
+    
+    def parse_zeek_line(self, line: str, schema: LogSchema) -> Optional[Dict]:
+        """Parse a Zeek log line into a typed event"""
+        if line.startswith('#') or not line.strip():
+            return None
         try:
-            if line.startswith('#') or not line.strip():
-                return None
-                
-            # Split by tab and map fields
-            parts = line.strip().split('\t')
-            if len(parts) < 2:
-                return None
-                
-            # Basic parsing - this is a simplified version
-            # In production, you'd want more sophisticated parsing
-            return {
-                "raw_line": line.strip(),
-                "timestamp": parts[0] if parts else "",
-                "data": parts[1:] if len(parts) > 1 else []
-            }
-        except Exception as e:
-            logging.error(f"Error parsing line: {e}")
+            return schema.parse(line)
+        except (ValueError, TypeError) as e:
+            log_sampled(logging.getLogger(), logging.ERROR, "parse_line", f"Error parsing line: {e}")
             return None
     
-    def send_to_processor(self, events: List[Dict]) -> bool:
-        """Send events to the processor API"""
-        if not events:
-            return True
-            
+    def send_to_replica(self, replica: str, events: List[Dict], log_type: str) -> Tuple[int, Optional[str]]:
+        """
+        Post events to one replica in chunks over its persistent connection. Returns how
+        many were dealt with (a prefix of `events`) and the error that stopped the rest.
+        A chunk refused with a 4xx would be refused again, so it is logged and skipped;
+        backpressure, 5xx and transport errors stop the send so it can be retried.
+        """
         # Split large batches into smaller chunks to avoid timeouts
         batch_size = 1000
-        total_sent = 0
+        handled = 0
         
         for i in range(0, len(events), batch_size):
             batch = events[i:i + batch_size]
+            started = time.perf_counter()
             try:
-                response = requests.post(
-                    f"{self.processor_url}/process/batch",
-                    json=batch,
-                    timeout=30
-                )
+                response = self.sender.post(replica, "/process/batch", params={"log_type": log_type}, json=batch)
                 
+                self.send_seconds.observe(str(response.status_code), value=time.perf_counter() - started)
                 if response.status_code == 200:
-                    total_sent += len(batch)
-                    logging.info(f"Successfully sent batch of {len(batch)} events to processor")
+                    handled += len(batch)
+                    self.events_sent.inc(log_type, replica, amount=len(batch))
+                elif response.status_code == 503:
+                    # Processor spool is full: hold our position and back off
+                    retry_after = float(response.headers.get("Retry-After", 5))
+                    self.backoff_until = max(self.backoff_until, time.time() + retry_after)
+                    logging.warning(f"Processor {replica} is applying backpressure, pausing for {retry_after}s")
+                    return handled, "backpressure"
+                elif 400 <= response.status_code < 500:
+                    handled += len(batch)
+                    self.events_rejected.inc(log_type, replica, amount=len(batch))
+                    log_sampled(logging.getLogger(), logging.ERROR, "processor_rejected",
+                                f"Processor {replica} rejected {len(batch)} {log_type} events, skipping them: "
+                                f"{response.status_code} - {response.text[:200]}")
                 else:
-                    logging.error(f"Processor API error: {response.status_code} - {response.text}")
-                    return False
+                    log_sampled(logging.getLogger(), logging.ERROR, "processor_status",
+                                f"Processor API error from {replica}: {response.status_code} - {response.text}")
+                    return handled, f"status {response.status_code}"
                     
             except Exception as e:
-                logging.error(f"Error sending batch to processor: {e}")
-                return False
+                self.send_seconds.observe("error", value=time.perf_counter() - started)
+                log_sampled(logging.getLogger(), logging.ERROR, "processor_error",
+                            f"Error sending batch to processor {replica}: {e}")
+                return handled, str(e)
         
-        logging.info(f"Successfully sent total of {total_sent} events to processor")
-        return True
+        return handled, None
     
-    def process_log_file(self, file_path: Path):
-        """Process a single log file for new entries"""
-        try:
-            new_lines = self.read_new_lines(file_path)
+    def send_partitions(self, partitions: Dict[str, List[Dict]], log_type: str) -> Dict[str, List[Dict]]:
+        """
+        Send each replica its partition, all replicas in parallel. Returns the events not
+        accepted, by replica; events of replicas that have left the cluster are re-partitioned.
+        """
+        members = set(self.sender.current().nodes)
+        orphaned = [event for replica, events in partitions.items() if replica not in members for event in events]
+        partitions = {replica: events for replica, events in partitions.items() if replica in members}
+        for replica, events in self.sender.partition(orphaned).items():
+            partitions[replica] = partitions.get(replica, []) + events
+        if not partitions:
+            return {}
+        
+        results = self.sender.map(lambda replica, events: self.send_to_replica(replica, events, log_type), partitions)
+        remaining = {}
+        for replica, (sent, error) in results.items():
+            if error is not None:
+                remaining[replica] = partitions[replica][sent:]
+        total_sent = sum(sent for sent, _ in results.values())
+        if total_sent:
+            log_sampled(logging.getLogger(), logging.INFO, "processor_sent",
+                        f"Successfully sent {total_sent} {log_type} events to {len(results)} processor replica(s)")
+        return remaining
+    
+    def send_to_processor(self, events: List[Dict], log_type: str = "conn") -> bool:
+        """Send events of one log type to the processor replicas"""
+        if not events:
+            return True
+        return not self.send_partitions(self.sender.partition(events), log_type)
+    
+    def commit_position(self, file_path: Path, offset: int):
+        """Record that everything before offset has been accepted by the processor"""
+        key = str(file_path)
+        self.file_positions[key] = offset
+        tailed = self.tailed.get(key)
+        if tailed is not None:
+            tailed.offset = offset
+            if self.checkpoints is not None:
+                self.checkpoints.update(key, tailed.checkpoint(offset))
+                self.checkpoints.flush()
+    
+    def drain_file(self, file_path: Path) -> bool:
+        """Send everything between our offset and EOF; returns False if the processor refused"""
+        key = str(file_path)
+        while True:
+            unsent = self.unsent.pop(key, None)
+            if unsent is not None:
+                # Retry only what some replica refused, so the others get no duplicates
+                log_type, partitions, new_pos = unsent
+                remaining = self.send_partitions(partitions, log_type)
+                if remaining:
+                    self.unsent[key] = (log_type, remaining, new_pos)
+                    return False
+                self.commit_position(file_path, new_pos)
+                continue
+            new_lines, new_pos = self.read_new_lines(file_path)
             if not new_lines:
-                return
+                return True
+            schema = self.get_schema(file_path)
+            if schema is None:
+                # Header not written yet; read these lines again once it is
+                return True
                 
-            events = []
-            for line in new_lines:
-                parsed = self.parse_zeek_line(line)
-                if parsed:
-                    events.append(parsed)
+            with stage_cpu("parse"):
+                events, _ = schema.parse_lines(new_lines)
             
             if events:
-                logging.info(f"Processing {len(events)} new events from {file_path.name}")
-                self.send_to_processor(events)
+                EVENTS_PARSED.inc(schema.path, amount=len(events))
+                remaining = self.send_partitions(self.sender.partition(events), schema.path)
+                if remaining:
+                    # Leave the position alone until every replica has its events
+                    self.unsent[key] = (schema.path, remaining, new_pos)
+                    return False
+            
+            self.commit_position(file_path, new_pos)
+    
+    def process_log_file(self, file_path: Path) -> bool:
+        """Process a single log file for new entries, following rotation and truncation"""
+        key = str(file_path)
+        try:
+            tailed = self.tailed.get(key) or self.open_tailed(file_path)
+            if tailed is None:
+                return True
+            
+            if tailed.is_truncated():
+                logging.info(f"{file_path.name} was truncated, restarting from the beginning")
+                self.schemas.pop(key, None)
+                self.unsent.pop(key, None)
+                self.commit_position(file_path, 0)
+            
+            if not self.drain_file(file_path):
+                return False
+            
+            if tailed.is_replaced():
+                # Zeek renamed the file on rotation: the handle still points at the old
+                # inode, which is drained above. Switch to the new file at offset 0.
+                logging.info(f"{file_path.name} was rotated, switching to the new file")
+                if not self.drain_file(file_path):
+                    return False
+                tailed.close()
+                del self.tailed[key]
+                self.schemas.pop(key, None)
+                self.file_positions[key] = 0
+                if file_path.exists() and self.open_tailed(file_path) is not None:
+                    self.commit_position(file_path, 0)
+                    return self.drain_file(file_path)
+            return True
                 
         except Exception as e:
             logging.error(f"Error processing {file_path}: {e}")
+            return False
     
     def run(self, interval: int = 5):
-        """Main loop to monitor log files"""
+        """Main loop: wake on filesystem events, with a periodic sweep as a safety net"""
         logging.info(f"Starting log watcher for directory: {self.logs_dir}")
-        logging.info(f"Processor URL: {self.processor_url}")
+        logging.info(f"Processor replicas: {', '.join(self.sender.members)} "
+                     f"(partitioned by {self.sender.partition_key})")
+        if serve_metrics(WATCHER_METRICS_PORT) is not None:
+            logging.info(f"Serving metrics on :{WATCHER_METRICS_PORT}/metrics")
         
-        while True:
-            try:
-                log_files = self.get_log_files()
-                
-                for file_path in log_files:
-                    if file_path.exists():
-                        self.process_log_file(file_path)
-                
-                time.sleep(interval)
-                
-            except KeyboardInterrupt:
-                logging.info("Log watcher stopped by user")
-                break
-            except Exception as e:
-                logging.error(f"Unexpected error in main loop: {e}")
-                time.sleep(interval)
+        observer = Observer()
+        observer.schedule(LogEventHandler(self.mark_dirty), str(self.logs_dir), recursive=False)
+        observer.start()
+        pending = {str(path) for path in self.get_log_files()}
+        
+        try:
+            while True:
+                try:
+                    if not pending:
+                        woke = self._wake.wait(timeout=interval)
+                        self._wake.clear()
+                        if woke:
+                            # Let a burst of write events coalesce into one read
+                            time.sleep(self.coalesce_delay)
+                        else:
+                            pending = {str(path) for path in self.get_log_files()} | set(self.tailed)
+                    pending |= self.take_dirty()
+                    
+                    wait = self.backoff_until - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    
+                    failed = set()
+                    for key in sorted(pending):
+                        if not self.process_log_file(Path(key)):
+                            failed.add(key)
+                    pending = failed
+                    if self.checkpoints is not None:
+                        self.checkpoints.flush()
+                    if failed and self.backoff_until <= time.time():
+                        time.sleep(interval)
+                    
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    logging.error(f"Unexpected error in main loop: {e}")
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            logging.info("Log watcher stopped by user")
+        finally:
+            observer.stop()
+            observer.join()
+            if self.checkpoints is not None:
+                self.checkpoints.flush(force=True)
+            for tailed in self.tailed.values():
+                tailed.close()
+            self.sender.close()
 
 if __name__ == "__main__":
-    # Get environment variables
-    logs_dir = os.getenv("LOGS_DIR", "/app/logs")
-    processor_url = os.getenv("PROCESSOR_URL", "http://127.0.0.1:8001")
-    
-    watcher = LogWatcher(logs_dir, processor_url)
+    checkpoints = CheckpointStore(CHECKPOINT_FILE, min_interval=CHECKPOINT_INTERVAL)
+    watcher = LogWatcher(
+        LOGS_DIR, PROCESSOR_URLS,
+        checkpoints=checkpoints,
+        partition_key=CLUSTER_PARTITION_KEY,
+        members_file=CLUSTER_MEMBERS_FILE,
+        vnodes=CLUSTER_VNODES,
+        members_reload_interval=CLUSTER_RELOAD_INTERVAL,
+    )
     watcher.run()
@@ -1,19 +1,113 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import requests
 import json
-import os
 import time
 from typing import Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+import asyncio
 import logging
 import base64
+import socket
+
+import msgpack
+
+from config import (
+    SPLUNK_HOST,
+    SPLUNK_PORT,
+    SPLUNK_TOKEN,
+    SPLUNK_INDEX,
+    SPLUNK_PASSWORD,
+    SPLUNK_SCHEME,
+    SPLUNK_VERIFY_SSL,
+    HEC_URL,
+    HEC_BATCH_EVENTS,
+    HEC_BATCH_BYTES,
+    HEC_FLUSH_INTERVAL,
+    HEC_MAX_IN_FLIGHT,
+    SPOOL_DIR,
+    SPOOL_SEGMENT_BYTES,
+    SPOOL_MAX_BYTES,
+    SPOOL_FSYNC,
+    SPOOL_RETRY_MAX,
+    GEOIP_DB_PATH,
+    GEOIP_ASN_DB_PATH,
+    GEOIP_CACHE_SIZE,
+    LOGS_DIR,
+    CHECKPOINT_FILE,
+    CHECKPOINT_INTERVAL,
+    INGEST_MODE,
+    INGEST_BATCH_SIZE,
+    INGEST_QUEUE_SIZE,
+    STATS_WINDOW_SECONDS,
+    STATS_WINDOWS,
+    STATS_TOP_K,
+    LIVE_BUFFER_EVENTS,
+    LIVE_FRAME_INTERVAL,
+    LIVE_STATS_INTERVAL,
+    LIVE_MAX_SUBSCRIBERS,
+    RULES_FILE,
+    RULES_RELOAD_INTERVAL,
+    ROLLUP_WINDOW,
+    ROLLUP_MAX_FLOWS,
+    ROLLUP_SAMPLE_UIDS,
+    INTEL_DIR,
+    INTEL_RELOAD_INTERVAL,
+    STORE_DIR,
+    STORE_RETENTION_HOURS,
+    STORE_MAX_BYTES,
+    STORE_FLUSH_INTERVAL,
+    STORE_SEGMENT_EVENTS,
+    STORE_CACHE_COLUMNS,
+    CORRELATION_TTL,
+    CORRELATION_MAX_UIDS,
+    CORRELATION_MAX_RECORDS,
+    DETECTION_ENABLED,
+    SCAN_WINDOW,
+    SCAN_HOST_THRESHOLD,
+    SCAN_PORT_THRESHOLD,
+    SCAN_MAX_SOURCES,
+    BEACON_MIN_EVENTS,
+    BEACON_MIN_INTERVAL,
+    BEACON_MAX_JITTER,
+    BEACON_MAX_PAIRS,
+    DETECTION_COOLDOWN,
+)
+from aggregates import StreamStats
+from checkpoint import CheckpointStore
+from correlation import CorrelationCache
+from detection import Detector
+from columnar import CONN_COLUMNS, ColumnarBatch, ColumnTypeError, enrich_and_encode
+from enrichment import PROCESSOR_VERSION, enrich_event
+from geoip import GeoIPEngine
+from hec_sender import HecSender, encode_event
+from ingest import DirectIngest
+from intel import IntelEngine
+from live import LiveHub
+from log_parser import JsonSchema, LogSchema
+from log_types import LOG_TYPES, LogType, get_log_type, log_type_for
+from metrics import (
+    CONTENT_TYPE,
+    EVENTS_DELIVERED,
+    EVENTS_ENRICHED,
+    EVENTS_FILTERED,
+    EVENTS_PARSED,
+    REGISTRY,
+    log_sampled,
+    stage_cpu,
+)
+from rollup import FlowRollup
+from rules import AGGREGATE, RuleEngine
+from spool import Spool, SpoolFullError, replay
+from store import GROUP_COLUMNS, EventStore, Query
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-app = FastAPI(title="Mini SOC Processor", version="1.0.0")
+app = FastAPI(title="Mini SOC Processor", version=PROCESSOR_VERSION)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,15 +118,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration
-SPLUNK_HOST = os.getenv("SPLUNK_HOST", "splunk")
-SPLUNK_PORT = os.getenv("SPLUNK_PORT", "8088")
-SPLUNK_TOKEN = os.getenv("SPLUNK_TOKEN", "00000000-0000-0000-0000-000000000000")
-SPLUNK_INDEX = os.getenv("SPLUNK_INDEX", "main")
-SPLUNK_PASSWORD = os.getenv("SPLUNK_PASSWORD", "admin")  # For REST fallback
-SPLUNK_SCHEME = os.getenv("SPLUNK_SCHEME", "https")  # http or https
-SPLUNK_VERIFY_SSL = os.getenv("SPLUNK_VERIFY_SSL", "false").lower() in ("1", "true", "yes")
-
 class ZeekEvent(BaseModel):
     """Zeek event data model"""
     ts: Optional[float | str] = None
@@ -64,93 +149,390 @@ class EnrichedEvent(BaseModel):
     sourcetype: str = "zeek_conn_enriched"
     index: str = SPLUNK_INDEX
 
+geoip_engine = GeoIPEngine(GEOIP_DB_PATH, GEOIP_ASN_DB_PATH, cache_size=GEOIP_CACHE_SIZE)
+
 def get_geoip_data(ip: str) -> Dict[str, Any]:
-    """
-    Get GeoIP data for an IP address.
-    For MVP, we'll use a simple mock implementation.
-    In production, you'd use MaxMind GeoIP2 database or similar service.
-    """
-    if ip.startswith("192.168.") or ip.startswith("10.") or ip == "127.0.0.1":
-        return {
-            "country": "Private",
-            "city": "Private",
-            "latitude": None,
-            "longitude": None,
-            "isp": "Private Network"
-        }
-    else:
-        return {
-            "country": "US",
-            "city": "New York",
-            "latitude": 40.7128,
-            "longitude": -74.0060,
-            "isp": "Mock ISP"
-        }
+    """Get GeoIP data for an IP address (cached, shared dict - do not modify)"""
+    return geoip_engine.lookup(ip)
 
 def enrich_zeek_event(event: ZeekEvent) -> Dict[str, Any]:
     """Enrich Zeek event with GeoIP data"""
-    enriched = event.dict()
-    if event.id_orig_h:
-        enriched["orig_geoip"] = get_geoip_data(event.id_orig_h)
-    if event.id_resp_h:
-        enriched["resp_geoip"] = get_geoip_data(event.id_resp_h)
-    enriched["processed_at"] = time.time()
-    enriched["processor_version"] = "1.0.0"
+    with stage_cpu("enrich"):
+        enriched = enrich_event(event.dict(), geoip_engine)
+    EVENTS_ENRICHED.inc("conn")
     return enriched
 
-def send_to_splunk_rest(event_data: Dict[str, Any]) -> bool:
-    """Send enriched event to Splunk via REST API (alternative to HEC)"""
+# Host field for events sent through the REST fallback (HEC sets it from the connection)
+REST_HOST = socket.gethostname()
+
+def send_to_splunk_rest(body: bytes) -> bool:
+    """
+    Send a batch of HEC-formatted events to Splunk via REST API (alternative to HEC).
+    /services/receivers/simple indexes the request body as raw text, so the bare events are
+    posted, grouped by envelope, with sourcetype, index, source and host as query params.
+    """
     try:
         url = f"https://{SPLUNK_HOST}:8089/services/receivers/simple"
         headers = {
             "Authorization": f"Basic {base64.b64encode(f'admin:{SPLUNK_PASSWORD}'.encode()).decode()}",
             "Content-Type": "application/json"
         }
-        event_json = json.dumps(event_data)
-        response = requests.post(url, headers=headers, data=event_json, timeout=10, verify=SPLUNK_VERIFY_SSL)
-        if response.status_code == 200:
-            logger.info("Successfully sent event to Splunk REST")
-            return True
-        else:
-            logger.error(f"Failed to send to Splunk REST: {response.status_code} - {response.text}")
-            return False
+        groups: Dict[tuple, list] = {}
+        for line in body.splitlines():
+            if not line:
+                continue
+            envelope = json.loads(line)
+            key = (envelope.get("sourcetype"), envelope.get("index"), envelope.get("source"))
+            groups.setdefault(key, []).append(json.dumps(envelope["event"], separators=(",", ":")))
+        for (sourcetype, index, source), events in groups.items():
+            params = {"host": REST_HOST, "sourcetype": sourcetype, "index": index, "source": source}
+            response = requests.post(
+                url, headers=headers, data="\n".join(events).encode(),
+                params={key: value for key, value in params.items() if value},
+                timeout=10, verify=SPLUNK_VERIFY_SSL,
+            )
+            if response.status_code != 200:
+                log_sampled(logger, logging.ERROR, "rest_status",
+                            f"Failed to send to Splunk REST: {response.status_code} - {response.text}")
+                return False
+        log_sampled(logger, logging.INFO, "rest_sent", "Successfully sent batch to Splunk REST")
+        return True
     except Exception as e:
-        logger.error(f"Error sending to Splunk REST: {str(e)}")
+        log_sampled(logger, logging.ERROR, "rest_error", f"Error sending to Splunk REST: {str(e)}")
         return False
 
-def send_to_splunk(event_data: Dict[str, Any]) -> bool:
-    """Send enriched event to Splunk via HEC"""
+async def send_to_splunk_rest_async(body: bytes) -> bool:
+    """Run the blocking REST fallback off the event loop"""
+    return await asyncio.to_thread(send_to_splunk_rest, body)
+
+hec_sender = HecSender(
+    url=HEC_URL,
+    token=SPLUNK_TOKEN,
+    index=SPLUNK_INDEX,
+    verify_ssl=SPLUNK_VERIFY_SSL,
+    max_batch_events=HEC_BATCH_EVENTS,
+    max_batch_bytes=HEC_BATCH_BYTES,
+    flush_interval=HEC_FLUSH_INTERVAL,
+    max_in_flight=HEC_MAX_IN_FLIGHT,
+    fallback=send_to_splunk_rest_async,
+)
+
+spool = Spool(SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES, fsync=SPOOL_FSYNC)
+spool_drainer: Optional[asyncio.Task] = None
+rollup_flusher: Optional[asyncio.Task] = None
+intel_watcher: Optional[asyncio.Task] = None
+store_flusher: Optional[asyncio.Task] = None
+detection_flusher: Optional[asyncio.Task] = None
+
+stream_stats = StreamStats(STATS_WINDOW_SECONDS, STATS_WINDOWS, top_k=STATS_TOP_K)
+live_hub = LiveHub(
+    lambda: stream_stats.snapshot(top=10),
+    buffer_size=LIVE_BUFFER_EVENTS,
+    frame_interval=LIVE_FRAME_INTERVAL,
+    stats_interval=LIVE_STATS_INTERVAL,
+    max_subscribers=LIVE_MAX_SUBSCRIBERS,
+)
+
+rollup = FlowRollup(ROLLUP_WINDOW, ROLLUP_MAX_FLOWS, ROLLUP_SAMPLE_UIDS)
+
+event_store: Optional[EventStore] = None
+if STORE_DIR:
+    event_store = EventStore(
+        STORE_DIR,
+        retention_hours=STORE_RETENTION_HOURS,
+        max_bytes=STORE_MAX_BYTES,
+        flush_interval=STORE_FLUSH_INTERVAL,
+        segment_events=STORE_SEGMENT_EVENTS,
+        cache_columns=STORE_CACHE_COLUMNS,
+    )
+
+def observe(log_type: LogType, events: list, payloads: list[bytes], folded: list = ()):
+    """
+    Feed delivered events (and their payloads, in order) to /stats, live subscribers and the
+    event store, and fold the `folded` conn events into flow summaries
+    """
+    stream_stats.add_events(log_type.name, events)
+    live_hub.publish(log_type, events, payloads)
+    if event_store is not None:
+        with stage_cpu("store"):
+            event_store.add(events, payloads, log_type.name)
+    if folded:
+        stream_stats.add_events(log_type.name, folded)
+        rollup.add(folded)
+
+def spool_append(payloads: list[bytes]):
+    with stage_cpu("output"):
+        spool.append(payloads)
+
+async def deliver_to_splunk(payloads: list[bytes], log_type: str = "conn") -> str:
+    """
+    Send encoded events to HEC, spooling them to disk when HEC fails or a backlog exists.
+    Returns "sent", or "spooled" if any were spooled; raises SpoolFullError when the spool
+    cannot take more.
+    """
+    # Only the payloads HEC did not accept are spooled, so a partial failure sends no duplicates
+    failed = await hec_sender.send_encoded_failures(payloads) if spool.is_empty() else payloads
+    if failed:
+        await asyncio.to_thread(spool_append, failed)
+        EVENTS_DELIVERED.inc(log_type, "spooled", amount=len(failed))
+    if len(failed) < len(payloads):
+        EVENTS_DELIVERED.inc(log_type, "sent", amount=len(payloads) - len(failed))
+    return "spooled" if failed else "sent"
+
+async def send_to_splunk(event_data: Dict[str, Any]) -> str:
+    """Send enriched event to Splunk via the batching HEC sender"""
+    return await deliver_to_splunk([hec_sender.encode(event_data)])
+
+async def drain_spool():
+    """Replay spooled events to HEC in order, backing off while Splunk stays unavailable"""
+    await replay(spool, hec_sender.send_encoded_failures, HEC_BATCH_EVENTS, HEC_FLUSH_INTERVAL, SPOOL_RETRY_MAX)
+
+def spool_full_error(e: SpoolFullError) -> HTTPException:
+    logger.error(f"Rejecting events, spool is full: {str(e)}")
+    return HTTPException(status_code=503, detail="Spool full, retry later", headers={"Retry-After": "5"})
+
+rule_engine = RuleEngine(RULES_FILE, RULES_RELOAD_INTERVAL)
+intel_engine = IntelEngine(INTEL_DIR, INTEL_RELOAD_INTERVAL)
+correlation = CorrelationCache(CORRELATION_TTL, CORRELATION_MAX_UIDS, CORRELATION_MAX_RECORDS)
+
+detector: Optional[Detector] = None
+if DETECTION_ENABLED:
+    detector = Detector(
+        scan_window=SCAN_WINDOW,
+        scan_hosts=SCAN_HOST_THRESHOLD,
+        scan_ports=SCAN_PORT_THRESHOLD,
+        max_sources=SCAN_MAX_SOURCES,
+        beacon_min_events=BEACON_MIN_EVENTS,
+        beacon_min_interval=BEACON_MIN_INTERVAL,
+        beacon_max_jitter=BEACON_MAX_JITTER,
+        max_pairs=BEACON_MAX_PAIRS,
+        cooldown=DETECTION_COOLDOWN,
+    )
+
+def record_events(log_type: LogType, events: list):
+    """
+    Feed a batch, before filtering, to the correlation cache and, for conn events, to
+    scan and beacon detection
+    """
+    correlation.record(log_type.name, events)
+    if detector is not None and log_type.name == "conn":
+        with stage_cpu("detect"):
+            detector.add(events)
+
+def encode_batch(batch: ColumnarBatch, log_type: LogType, index: str) -> list[bytes]:
+    """
+    Enrich and encode a columnar batch, tagging events that match threat-intel indicators
+    and joining conn events to their application-layer records
+    """
+    # Fragments by the event key they add
+    extras = {"intel": intel_engine.index.match_columns(
+        batch.columns, batch.size, [field for field, _ in log_type.ip_fields]
+    )}
+    if log_type.name == "conn" and "uid" in batch.columns:
+        services = batch.columns.get("service") or [None] * batch.size
+        extras["correlated"] = correlation.fragments(batch.columns["uid"], services)
+    extras = {key: extra for key, extra in extras.items() if extra is not None}
+    found = list(extras.values())
+    extra = list(map("".join, zip(*found))) if len(found) > 1 else found[0] if found else None
+    return enrich_and_encode(batch, geoip_engine, log_type, index, hec_sender.source, extra, list(extras))
+
+def annotate_event(event: Dict[str, Any], log_type: LogType) -> Dict[str, Any]:
+    """Add threat-intel matches and, to conn events, correlated records to an enriched event, in place"""
+    tags = intel_engine.index.match_event(event, [field for field, _ in log_type.ip_fields])
+    if tags:
+        event["intel"] = tags
+    if log_type.name == "conn":
+        correlation.join(event)
+    return event
+
+def route_events(log_type: LogType, events: list) -> tuple[list[tuple[str, Optional[list[int]]]], list[int]]:
+    """
+    Apply the filtering rules ahead of enrichment: positions of the events to keep, grouped
+    by target index, and positions of the events to fold into flow summaries. None stands
+    for every event, so unfiltered batches are not copied.
+    """
+    rule_set = rule_engine.current()
+    if rule_set is None:
+        return [(hec_sender.index, None)], []
+    with stage_cpu("filter"):
+        groups, dropped = rule_set.route(log_type.name, events, hec_sender.index)
+    if dropped:
+        EVENTS_FILTERED.inc(log_type.name, amount=dropped)
+    aggregated = groups.pop(AGGREGATE, [])
+    if not dropped and not aggregated and list(groups) == [hec_sender.index]:
+        return [(hec_sender.index, None)], []
+    return list(groups.items()), aggregated
+
+def encode_groups(batch: ColumnarBatch, events: list, log_type: LogType,
+                  accepted: list, folded: list) -> list[bytes]:
+    """
+    Filter a batch, then enrich and encode what is kept. Kept events go to `accepted` and
+    events to aggregate to `folded`.
+    """
+    payloads = []
+    record_events(log_type, events)
+    groups, aggregated = route_events(log_type, events)
+    for index, positions in groups:
+        group = batch if positions is None else batch.take(positions)
+        with stage_cpu("enrich"):
+            payloads.extend(encode_batch(group, log_type, index))
+        accepted.extend(events if positions is None else [events[i] for i in positions])
+    folded.extend(events[i] for i in aggregated)
+    EVENTS_ENRICHED.inc(log_type.name, amount=len(payloads))
+    return payloads
+
+def encode_records(records: list[Dict[str, Any]], schema: LogSchema,
+                   lines: Optional[list[str]] = None) -> list[bytes]:
+    """
+    Enrich and encode records from our own parser, which are already typed. Records from
+    JSON logs are shipped as the `lines` they were decoded from.
+    """
+    log_type = log_type_for(schema)
+    if isinstance(schema, JsonSchema):
+        batch = ColumnarBatch(records, log_type.batch_columns(records), validate=False)
+        batch.raw = lines
+    else:
+        batch = ColumnarBatch(records, log_type.schema_columns(schema), validate=False)
+    kept: list = []
+    folded: list = []
+    payloads = encode_groups(batch, records, log_type, kept, folded)
+    # Direct ingest retries delivery without re-encoding, so each batch is counted once here
+    observe(log_type, kept, payloads, folded)
+    return payloads
+
+async def deliver_generated(log_type: LogType, events: list[Dict[str, Any]]) -> bool:
+    """
+    Enrich and send events the processor made itself (flow summaries, detections).
+    Returns False, having sent nothing, if the spool is full.
+    """
+    with stage_cpu("enrich"):
+        batch = ColumnarBatch(events, log_type.columns, validate=False)
+        payloads = encode_batch(batch, log_type, hec_sender.index)
+    EVENTS_ENRICHED.inc(log_type.name, amount=len(payloads))
     try:
-        url = f"{SPLUNK_SCHEME}://{SPLUNK_HOST}:{SPLUNK_PORT}/services/collector/event"
-        headers = {
-            "Authorization": f"Splunk {SPLUNK_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "event": event_data,
-            "source": "zeek_processor",
-            "sourcetype": "zeek_conn_enriched",
-            "index": SPLUNK_INDEX
-        }
-        response = requests.post(url, headers=headers, json=payload, timeout=10, verify=SPLUNK_VERIFY_SSL)
-        if response.status_code == 200:
-            logger.info("Successfully sent event to Splunk HEC")
-            return True
-        else:
-            logger.error(f"Failed to send to Splunk HEC: {response.status_code} - {response.text}")
-            logger.info("Trying REST API as fallback...")
-            return send_to_splunk_rest(event_data)
-    except Exception as e:
-        logger.error(f"Error sending to Splunk HEC: {str(e)}")
-        logger.info("Trying REST API as fallback...")
-        return send_to_splunk_rest(event_data)
+        await deliver_to_splunk(payloads, log_type.name)
+    except SpoolFullError as e:
+        log_sampled(logger, logging.ERROR, f"{log_type.name}_spool_full",
+                    f"Holding {log_type.name} events, spool is full: {str(e)}")
+        return False
+    live_hub.publish(log_type, events, payloads)
+    if event_store is not None:
+        event_store.add(events, payloads, log_type.name)
+    return True
+
+async def deliver_summaries(summaries: list[Dict[str, Any]]):
+    """Enrich and send flow summaries; if the spool is full they are retried on the next tick"""
+    if not await deliver_generated(LOG_TYPES["conn_summary"], summaries):
+        rollup.requeue(summaries)
+
+async def deliver_detections(detections: list[Dict[str, Any]]):
+    """Enrich and send detections; if the spool is full they are retried on the next tick"""
+    log_type = LOG_TYPES["detection"]
+    if await deliver_generated(log_type, detections):
+        stream_stats.add_events(log_type.name, detections)
+    else:
+        detector.requeue(detections)
+
+async def flush_rollup():
+    """Send flow summaries as their windows end"""
+    while True:
+        await asyncio.sleep(1.0)
+        summaries = rollup.expired()
+        if summaries:
+            await deliver_summaries(summaries)
+
+async def flush_detections():
+    """Send detections shortly after they are made"""
+    while True:
+        await asyncio.sleep(1.0)
+        detections = detector.ready()
+        if detections:
+            await deliver_detections(detections)
+
+direct_ingest: Optional[DirectIngest] = None
+if INGEST_MODE == "direct":
+    direct_ingest = DirectIngest(
+        LOGS_DIR,
+        encode=encode_records,
+        deliver=deliver_to_splunk,
+        checkpoints=CheckpointStore(CHECKPOINT_FILE, min_interval=CHECKPOINT_INTERVAL),
+        batch_size=INGEST_BATCH_SIZE,
+        queue_size=INGEST_QUEUE_SIZE,
+    )
+
+def queue_depths() -> Dict[tuple, float]:
+    hec = hec_sender.stats()
+    depths = {
+        ("hec_buffer",): hec["buffered_events"],
+        ("hec_in_flight",): hec["in_flight"],
+        ("live_buffer",): live_hub.stats()["buffered_events"],
+    }
+    if direct_ingest is not None:
+        depths[("ingest_parsed",)] = direct_ingest.parsed.qsize()
+        depths[("ingest_encoded",)] = direct_ingest.encoded.qsize()
+    return depths
+
+def geoip_cache_counter(index: int):
+    return lambda: {(cache,): counts[index] for cache, counts in geoip_engine.cache_counters().items()}
+
+REGISTRY.callback("processor_queue_depth", "Items waiting in each in-process queue", queue_depths, ["queue"])
+REGISTRY.callback("spool_pending_bytes", "Bytes spooled to disk and not yet replayed to HEC", spool.pending_bytes)
+REGISTRY.callback("geoip_cache_hits_total", "GeoIP cache hits", geoip_cache_counter(0), ["cache"], kind="counter")
+REGISTRY.callback("geoip_cache_misses_total", "GeoIP cache misses", geoip_cache_counter(1), ["cache"], kind="counter")
+REGISTRY.callback("hec_events_per_second", "Average events sent to HEC per second since startup",
+                  lambda: hec_sender.stats()["events_per_sec"])
+if direct_ingest is not None:
+    REGISTRY.callback(
+        "watcher_lag_bytes", "Bytes between each tailed file's read position and its EOF",
+        lambda: {(key,): lag for key, lag in direct_ingest.lag().items()}, ["file"],
+    )
+
+@app.on_event("startup")
+async def startup():
+    global spool_drainer, rollup_flusher, intel_watcher, store_flusher, detection_flusher
+    await intel_engine.reload()
+    intel_watcher = asyncio.create_task(intel_engine.watch())
+    await hec_sender.start()
+    spool_drainer = asyncio.create_task(drain_spool())
+    rollup_flusher = asyncio.create_task(flush_rollup())
+    if detector is not None:
+        detection_flusher = asyncio.create_task(flush_detections())
+    if event_store is not None:
+        store_flusher = asyncio.create_task(event_store.run())
+    if direct_ingest is not None:
+        await direct_ingest.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if direct_ingest is not None:
+        await direct_ingest.stop()
+    if spool_drainer is not None:
+        spool_drainer.cancel()
+    if rollup_flusher is not None:
+        rollup_flusher.cancel()
+    if intel_watcher is not None:
+        intel_watcher.cancel()
+    summaries = rollup.drain()
+    if summaries:
+        await deliver_summaries(summaries)
+    if detection_flusher is not None:
+        detection_flusher.cancel()
+        detections = detector.ready()
+        if detections:
+            await deliver_detections(detections)
+    if store_flusher is not None:
+        store_flusher.cancel()
+        await event_store.flush()
+    await hec_sender.stop()
+    spool.close()
+    geoip_engine.close()
 
 @app.get("/")
 async def root():
     return {
         "status": "healthy",
         "service": "Mini SOC Processor",
-        "version": "1.0.0",
+        "version": PROCESSOR_VERSION,
         "splunk_host": SPLUNK_HOST,
         "splunk_port": SPLUNK_PORT,
         "splunk_scheme": SPLUNK_SCHEME
@@ -158,10 +540,24 @@ async def root():
 
 @app.post("/process/zeek")
 async def process_zeek_event(event: ZeekEvent):
+    EVENTS_PARSED.inc("conn")
     try:
-        enriched_event = enrich_zeek_event(event)
-        success = send_to_splunk(enriched_event)
-        if success:
+        record_events(LOG_TYPES["conn"], [event.dict()])
+        rule_set = rule_engine.current()
+        index = hec_sender.index
+        if rule_set is not None:
+            index = rule_set.target("conn", event.dict(), hec_sender.index)
+        if index is None:
+            EVENTS_FILTERED.inc("conn")
+            return {"status": "filtered", "message": "Event dropped by filtering rules"}
+        if index == AGGREGATE:
+            observe(LOG_TYPES["conn"], [], [], [event.dict()])
+            return {"status": "aggregated", "message": "Event folded into a flow summary"}
+        enriched_event = annotate_event(enrich_zeek_event(event), LOG_TYPES["conn"])
+        payload = encode_event(enriched_event, index, hec_sender.source, hec_sender.sourcetype)
+        delivery = await deliver_to_splunk([payload])
+        observe(LOG_TYPES["conn"], [enriched_event], [payload])
+        if delivery == "sent":
             return {
                 "status": "success",
                 "message": "Event processed and sent to Splunk",
@@ -169,37 +565,202 @@ async def process_zeek_event(event: ZeekEvent):
             }
         else:
             return {
-                "status": "enriched_only",
-                "message": "Event enriched but failed to send to Splunk",
+                "status": "spooled",
+                "message": "Event enriched and spooled until Splunk is reachable",
                 "enriched_event": enriched_event,
-                "splunk_status": "failed"
+                "splunk_status": "spooled"
             }
+    except SpoolFullError as e:
+        raise spool_full_error(e)
     except Exception as e:
         logger.error(f"Error processing event: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
-@app.post("/process/batch")
-async def process_zeek_batch(events: list[ZeekEvent]):
+def resolve_log_type(name: str) -> LogType:
+    try:
+        return get_log_type(name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def encode_batch_columnar(raw_events: list, results: list, log_type: LogType, accepted: list,
+                          folded: list) -> list[bytes]:
+    """
+    Fast path: enrich and encode a batch column-wise, without per-event models. Raises
+    ColumnTypeError, before anything is filtered or encoded, if the batch needs coercion.
+    """
+    with stage_cpu("enrich"):
+        columns = CONN_COLUMNS if log_type.name == "conn" else log_type.batch_columns(raw_events)
+        batch = ColumnarBatch(raw_events, columns)
+    payloads = encode_groups(batch, raw_events, log_type, accepted, folded)
+    status = dict.fromkeys(map(id, accepted), "success")
+    status.update(dict.fromkeys(map(id, folded), "aggregated"))
+    results.extend(
+        {"status": status.get(id(event), "filtered"), "uid": event.get("uid")}
+        for event in raw_events
+    )
+    return payloads
+
+def encode_batch_per_event(raw_events: list, results: list, log_type: LogType, accepted: list,
+                           folded: list) -> list[bytes]:
+    """
+    Slow path: validate and coerce each conn event with ZeekEvent; other types are passed
+    through. An event that fails validation is marked failed and the rest of the batch is
+    still processed. Events that were encoded are appended to `accepted`, those to
+    aggregate to `folded`.
+    """
+    events = []
+    # Position in `raw_events` of each valid event, and the results of the invalid ones
+    origins = []
+    invalid = {}
+    with stage_cpu("enrich"):
+        for position, raw_event in enumerate(raw_events):
+            try:
+                if log_type.name == "conn":
+                    events.append(ZeekEvent(**raw_event).dict())
+                elif isinstance(raw_event, dict):
+                    events.append(dict(raw_event))
+                else:
+                    raise TypeError("event must be an object")
+                origins.append(position)
+            except (TypeError, ValidationError) as e:
+                uid = raw_event.get("uid") if isinstance(raw_event, dict) else None
+                invalid[position] = {"status": "failed", "uid": uid, "error": f"Invalid event: {str(e)}"}
+
+    statuses = [{"status": "filtered", "uid": event.get("uid")} for event in events]
+    payloads = []
+    record_events(log_type, events)
+    groups, aggregated = route_events(log_type, events)
+    for i in aggregated:
+        folded.append(events[i])
+        statuses[i] = {"status": "aggregated", "uid": events[i].get("uid")}
+    for index, positions in groups:
+        with stage_cpu("enrich"):
+            for i in range(len(events)) if positions is None else positions:
+                try:
+                    enriched = annotate_event(enrich_event(events[i], geoip_engine, log_type.ip_fields), log_type)
+                    payloads.append(encode_event(enriched, index, hec_sender.source, log_type.sourcetype))
+                    accepted.append(enriched)
+                    statuses[i] = {"status": "success", "uid": events[i].get("uid")}
+                except Exception as e:
+                    statuses[i] = {"status": "failed", "uid": events[i].get("uid"), "error": str(e)}
+    by_position = dict(zip(origins, statuses))
+    by_position.update(invalid)
+    results.extend(by_position[position] for position in range(len(raw_events)))
+    EVENTS_ENRICHED.inc(log_type.name, amount=len(payloads))
+    return payloads
+
+@app.post("/process/batch", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"type": "array", "items": ZeekEvent.model_json_schema()}}},
+    }
+})
+async def process_zeek_batch(request: Request, log_type: str = "conn"):
+    """Process a batch of events of one log type (the Zeek #path: conn, dns, http, ...)"""
+    zeek_log_type = resolve_log_type(log_type)
+    body = await request.body()
+    try:
+        with stage_cpu("parse"):
+            raw_events = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    if not isinstance(raw_events, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of events")
+    EVENTS_PARSED.inc(zeek_log_type.name, amount=len(raw_events))
+
     results = []
-    success_count = 0
-    for event in events:
+    accepted = []
+    folded = []
+    try:
+        payloads = encode_batch_columnar(raw_events, results, zeek_log_type, accepted, folded)
+    except ColumnTypeError:
+        payloads = encode_batch_per_event(raw_events, results, zeek_log_type, accepted, folded)
+
+    if payloads:
         try:
-            enriched_event = enrich_zeek_event(event)
-            success = send_to_splunk(enriched_event)
-            if success:
-                success_count += 1
-                results.append({"status": "success", "uid": event.uid})
-            else:
-                results.append({"status": "failed", "uid": event.uid, "error": "Splunk send failed"})
-        except Exception as e:
-            results.append({"status": "failed", "uid": event.uid, "error": str(e)})
+            delivery = await deliver_to_splunk(payloads, zeek_log_type.name)
+        except SpoolFullError as e:
+            raise spool_full_error(e)
+        if delivery == "spooled":
+            for result in results:
+                if result["status"] == "success":
+                    result["status"] = "spooled"
+    # Observed only once delivered, so a batch rejected with 503 and resent is not counted twice
+    observe(zeek_log_type, accepted, payloads, folded)
+
+    counts = dict.fromkeys(("success", "spooled", "filtered", "aggregated"), 0)
+    for result in results:
+        if result["status"] in counts:
+            counts[result["status"]] += 1
     return {
-        "total_events": len(events),
-        "successful": success_count,
-        "failed": len(events) - success_count,
+        "total_events": len(raw_events),
+        "successful": counts["success"],
+        "spooled": counts["spooled"],
+        "filtered": counts["filtered"],
+        "aggregated": counts["aggregated"],
+        "failed": len(raw_events) - sum(counts.values()),
         "results": results
     }
 
+@app.post("/process/stream")
+async def process_zeek_stream(request: Request, log_type: str = "conn"):
+    """
+    Ingest a stream of msgpack-encoded events of one log type from a remote sensor. The body
+    is a sequence of msgpack maps (or arrays of maps) and is processed in batches as it arrives.
+    """
+    zeek_log_type = resolve_log_type(log_type)
+    unpacker = msgpack.Unpacker(raw=False)
+    counts = {"sent": 0, "spooled": 0, "filtered": 0, "aggregated": 0}
+    records: list = []
+
+    async def flush():
+        nonlocal records
+        if not records:
+            return
+        results: list = []
+        accepted: list = []
+        folded: list = []
+        try:
+            payloads = encode_batch_columnar(records, results, zeek_log_type, accepted, folded)
+        except ColumnTypeError:
+            payloads = encode_batch_per_event(records, results, zeek_log_type, accepted, folded)
+        counts["filtered"] += sum(1 for result in results if result["status"] == "filtered")
+        if payloads:
+            try:
+                counts[await deliver_to_splunk(payloads, zeek_log_type.name)] += len(payloads)
+            except SpoolFullError as e:
+                raise spool_full_error(e)
+        counts["aggregated"] += len(folded)
+        observe(zeek_log_type, accepted, payloads, folded)
+        records = []
+
+    try:
+        async for chunk in request.stream():
+            with stage_cpu("parse"):
+                unpacker.feed(chunk)
+                items = list(unpacker)
+            for item in items:
+                if isinstance(item, list):
+                    records.extend(item)
+                    EVENTS_PARSED.inc(zeek_log_type.name, amount=len(item))
+                else:
+                    records.append(item)
+                    EVENTS_PARSED.inc(zeek_log_type.name)
+                if len(records) >= INGEST_BATCH_SIZE:
+                    await flush()
+    except (msgpack.UnpackException, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid msgpack stream: {str(e)}")
+    await flush()
+
+    return {
+        "total_events": sum(counts.values()),
+        "successful": counts["sent"],
+        "spooled": counts["spooled"],
+        "filtered": counts["filtered"],
+        "aggregated": counts["aggregated"],
+        "failed": 0
+    }
+
 @app.get("/test/enrich")
 async def test_enrichment():
     """Test endpoint to verify enrichment functionality"""
@@ -222,6 +783,87 @@ async def test_enrichment():
         "enriched_event": enriched_event
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return Response(content=REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+@app.get("/stats")
+async def stats(window: Optional[int] = None, top: int = 10):
+    """
+    Streaming aggregates for the dashboard: totals since startup, plus connections, bytes,
+    packets, top talkers and distinct IPs over the last `window` seconds (default: all kept)
+    """
+    if window is not None and window <= 0:
+        raise HTTPException(status_code=422, detail="window must be positive")
+    windows = -(-window // STATS_WINDOW_SECONDS) if window else None
+    return stream_stats.snapshot(windows, top=max(1, min(top, STATS_TOP_K)))
+
+def split_param(value: Optional[str]) -> Optional[set]:
+    """A comma-separated query parameter as a set, or None when absent or empty"""
+    if not value:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()} or None
+
+def split_log_types(value: Optional[str]) -> Optional[set]:
+    log_types = split_param(value)
+    if log_types is None:
+        return None
+    return {resolve_log_type(name).name for name in log_types}
+
+def split_ports(value: Optional[str]) -> Optional[set]:
+    ports = split_param(value)
+    if ports is None:
+        return None
+    try:
+        return {int(port) for port in ports}
+    except ValueError:
+        raise HTTPException(status_code=422, detail="port must be a comma-separated list of integers")
+
+@app.get("/live")
+async def live(log_type: Optional[str] = None, ip: Optional[str] = None, port: Optional[str] = None):
+    """
+    Server-Sent Events stream of enriched events and aggregate updates. `log_type`, `ip` and
+    `port` take comma-separated values and limit the events sent to those that match.
+    """
+    log_types = split_log_types(log_type)
+    ips, ports = split_param(ip), split_ports(port)
+    if live_hub.full():
+        raise HTTPException(status_code=503, detail="Too many live subscribers", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        live_hub.stream(log_types, ips, ports),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/query")
+async def query(start: Optional[float] = None, end: Optional[float] = None, last: float = 3600,
+                ip: Optional[str] = None, port: Optional[str] = None, proto: Optional[str] = None,
+                log_type: Optional[str] = None, group_by: Optional[str] = None, limit: int = 100):
+    """
+    Events from the local event store between `start` and `end` (epoch seconds; default the
+    `last` seconds up to now). `ip`, `port`, `proto` and `log_type` take comma-separated values
+    and match either side of a connection. Without `group_by`, the newest `limit` events are
+    streamed as newline-delimited JSON; with it, the `limit` largest counts per distinct value
+    of those comma-separated columns are returned.
+    """
+    if event_store is None:
+        raise HTTPException(status_code=404, detail="Event store is disabled, set STORE_DIR")
+    if not 1 <= limit <= 10000:
+        raise HTTPException(status_code=422, detail="limit must be between 1 and 10000")
+    end = time.time() if end is None else end
+    start = end - last if start is None else start
+    protos = split_param(proto)
+    request = Query(start, end, split_param(ip), split_ports(port),
+                    {value.lower() for value in protos} if protos else None, split_log_types(log_type))
+    if group_by is None:
+        return StreamingResponse(event_store.events(request, limit), media_type="application/x-ndjson")
+    columns = [name.strip() for name in group_by.split(",") if name.strip()]
+    invalid = [name for name in columns if name not in GROUP_COLUMNS]
+    if invalid or not columns:
+        raise HTTPException(status_code=422, detail=f"group_by takes columns from: {', '.join(GROUP_COLUMNS)}")
+    return await asyncio.to_thread(event_store.group, request, columns, limit)
+
 @app.get("/health")
 async def health_check():
     try:
@@ -235,7 +877,18 @@ async def health_check():
         "status": "healthy",
         "timestamp": time.time(),
         "splunk": splunk_status,
-        "version": "1.0.0"
+        "hec": hec_sender.stats(),
+        "spool": spool.stats(),
+        "geoip": geoip_engine.stats(),
+        "ingest": direct_ingest.stats() if direct_ingest is not None else {"mode": INGEST_MODE},
+        "live": live_hub.stats(),
+        "rules": rule_engine.stats(),
+        "rollup": rollup.stats(),
+        "intel": intel_engine.stats(),
+        "correlation": correlation.stats(),
+        "detection": detector.stats() if detector is not None else None,
+        "store": event_store.stats() if event_store is not None else None,
+        "version": PROCESSOR_VERSION
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+"""
+Metrics
+In-process counters, gauges and histograms rendered in the Prometheus text format, plus
+per-stage CPU accounting and sampled logging for hot paths.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+Labels = Tuple[str, ...]
+
+# Latency buckets in seconds and size buckets in events
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+        # Updated from worker threads (such as the cluster senders) as well as the event loop
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for labels, value in list(self.values.items()):
+            yield self.name, labels, value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic total, e.g. events_parsed_total{log_type="dns"}"""
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter read from a callback at scrape time, for values kept elsewhere"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 callback: Callable[[], Union[float, Dict[Labels, float]]], kind: str = "gauge"):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield self.name, labels, value
+
+
+class Histogram(_Metric):
+    """Cumulative buckets with _sum and _count, per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, *labels: str, value: float):
+        with self._lock:
+            counts = self.counts.get(labels)
+            if counts is None:
+                counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+                self.sums[labels] = 0.0
+            counts[bisect_left(self.buckets, value)] += 1
+            self.sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.label_names + ("le",)
+        with self._lock:
+            snapshot = [(labels, list(counts), self.sums[labels]) for labels, counts in self.counts.items()]
+        for labels, counts, total_sum in snapshot:
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {total}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{label_text} {total}")
+        return lines
+
+
+class Registry:
+    """The metrics of one process, in registration order"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, callback: Callable, labels: Sequence[str] = (),
+                 kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labels, callback, kind))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Counters shared by the stages that parse, enrich and deliver events
+EVENTS_PARSED = REGISTRY.counter("zeek_events_parsed_total", "Events parsed or decoded, by log type", ["log_type"])
+EVENTS_ENRICHED = REGISTRY.counter("zeek_events_enriched_total", "Events enriched and encoded for HEC, by log type", ["log_type"])
+EVENTS_FILTERED = REGISTRY.counter(
+    "zeek_events_filtered_total", "Events dropped or sampled out by filtering rules, by log type", ["log_type"]
+)
+EVENTS_DELIVERED = REGISTRY.counter(
+    "zeek_events_delivered_total", "Events handed to Splunk, by log type and outcome (sent or spooled)",
+    ["log_type", "status"],
+)
+STAGE_CPU = REGISTRY.counter("processor_stage_cpu_seconds_total", "CPU time spent in each processing stage", ["stage"])
+
+
+@contextmanager
+def stage_cpu(stage: str):
+    """Charge the CPU time of the enclosed (synchronous) block to a stage"""
+    started = time.thread_time()
+    try:
+        yield
+    finally:
+        STAGE_CPU.inc(stage, amount=time.thread_time() - started)
+
+
+_sampled: Dict[str, Tuple[float, int]] = {}
+
+
+def log_sampled(logger: logging.Logger, level: int, key: str, message: str, interval: float = 10.0):
+    """
+    Log a message at most once per interval for a given key. The next message that gets
+    through reports how many were suppressed in between.
+    """
+    now = time.monotonic()
+    next_at, suppressed = _sampled.get(key, (0.0, 0))
+    if now < next_at:
+        _sampled[key] = (next_at, suppressed + 1)
+        return
+    _sampled[key] = (now + interval, 0)
+    if suppressed:
+        message = f"{message} ({suppressed} similar messages suppressed)"
+    logger.log(level, message)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a background thread, for processes without their own HTTP server"""
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
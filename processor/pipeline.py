@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Multi-core Processing Pipeline
+Splits Zeek log files into byte ranges, parses and enriches them in a pool of worker
+processes, and batches the results to Splunk HEC from a single output stage.
+"""
+
+import argparse
+import asyncio
+import logging
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    GEOIP_ASN_DB_PATH,
+    GEOIP_CACHE_SIZE,
+    GEOIP_DB_PATH,
+    HEC_BATCH_BYTES,
+    HEC_BATCH_EVENTS,
+    HEC_FLUSH_INTERVAL,
+    HEC_MAX_IN_FLIGHT,
+    HEC_URL,
+    INTEL_DIR,
+    PIPELINE_CHUNK_BYTES,
+    PIPELINE_MAX_PENDING,
+    PIPELINE_SPOOL_DIR,
+    PIPELINE_WORKERS,
+    ROLLUP_MAX_FLOWS,
+    ROLLUP_SAMPLE_UIDS,
+    RULES_FILE,
+    SPLUNK_INDEX,
+    SPLUNK_TOKEN,
+    SPLUNK_VERIFY_SSL,
+    SPOOL_FSYNC,
+    SPOOL_MAX_BYTES,
+    SPOOL_RETRY_MAX,
+    SPOOL_SEGMENT_BYTES,
+)
+from enrichment import enrich_event
+from geoip import GeoIPEngine
+from hec_sender import HecSender, encode_event
+from intel import IntelIndex, load_index
+from log_parser import ZeekSchema, read_zeek_header
+from log_types import LOG_TYPES, log_type_for
+from rollup import FlowRollup
+from rules import AGGREGATE, RuleSet, load_rules
+from spool import Spool, SpoolFullError, replay
+
+logger = logging.getLogger(__name__)
+
+Range = Tuple[int, int]
+
+# Per-process state, set up once by _init_worker
+_geoip: Optional[GeoIPEngine] = None
+_envelope: Tuple[str, str] = (SPLUNK_INDEX, "zeek_processor")
+_rules: Optional[RuleSet] = None
+_intel: IntelIndex = IntelIndex()
+
+
+def split_file(path: str, chunk_bytes: int) -> Tuple[Optional[ZeekSchema], List[Range]]:
+    """
+    Reader stage: compile the file's schema and cut its data section into byte ranges of
+    roughly chunk_bytes that end on line boundaries. A trailing partial line is left out.
+    """
+    with open(path, "rb") as f:
+        schema, start = read_zeek_header(f)
+        size = os.fstat(f.fileno()).st_size
+        if schema is None or size <= start:
+            return schema, []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            last = mm.rfind(b"\n") + 1
+            ranges: List[Range] = []
+            while start < last:
+                end = min(start + chunk_bytes, last)
+                if end < last:
+                    end = mm.find(b"\n", end - 1) + 1
+                ranges.append((start, end))
+                start = end
+    return schema, ranges
+
+
+def _init_worker(city_db_path: str, asn_db_path: str, cache_size: int, envelope: Tuple[str, str],
+                 rules_file: str, intel_dir: str):
+    global _geoip, _envelope, _rules, _intel
+    # Each worker maps the GeoIP databases itself; the pages are shared through the page cache
+    _geoip = GeoIPEngine(city_db_path, asn_db_path, cache_size=cache_size)
+    _envelope = envelope
+    _rules = load_rules(rules_file)
+    _intel = load_index(intel_dir)
+
+
+def process_range(path: str, start: int, end: int, schema: ZeekSchema) -> List[bytes]:
+    """
+    Worker stage: parse, enrich and HEC-encode one byte range. Only the path and offsets
+    cross the process boundary; the worker reads the bytes from its own mapping of the file.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", errors="replace")
+    index, source = _envelope
+    log_type = log_type_for(schema)
+    sourcetype, ip_fields = log_type.sourcetype, log_type.ip_fields
+    intel_fields = [field for field, _ in ip_fields]
+    parse = schema.parse
+    payloads: List[bytes] = []
+    rollup: Optional[FlowRollup] = None
+    for line in text.splitlines():
+        if not line or line[0] == "#":
+            continue
+        try:
+            event = parse(line)
+        except (ValueError, TypeError):
+            continue
+        if event is None:
+            continue
+        target = index
+        if _rules is not None:
+            target = _rules.target(log_type.name, event, index)
+            if target is None:
+                continue
+            if target == AGGREGATE:
+                # Flows are folded within this range; there is no later batch to carry them over to
+                if rollup is None:
+                    rollup = FlowRollup(max_flows=ROLLUP_MAX_FLOWS, sample_uids=ROLLUP_SAMPLE_UIDS)
+                rollup.add([event])
+                continue
+        enriched = enrich_event(event, _geoip, ip_fields)
+        tags = _intel.match_event(enriched, intel_fields)
+        if tags:
+            enriched["intel"] = tags
+        payloads.append(encode_event(enriched, target, source, sourcetype))
+    if rollup is not None:
+        summary_type = LOG_TYPES["conn_summary"]
+        for summary in rollup.drain():
+            enriched = enrich_event(summary, _geoip, summary_type.ip_fields)
+            payloads.append(encode_event(enriched, index, source, summary_type.sourcetype))
+    return payloads
+
+
+class Pipeline:
+    """
+    Reader -> process pool -> HEC output.
+
+    At most `max_pending` ranges are queued to the pool and at most `max_pending`
+    finished ranges wait on the output stage, which bounds memory. With no sender the
+    output is discarded, which is useful for measuring parse/enrich throughput. Each
+    worker loads the filtering rules in `rules_file` and the threat-intel feeds in
+    `intel_dir` once, at start.
+
+    With a `spool`, payloads HEC does not accept are spooled and replayed while the
+    pipeline runs, as in the processor; a full spool stalls the output stage, and with it
+    the reader, until it drains.
+    """
+
+    def __init__(self, workers: int = PIPELINE_WORKERS, chunk_bytes: int = PIPELINE_CHUNK_BYTES,
+                 max_pending: int = PIPELINE_MAX_PENDING, sender: Optional[HecSender] = None,
+                 rules_file: str = RULES_FILE, intel_dir: str = INTEL_DIR, spool: Optional[Spool] = None):
+        self.workers = max(1, workers)
+        self.rules_file = rules_file
+        self.intel_dir = intel_dir
+        self.chunk_bytes = chunk_bytes
+        self.max_pending = max_pending or 2 * self.workers
+        self.sender = sender
+        self.spool = spool
+        self.events = 0
+        self.events_failed = 0
+        self.events_spooled = 0
+        self.bytes_read = 0
+        self.ranges = 0
+
+    async def _deliver(self, payloads: List[bytes]):
+        if self.sender is None:
+            self.events += len(payloads)
+            return
+        if self.spool is None:
+            failed = await self.sender.send_encoded_failures(payloads)
+            self.events += len(payloads) - len(failed)
+            self.events_failed += len(failed)
+            return
+        delay = 1.0
+        while True:
+            # Behind a backlog, events are spooled so they reach HEC in order
+            failed = await self.sender.send_encoded_failures(payloads) if self.spool.is_empty() else payloads
+            self.events += len(payloads) - len(failed)
+            if not failed:
+                return
+            try:
+                await asyncio.to_thread(self.spool.append, failed)
+            except SpoolFullError:
+                logger.warning(f"Spool is full, pausing output for {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, SPOOL_RETRY_MAX)
+                payloads = failed
+                continue
+            self.events_spooled += len(failed)
+            return
+
+    async def _flush_spool(self):
+        """
+        One last pass over the spool once the files are done. Refused records are appended
+        again before the read is committed, so they stay (in the spool) for the next run.
+        """
+        while True:
+            records, position = await asyncio.to_thread(self.spool.read, HEC_BATCH_EVENTS)
+            if not records:
+                return
+            failed = await self.sender.send_encoded_failures(records)
+            if len(failed) == len(records):
+                return
+            try:
+                if failed:
+                    await asyncio.to_thread(self.spool.append, failed)
+            except SpoolFullError:
+                return
+            await asyncio.to_thread(self.spool.commit, position)
+            if failed:
+                return
+
+    async def run(self, paths: List[str]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        pending: set = set()
+        deliveries: set = set()
+
+        async def collect(return_when):
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            for future in done:
+                task = asyncio.create_task(self._deliver(future.result()))
+                deliveries.add(task)
+                task.add_done_callback(deliveries.discard)
+            while len(deliveries) >= self.max_pending:
+                await asyncio.wait(deliveries, return_when=asyncio.FIRST_COMPLETED)
+
+        load_rules(self.rules_file)  # fail here, not in every worker, if the rules are invalid
+        envelope = (SPLUNK_INDEX, "zeek_processor")
+        if self.sender is not None:
+            envelope = (self.sender.index, self.sender.source)
+        replayer = None
+        if self.sender is not None and self.spool is not None:
+            # Also replays what an earlier run left in the spool
+            replayer = asyncio.create_task(replay(
+                self.spool, self.sender.send_encoded_failures, HEC_BATCH_EVENTS, HEC_FLUSH_INTERVAL, SPOOL_RETRY_MAX,
+            ))
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(GEOIP_DB_PATH, GEOIP_ASN_DB_PATH, GEOIP_CACHE_SIZE, envelope, self.rules_file,
+                          self.intel_dir),
+            ) as pool:
+                for path in paths:
+                    schema, ranges = split_file(path, self.chunk_bytes)
+                    if schema is None:
+                        logger.warning(f"Skipping {path}: no #fields header")
+                        continue
+                    for start, end in ranges:
+                        pending.add(loop.run_in_executor(pool, process_range, path, start, end, schema))
+                        self.ranges += 1
+                        self.bytes_read += end - start
+                        if len(pending) >= self.max_pending:
+                            await collect(asyncio.FIRST_COMPLETED)
+                while pending:
+                    await collect(asyncio.ALL_COMPLETED)
+                if deliveries:
+                    await asyncio.gather(*deliveries)
+        finally:
+            if replayer is not None:
+                replayer.cancel()
+                try:
+                    await replayer
+                except asyncio.CancelledError:
+                    pass
+        if replayer is not None:
+            await self._flush_spool()
+
+        elapsed = time.perf_counter() - started
+        return {
+            "workers": self.workers,
+            "ranges": self.ranges,
+            "bytes": self.bytes_read,
+            "events": self.events,
+            "events_failed": self.events_failed,
+            "events_spooled": self.events_spooled,
+            "spool_pending_bytes": self.spool.pending_bytes() if self.spool is not None else 0,
+            "elapsed_sec": round(elapsed, 3),
+            "events_per_sec": round(self.events / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+async def run_pipeline(paths: List[str], workers: int, chunk_bytes: int, max_pending: int,
+                       dry_run: bool = False, rules_file: str = RULES_FILE,
+                       intel_dir: str = INTEL_DIR) -> Dict[str, Any]:
+    sender = None
+    spool = None
+    if not dry_run:
+        spool = Spool(PIPELINE_SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES,
+                      fsync=SPOOL_FSYNC)
+        sender = HecSender(
+            url=HEC_URL,
+            token=SPLUNK_TOKEN,
+            index=SPLUNK_INDEX,
+            verify_ssl=SPLUNK_VERIFY_SSL,
+            max_batch_events=HEC_BATCH_EVENTS,
+            max_batch_bytes=HEC_BATCH_BYTES,
+            flush_interval=HEC_FLUSH_INTERVAL,
+            max_in_flight=HEC_MAX_IN_FLIGHT,
+        )
+        await sender.start()
+    try:
+        return await Pipeline(workers, chunk_bytes, max_pending, sender, rules_file, intel_dir, spool).run(paths)
+    finally:
+        if sender is not None:
+            await sender.stop()
+        if spool is not None:
+            spool.close()
+
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description="Parse, enrich and ship Zeek logs using all cores")
+    parser.add_argument("paths", nargs="+", help="Zeek log files, TSV or JSON")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="worker processes")
+    parser.add_argument("--chunk-bytes", type=int, default=PIPELINE_CHUNK_BYTES, help="bytes per work unit")
+    parser.add_argument("--max-pending", type=int, default=PIPELINE_MAX_PENDING,
+                        help="work units queued per stage (default: 2 x workers)")
+    parser.add_argument("--dry-run", action="store_true", help="parse and enrich only, don't send to HEC")
+    parser.add_argument("--rules", default=RULES_FILE, help="filtering rules file (default: RULES_FILE)")
+    parser.add_argument("--intel", default=INTEL_DIR, help="threat-intel feed directory (default: INTEL_DIR)")
+    args = parser.parse_args()
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"Log file not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    result = asyncio.run(run_pipeline(args.paths, args.workers, args.chunk_bytes, args.max_pending, args.dry_run,
+                                      args.rules, args.intel))
+    logger.info(f"Pipeline finished: {result}")
+    if result["spool_pending_bytes"]:
+        logger.warning(f"{result['spool_pending_bytes']} bytes left in {PIPELINE_SPOOL_DIR}, sent on the next run")
+    sys.exit(0 if result["events_failed"] == 0 and not result["spool_pending_bytes"] else 1)
+
+
+if __name__ == "__main__":
+    main()
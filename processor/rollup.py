@@ -0,0 +1,128 @@
+"""
+Flow Rollup
+Folds repetitive conn records (heartbeats, NTP, DNS to the same resolver, health checks)
+into one summary event per flow and window, keeping counts and byte/packet totals exact.
+"""
+
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from log_parser import event_time
+
+FLOW_KEY = ("id_orig_h", "id_resp_h", "id_resp_p", "proto", "service")
+SUMMED = ("duration", "orig_bytes", "resp_bytes", "orig_pkts", "resp_pkts")
+
+
+class _Flow:
+    __slots__ = ("count", "first_ts", "last_ts", "sums", "uids")
+
+    def __init__(self, fields: int):
+        self.count = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.sums = [0] * fields
+        self.uids: List[str] = []
+
+
+class FlowRollup:
+    """
+    Aggregation state keyed on (orig_h, resp_h, resp_p, proto, service). A flow is summarized
+    `window` seconds after its first record arrives. At most `max_flows` flows are kept;
+    beyond that the least recently updated flow is summarized early, so memory is bounded
+    and totals stay exact either way.
+    """
+
+    def __init__(self, window: float = 60.0, max_flows: int = 100000, sample_uids: int = 5):
+        self.window = window
+        self.max_flows = max_flows
+        self.sample_uids = sample_uids
+        self.flows: "OrderedDict[Tuple, _Flow]" = OrderedDict()
+        self._deadlines: deque = deque()
+        self._ready: List[Dict[str, Any]] = []
+        self.events_in = 0
+        self.summaries_out = 0
+        self.evicted = 0
+
+    def add(self, events: List[Dict[str, Any]], now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        flows = self.flows
+        for event in events:
+            key = tuple(event.get(name) for name in FLOW_KEY)
+            flow = flows.get(key)
+            if flow is None:
+                if len(flows) >= self.max_flows:
+                    old_key, old_flow = flows.popitem(last=False)
+                    self._ready.append(self._summary(old_key, old_flow))
+                    self.evicted += 1
+                flow = flows[key] = _Flow(len(SUMMED))
+                self._deadlines.append((now + self.window, key, flow))
+            else:
+                flows.move_to_end(key)
+            flow.count += 1
+            # TSV logs keep ts as a string; compare epoch seconds
+            ts = event_time(event.get("ts"), None)
+            if ts is not None:
+                if flow.first_ts is None or ts < flow.first_ts:
+                    flow.first_ts = ts
+                if flow.last_ts is None or ts > flow.last_ts:
+                    flow.last_ts = ts
+            sums = flow.sums
+            for i, name in enumerate(SUMMED):
+                value = event.get(name)
+                if value is not None:
+                    sums[i] += value
+            uid = event.get("uid")
+            if uid and len(flow.uids) < self.sample_uids:
+                flow.uids.append(uid)
+        self.events_in += len(events)
+
+    def _summary(self, key: Tuple, flow: _Flow) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "ts": flow.first_ts,
+            "uid": flow.uids[0] if flow.uids else None,
+        }
+        summary.update(zip(FLOW_KEY, key))
+        summary.update(zip(SUMMED, flow.sums))
+        summary["conn_count"] = flow.count
+        summary["first_ts"] = flow.first_ts
+        summary["last_ts"] = flow.last_ts
+        summary["sample_uids"] = flow.uids
+        return summary
+
+    def expired(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Summaries of flows whose window has ended, and of flows evicted since the last call"""
+        now = time.monotonic() if now is None else now
+        ready, self._ready = self._ready, []
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, key, flow = deadlines.popleft()
+            # Skip deadlines of flows that were evicted (and possibly started again) meanwhile
+            if self.flows.get(key) is flow:
+                del self.flows[key]
+                ready.append(self._summary(key, flow))
+        self.summaries_out += len(ready)
+        return ready
+
+    def requeue(self, summaries: List[Dict[str, Any]]):
+        """Return summaries that could not be delivered, to be handed out again by `expired`"""
+        self._ready.extend(summaries)
+        self.summaries_out -= len(summaries)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Summaries of every flow, regardless of its window"""
+        ready, self._ready = self._ready, []
+        ready.extend(self._summary(key, flow) for key, flow in self.flows.items())
+        self.flows.clear()
+        self._deadlines.clear()
+        self.summaries_out += len(ready)
+        return ready
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flows": len(self.flows),
+            "events_in": self.events_in,
+            "summaries_out": self.summaries_out,
+            "evicted": self.evicted,
+            "reduction": round(self.events_in / self.summaries_out, 1) if self.summaries_out else 0.0,
+        }
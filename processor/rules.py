@@ -0,0 +1,397 @@
+"""
+Filtering Rules
+Declarative pre-enrichment rules that drop, keep, sample, re-route or aggregate events
+before any GeoIP lookup or serialization. Rules are read from a JSON file, compiled into lookup
+tables and reloaded when the file changes.
+
+    {
+      "default": "keep",
+      "rules": [
+        {"name": "internal-dns", "match": {"dst": ["10.0.0.53/32"], "dst_port": [53]}, "action": "drop"},
+        {"name": "scanners", "match": {"src": ["192.0.2.0/24"], "conn_state": ["S0"]}, "action": "drop"},
+        {"name": "http-sample", "log_types": ["conn"], "match": {"service": ["http"]},
+         "action": "sample", "rate": 0.1},
+        {"name": "ssh", "match": {"port": [22]}, "action": "route", "index": "ssh"},
+        {"name": "ntp", "match": {"dst_port": [123], "proto": ["udp"]}, "action": "aggregate"}
+      ]
+    }
+"""
+
+import ipaddress
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("drop", "keep", "sample", "route", "aggregate")
+
+# Target returned for conn events to fold into flow summaries (not a valid Splunk index name)
+AGGREGATE = "@aggregate"
+
+# Address, port and string conditions, and the event fields they are matched against.
+# Each address and port condition has a source, destination and either-side form.
+ADDRESS_KEYS = ("src", "dst", "ip")
+PORT_KEYS = ("src_port", "dst_port", "port")
+VALUE_KEYS = {"proto": "proto", "conn_state": "conn_state", "service": "service"}
+MATCH_KEYS = ADDRESS_KEYS + PORT_KEYS + tuple(VALUE_KEYS)
+
+CACHE_LIMIT = 65536
+
+
+class RuleError(ValueError):
+    """A rules file that cannot be compiled"""
+
+
+class _Node:
+    __slots__ = ("children", "masks")
+
+    def __init__(self):
+        self.children: Dict[int, "_Node"] = {}
+        self.masks: Dict[int, int] = {}
+
+
+class CidrTrie:
+    """
+    Multibit prefix trie (one byte per level) mapping an address to the OR of the values
+    of every prefix that contains it. Prefixes that do not end on a byte boundary are
+    expanded to all the byte values they cover, so a lookup is one dict probe per byte.
+    """
+
+    def __init__(self):
+        self.roots = {4: _Node(), 6: _Node()}
+        self.everything = {4: 0, 6: 0}
+
+    def insert(self, network: str, value: int):
+        net = ipaddress.ip_network(network, strict=False)
+        length = net.prefixlen
+        if length == 0:
+            self.everything[net.version] |= value
+            return
+        packed = net.network_address.packed
+        level = (length - 1) // 8
+        node = self.roots[net.version]
+        for byte in packed[:level]:
+            node = node.children.setdefault(byte, _Node())
+        free = 8 - (length - 8 * level)
+        first = packed[level]
+        for byte in range(first, first + (1 << free)):
+            node.masks[byte] = node.masks.get(byte, 0) | value
+
+    def lookup(self, address: str) -> int:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return 0
+        mask = self.everything[ip.version]
+        node = self.roots[ip.version]
+        for byte in ip.packed:
+            mask |= node.masks.get(byte, 0)
+            node = node.children.get(byte)
+            if node is None:
+                break
+        return mask
+
+
+class Rule:
+    __slots__ = ("name", "action", "rate", "index", "threshold")
+
+    def __init__(self, name: str, action: str, rate: float = 1.0, index: Optional[str] = None):
+        self.name = name
+        self.action = action
+        self.rate = rate
+        self.index = index
+        # Sampling keeps events whose uid hashes (CRC-32) below this value
+        self.threshold = int(rate * 0x100000000)
+
+
+def _values(rule: Dict[str, Any], key: str) -> List[Any]:
+    value = rule["match"][key]
+    return value if isinstance(value, list) else [value]
+
+
+def _port_range(value: Any) -> Tuple[int, int]:
+    """A port condition: 443 or "1024-65535" """
+    if isinstance(value, int):
+        return value, value
+    low, _, high = str(value).partition("-")
+    return int(low), int(high or low)
+
+
+class RuleSet:
+    """
+    Compiled rules. Every condition maps a field value to a bitmask of the rules it
+    satisfies (rules without that condition are always set), so an event's candidate rules
+    are the AND of a few table lookups and the first match is the lowest set bit. Address
+    and port masks hold three bit blocks, for the source, destination and either-side forms.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        if not isinstance(config, dict):
+            raise RuleError("rules file must hold a JSON object")
+        rules = config.get("rules", [])
+        if not isinstance(rules, list):
+            raise RuleError("rules must be a list")
+        self.default = config.get("default", "keep")
+        if self.default not in ("keep", "drop"):
+            raise RuleError("default must be keep or drop")
+        n = len(rules)
+        self.size = n
+        self.everyone = (1 << n) - 1
+        self.rules: List[Rule] = []
+        self.trie = CidrTrie()
+        self.ports: List[Tuple[int, int, int]] = []
+        self.unconstrained = dict.fromkeys(MATCH_KEYS, self.everyone)
+        self.values: Dict[str, Dict[Any, int]] = {key: {} for key in VALUE_KEYS}
+        self.type_rules: Dict[str, int] = {}
+        self.any_type = self.everyone
+        for position, rule in enumerate(rules):
+            self._compile(position, rule)
+        for key, table in self.values.items():
+            for value in table:
+                table[value] |= self.unconstrained[key]
+        self.hits = [0] * n
+        self.default_hits = 0
+        self._address_cache: Dict[str, int] = {}
+        self._port_cache: Dict[Any, int] = {}
+
+    def _compile(self, position: int, rule: Dict[str, Any]):
+        if not isinstance(rule, dict):
+            raise RuleError(f"rule-{position}: rule must be an object")
+        bit = 1 << position
+        name = str(rule.get("name") or f"rule-{position}")
+        action = rule.get("action")
+        if action not in ACTIONS:
+            raise RuleError(f"{name}: action must be one of {', '.join(ACTIONS)}")
+        rate = rule.get("rate", 1.0)
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)):
+            raise RuleError(f"{name}: rate must be a number")
+        if action == "sample" and not 0.0 <= rate <= 1.0:
+            raise RuleError(f"{name}: rate must be between 0 and 1")
+        index = rule.get("index")
+        if action == "route" and not (index and isinstance(index, str)):
+            raise RuleError(f"{name}: route needs an index")
+        self.rules.append(Rule(name, action, float(rate), index))
+
+        match = rule.get("match", {})
+        if not isinstance(match, dict):
+            raise RuleError(f"{name}: match must be an object")
+        unknown = set(match) - set(MATCH_KEYS)
+        if unknown:
+            raise RuleError(f"{name}: unknown match keys {sorted(unknown)}")
+        for key in match:
+            for value in _values(rule, key):
+                if isinstance(value, bool) or not isinstance(value, (str, int)):
+                    raise RuleError(f"{name}: {key} values must be strings or numbers")
+        log_types = rule.get("log_types")
+        if log_types is not None and not (
+            isinstance(log_types, list) and all(isinstance(log_type, str) for log_type in log_types)
+        ):
+            raise RuleError(f"{name}: log_types must be a list of strings")
+        if log_types:
+            self.any_type &= ~bit
+            for log_type in log_types:
+                self.type_rules[log_type] = self.type_rules.get(log_type, 0) | bit
+        for key in match:
+            self.unconstrained[key] &= ~bit
+        try:
+            for block, key in enumerate(ADDRESS_KEYS):
+                if key in match:
+                    for network in _values(rule, key):
+                        self.trie.insert(network, bit << (block * self.size))
+            for block, key in enumerate(PORT_KEYS):
+                if key in match:
+                    for value in _values(rule, key):
+                        low, high = _port_range(value)
+                        self.ports.append((low, high, bit << (block * self.size)))
+        except (TypeError, ValueError) as e:
+            raise RuleError(f"{name}: {e}")
+        for key in VALUE_KEYS:
+            if key in match:
+                table = self.values[key]
+                for value in _values(rule, key):
+                    table[value] = table.get(value, 0) | bit
+
+    def _address(self, address: Optional[str]) -> int:
+        if not address:
+            return 0
+        mask = self._address_cache.get(address)
+        if mask is None:
+            if len(self._address_cache) >= CACHE_LIMIT:
+                self._address_cache.clear()
+            mask = self._address_cache[address] = self.trie.lookup(address)
+        return mask
+
+    def _port(self, port: Any) -> int:
+        if type(port) is not int:
+            return 0
+        mask = self._port_cache.get(port)
+        if mask is None:
+            mask = 0
+            for low, high, bits in self.ports:
+                if low <= port <= high:
+                    mask |= bits
+            self._port_cache[port] = mask
+        return mask
+
+    def _sides(self, kind: Tuple[str, str, str], source: int, destination: int) -> int:
+        """Rules whose source, destination and either-side conditions of one kind hold"""
+        n, everyone, unconstrained = self.size, self.everyone, self.unconstrained
+        return (
+            ((source & everyone) | unconstrained[kind[0]])
+            & (((destination >> n) & everyone) | unconstrained[kind[1]])
+            & ((((source | destination) >> 2 * n) & everyone) | unconstrained[kind[2]])
+        )
+
+    def first_match(self, log_type: str, event: Dict[str, Any]) -> Optional[Rule]:
+        candidates = self.any_type | self.type_rules.get(log_type, 0)
+        for key, table in self.values.items():
+            if not candidates:
+                return None
+            candidates &= table.get(event.get(VALUE_KEYS[key]), self.unconstrained[key])
+        if not candidates:
+            return None
+        candidates &= self._sides(
+            ADDRESS_KEYS, self._address(event.get("id_orig_h")), self._address(event.get("id_resp_h"))
+        )
+        if not candidates:
+            return None
+        candidates &= self._sides(PORT_KEYS, self._port(event.get("id_orig_p")), self._port(event.get("id_resp_p")))
+        if not candidates:
+            return None
+        position = (candidates & -candidates).bit_length() - 1
+        self.hits[position] += 1
+        return self.rules[position]
+
+    def target(self, log_type: str, event: Dict[str, Any], default_index: str) -> Optional[str]:
+        """The index to send an event to, AGGREGATE to fold it into a flow summary, or None to drop it"""
+        rule = self.first_match(log_type, event)
+        if rule is None:
+            self.default_hits += 1
+            return default_index if self.default == "keep" else None
+        action = rule.action
+        if action == "keep":
+            return default_index
+        if action == "route":
+            return rule.index
+        if action == "aggregate":
+            # Only conn records are folded; other types matching the rule are kept
+            return AGGREGATE if log_type == "conn" else default_index
+        if action == "sample":
+            uid = event.get("uid")
+            if not uid:
+                return default_index
+            return default_index if zlib.crc32(str(uid).encode()) < rule.threshold else None
+        return None
+
+    def route(self, log_type: str, events: List[Dict[str, Any]],
+              default_index: str) -> Tuple[Dict[str, List[int]], int]:
+        """Positions of the events to keep, grouped by target index, and how many were dropped"""
+        groups: Dict[str, List[int]] = {}
+        dropped = 0
+        target = self.target
+        for position, event in enumerate(events):
+            index = target(log_type, event, default_index)
+            if index is None:
+                dropped += 1
+            else:
+                group = groups.get(index)
+                if group is None:
+                    group = groups[index] = []
+                group.append(position)
+        return groups, dropped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": [
+                {"name": rule.name, "action": rule.action, "hits": hits}
+                for rule, hits in zip(self.rules, self.hits)
+            ],
+            "default": self.default,
+            "default_hits": self.default_hits,
+        }
+
+
+def load_rules(path: str) -> Optional[RuleSet]:
+    """Compile a rules file; None when no file is configured or it does not exist"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuleError(f"{path}: {e}")
+    return RuleSet(config)
+
+
+class RuleEngine:
+    """
+    The current rules from `path`, reloaded when the file's mtime or size changes (checked
+    at most every `reload_interval` seconds). A file that fails to compile is logged, the
+    previous rules stay in effect and the file is tried again on the next check.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.rule_set: Optional[RuleSet] = None
+        self.loaded_at = 0.0
+        self.error: Optional[str] = None
+        self._signature: Optional[Tuple[float, int]] = None
+        self._checked = 0.0
+        self.reload()
+        REGISTRY.callback(
+            "rule_matches_total", "Events matched by each filtering rule (default: no rule matched)",
+            self._hit_counts, ["rule", "action"], kind="counter",
+        )
+
+    def _hit_counts(self) -> Dict[tuple, float]:
+        if self.rule_set is None:
+            return {}
+        counts = {(rule.name, rule.action): hits for rule, hits in zip(self.rule_set.rules, self.rule_set.hits)}
+        counts[("default", self.rule_set.default)] = self.rule_set.default_hits
+        return counts
+
+    def reload(self) -> bool:
+        """Recompile the rules if the file changed; True if new rules were loaded"""
+        self._checked = time.monotonic()
+        try:
+            st = os.stat(self.path) if self.path else None
+        except OSError:
+            st = None
+        signature = (st.st_mtime, st.st_size) if st is not None else None
+        if signature == self._signature:
+            return False
+        try:
+            rule_set = load_rules(self.path)
+        except RuleError as e:
+            # The signature is left alone so the file is tried again on the next check
+            if str(e) != self.error:
+                logger.error(f"Keeping previous filtering rules, {self.path} is invalid: {e}")
+            self.error = str(e)
+            return False
+        self.rule_set = rule_set
+        self._signature = signature
+        self.error = None
+        self.loaded_at = time.time()
+        if self.rule_set is not None:
+            logger.info(f"Loaded {self.rule_set.size} filtering rules from {self.path}")
+        elif self.path:
+            logger.info(f"No filtering rules at {self.path}, keeping every event")
+        return True
+
+    def current(self) -> Optional[RuleSet]:
+        if time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+        return self.rule_set
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"file": self.path, "loaded_at": self.loaded_at, "error": self.error}
+        if self.rule_set is not None:
+            stats.update(self.rule_set.stats())
+        return stats
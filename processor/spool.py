@@ -0,0 +1,241 @@
+"""
+Durable Event Spool
+Segmented, append-only on-disk queue that buffers HEC payloads while Splunk is slow or down.
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Each record is framed as: payload length, CRC32 of payload, payload bytes
+FRAME = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+Position = Tuple[int, int]
+
+
+class SpoolFullError(Exception):
+    """Raised when appending would exceed the spool's configured size limit"""
+
+
+class Spool:
+    """
+    Append-only spool split into numbered segment files of bounded size.
+
+    Writers append whole batches with a single write per segment. A persistent replay
+    cursor (segment number, byte offset) marks how far the spool has been drained;
+    segments entirely behind the cursor are deleted on commit. On open, a torn record
+    at the tail of the newest segment is truncated away.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+        self._segments: List[int] = sorted(
+            int(p.stem) for p in self.directory.glob(f"*{SEGMENT_SUFFIX}") if p.stem.isdigit()
+        )
+        self._sizes: Dict[int, int] = {}
+        for seq in self._segments:
+            self._sizes[seq] = self._recover_segment(seq) if seq == self._segments[-1] else \
+                self._segment_path(seq).stat().st_size
+        if not self._segments:
+            self._segments.append(0)
+            self._sizes[0] = 0
+
+        self._cursor = self._load_cursor()
+        self._writer: Optional[BinaryIO] = None
+        self._reader: Optional[BinaryIO] = None
+        self._reader_seq = -1
+        self._open_writer()
+
+        self.records_appended = 0
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.directory / f"{seq:012d}{SEGMENT_SUFFIX}"
+
+    def _recover_segment(self, seq: int) -> int:
+        """Truncate a partially written record at the end of a segment"""
+        path = self._segment_path(seq)
+        valid = 0
+        with open(path, "r+b") as f:
+            while True:
+                header = f.read(FRAME.size)
+                if len(header) < FRAME.size:
+                    break
+                length, crc = FRAME.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                valid += FRAME.size + length
+            if valid != path.stat().st_size:
+                logger.warning(f"Truncating torn spool record in {path.name} at offset {valid}")
+                f.truncate(valid)
+        return valid
+
+    def _load_cursor(self) -> Position:
+        path = self.directory / CURSOR_FILE
+        first = (self._segments[0], 0)
+        try:
+            seq, offset = (int(v) for v in path.read_text().split())
+        except (FileNotFoundError, ValueError):
+            return first
+        if seq not in self._sizes:
+            return first
+        return seq, min(offset, self._sizes[seq])
+
+    def _open_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = open(self._segment_path(self._segments[-1]), "ab")
+
+    def _roll(self):
+        seq = self._segments[-1] + 1
+        self._segments.append(seq)
+        self._sizes[seq] = 0
+        self._open_writer()
+
+    def _write(self, data: bytes):
+        self._writer.write(data)
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+        self._sizes[self._segments[-1]] += len(data)
+
+    def pending_bytes(self) -> int:
+        """Bytes written but not yet committed by the replay cursor"""
+        seq, offset = self._cursor
+        return sum(size for s, size in self._sizes.items() if s >= seq) - offset
+
+    def is_empty(self) -> bool:
+        return self._cursor == (self._segments[-1], self._sizes[self._segments[-1]])
+
+    def is_full(self) -> bool:
+        return self.pending_bytes() >= self.max_bytes
+
+    def append(self, payloads: List[bytes]):
+        """
+        Append a batch of payloads, rolling to a new segment when the current one is full.
+        Nothing is written if the batch would take the spool past `max_bytes`.
+        """
+        with self._lock:
+            incoming = sum(FRAME.size + len(payload) for payload in payloads)
+            if self.pending_bytes() + incoming > self.max_bytes:
+                raise SpoolFullError(
+                    f"Spool at {self.directory} holds {self.pending_bytes()} bytes, "
+                    f"cannot add {incoming} within {self.max_bytes}"
+                )
+            chunk: List[bytes] = []
+            chunk_bytes = 0
+            for payload in payloads:
+                frame_bytes = FRAME.size + len(payload)
+                if self._sizes[self._segments[-1]] + chunk_bytes + frame_bytes > self.segment_bytes \
+                        and self._sizes[self._segments[-1]] + chunk_bytes > 0:
+                    if chunk:
+                        self._write(b"".join(chunk))
+                        chunk, chunk_bytes = [], 0
+                    self._roll()
+                chunk.append(FRAME.pack(len(payload), zlib.crc32(payload)))
+                chunk.append(payload)
+                chunk_bytes += frame_bytes
+            if chunk:
+                self._write(b"".join(chunk))
+            self.records_appended += len(payloads)
+
+    def read(self, max_records: int = 1000) -> Tuple[List[bytes], Position]:
+        """Read up to max_records from the cursor; returns records and the position after them"""
+        with self._lock:
+            seq, offset = self._cursor
+            records: List[bytes] = []
+            while len(records) < max_records:
+                if offset >= self._sizes[seq]:
+                    if seq == self._segments[-1]:
+                        break
+                    seq = self._segments[self._segments.index(seq) + 1]
+                    offset = 0
+                    continue
+                if self._reader_seq != seq:
+                    if self._reader is not None:
+                        self._reader.close()
+                    self._reader = open(self._segment_path(seq), "rb")
+                    self._reader_seq = seq
+                self._reader.seek(offset)
+                while len(records) < max_records and offset < self._sizes[seq]:
+                    length, _ = FRAME.unpack(self._reader.read(FRAME.size))
+                    records.append(self._reader.read(length))
+                    offset += FRAME.size + length
+            return records, (seq, offset)
+
+    def commit(self, position: Position):
+        """Advance the replay cursor and drop segments that are fully drained"""
+        with self._lock:
+            seq, offset = position
+            tmp = self.directory / f"{CURSOR_FILE}.tmp"
+            tmp.write_text(f"{seq} {offset}\n")
+            os.replace(tmp, self.directory / CURSOR_FILE)
+            drained = [s for s in self._segments if s < seq]
+            self._cursor = position
+            for s in drained:
+                if s == self._reader_seq:
+                    self._reader.close()
+                    self._reader, self._reader_seq = None, -1
+                self._segment_path(s).unlink(missing_ok=True)
+                self._segments.remove(s)
+                del self._sizes[s]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self._segments),
+            "pending_bytes": self.pending_bytes(),
+            "max_bytes": self.max_bytes,
+            "records_appended": self.records_appended,
+            "full": self.is_full(),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+
+async def replay(spool: Spool, send: Callable[[List[bytes]], Awaitable[List[bytes]]], max_records: int,
+                 interval: float, retry_max: float):
+    """
+    Replay a spool in order through `send`, which returns the records it could not deliver,
+    backing off while they keep failing. Only the records of the last read that were refused
+    are resent, and the cursor moves past the read once they are all in. Runs until cancelled.
+    """
+    delay = interval
+    unsent: List[bytes] = []
+    while True:
+        if not unsent:
+            unsent, position = await asyncio.to_thread(spool.read, max_records)
+            if not unsent:
+                await asyncio.sleep(interval)
+                continue
+        unsent = await send(unsent)
+        if not unsent:
+            await asyncio.to_thread(spool.commit, position)
+            delay = interval
+        else:
+            logger.warning(f"Spool replay failed for {len(unsent)} events, retrying in {delay:.1f}s "
+                           f"({spool.pending_bytes()} bytes pending)")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, retry_max)
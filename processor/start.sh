@@ -1,16 +1,28 @@
 #!/bin/bash
 
-# Start the FastAPI server in the background
-echo "Starting FastAPI server..."
-uvicorn main:app --host 0.0.0.0 --port 8001 --reload &
+# ROLE=processor runs only the API (a cluster replica), ROLE=watcher only the log watcher
+ROLE="${ROLE:-all}"
 
-# Wait for the server to be ready
-echo "Waiting for server to be ready..."
-sleep 10
+if [ "$ROLE" != "watcher" ]; then
+    # Start the FastAPI server in the background
+    echo "Starting FastAPI server..."
+    uvicorn main:app --host 0.0.0.0 --port 8001 &
+fi
 
-# Start the log watcher
-echo "Starting log watcher..."
-python log_watcher.py
+if [ "$ROLE" = "processor" ]; then
+    echo "Processor replica: log watchers on the sensors send events here"
+elif [ "${INGEST_MODE:-http}" = "direct" ] && [ "$ROLE" != "watcher" ]; then
+    # The processor tails LOGS_DIR itself; no separate watcher process
+    echo "Direct ingest mode: log watcher runs inside the processor"
+else
+    # Wait for the server to be ready
+    echo "Waiting for server to be ready..."
+    sleep 10
+
+    # Start the log watcher
+    echo "Starting log watcher..."
+    python log_watcher.py
+fi
 
 # Keep the script running
 wait
@@ -0,0 +1,492 @@
+"""
+Event Store
+Optional local copy of enriched events, kept in hourly partitions of compressed columnar
+segment files so the dashboard can drill into recent traffic without searching Splunk.
+"""
+
+import asyncio
+import base64
+import hashlib
+import heapq
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from log_parser import event_time
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ZEEKCOL1"
+LENGTH = struct.Struct(">I")
+SEGMENT_SUFFIX = ".col"
+PARTITION_FORMAT = "%Y%m%d%H"
+PARTITION_SECONDS = 3600
+RAW_BLOCK_ROWS = 1024
+
+# Columns kept for filtering and grouping, with their encoding; each whole event is kept in
+# `_raw`, in compressed blocks of RAW_BLOCK_ROWS so single rows can be fetched cheaply
+COLUMNS = [
+    ("ts", "float"),
+    ("log_type", "dict"),
+    ("uid", "str"),
+    ("id_orig_h", "dict"),
+    ("id_orig_p", "int"),
+    ("id_resp_h", "dict"),
+    ("id_resp_p", "int"),
+    ("proto", "dict"),
+    ("service", "dict"),
+    ("conn_state", "dict"),
+    ("orig_bytes", "int"),
+    ("resp_bytes", "int"),
+]
+KINDS = dict(COLUMNS)
+ADDRESS_COLUMNS = ("id_orig_h", "id_resp_h")
+PORT_COLUMNS = ("id_orig_p", "id_resp_p")
+GROUP_COLUMNS = tuple(name for name, _ in COLUMNS if name not in ("ts", "uid"))
+
+STORE_EVENTS = REGISTRY.counter("store_events_written_total", "Events written to the local event store")
+STORE_QUERY_SECONDS = REGISTRY.histogram("store_query_seconds", "Event store query latency", ["kind"])
+
+
+def _normalize(kind: str, value: Any) -> Any:
+    """A value as stored in a column of this kind; -1 marks a missing int"""
+    if kind == "int":
+        return value if type(value) is int else -1
+    if value is None or type(value) is str:
+        return value
+    if type(value) in (int, float, bool):
+        return str(value) if kind == "str" else value
+    return json.dumps(value)
+
+
+def _encode(kind: str, values: List[Any], level: int) -> bytes:
+    if kind == "float":
+        data = array("d", values).tobytes()
+    elif kind == "int":
+        data = array("q", values).tobytes()
+    elif kind == "dict":
+        uniques: Dict[Any, int] = {}
+        setdefault = uniques.setdefault
+        codes = array("I", [setdefault(value, len(uniques)) for value in values])
+        names = json.dumps(list(uniques)).encode()
+        data = LENGTH.pack(len(names)) + names + codes.tobytes()
+    elif kind == "str":
+        data = json.dumps(values).encode()
+    else:
+        lengths = array("I", map(len, values))
+        data = LENGTH.pack(len(values)) + lengths.tobytes() + b"".join(values)
+    return zlib.compress(data, level)
+
+
+def _decode(kind: str, blob: bytes, swap: bool) -> List[Any]:
+    data = zlib.decompress(blob)
+    if kind in ("float", "int"):
+        values = array("d" if kind == "float" else "q", data)
+        if swap:
+            values.byteswap()
+        return values.tolist()
+    if kind == "dict":
+        (size,) = LENGTH.unpack_from(data)
+        names = json.loads(data[LENGTH.size:LENGTH.size + size])
+        codes = array("I", data[LENGTH.size + size:])
+        if swap:
+            codes.byteswap()
+        return [names[code] for code in codes]
+    if kind == "str":
+        return json.loads(data)
+    (count,) = LENGTH.unpack_from(data)
+    lengths = array("I", data[LENGTH.size:LENGTH.size + 4 * count])
+    if swap:
+        lengths.byteswap()
+    rows = []
+    offset = LENGTH.size + 4 * count
+    for length in lengths:
+        rows.append(data[offset:offset + length])
+        offset += length
+    return rows
+
+
+class Bloom:
+    """Bloom filter over a segment's addresses, about 1% false positives at 10 bits each"""
+
+    def __init__(self, bits: int, hashes: int = 7, data: Optional[bytes] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def of(cls, values: Set[str]) -> "Bloom":
+        bloom = cls(max(64, 10 * len(values)))
+        for value in values:
+            for position in bloom._positions(value):
+                bloom.data[position >> 3] |= 1 << (position & 7)
+        return bloom
+
+    def _positions(self, value: str) -> Iterator[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def __contains__(self, value: str) -> bool:
+        data = self.data
+        return all(data[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class Segment:
+    """One immutable segment file: a JSON header (time range, address filter, column offsets), then the columns"""
+
+    def __init__(self, path: Path, header: Dict[str, Any], data_offset: int):
+        self.path = path
+        self.header = header
+        self.data_offset = data_offset
+        self.count: int = header["count"]
+        self.min_ts: float = header["min_ts"]
+        self.max_ts: float = header["max_ts"]
+        self.size = path.stat().st_size
+        self.addresses = Bloom(header["bloom_bits"], header["bloom_hashes"], base64.b64decode(header["bloom"]))
+        self.swap = header["byteorder"] != sys.byteorder
+
+    @classmethod
+    def open(cls, path: Path) -> "Segment":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("not an event store segment")
+            (size,) = LENGTH.unpack(f.read(LENGTH.size))
+            header = json.loads(f.read(size))
+        return cls(path, header, len(MAGIC) + LENGTH.size + size)
+
+    @classmethod
+    def write(cls, path: Path, columns: Dict[str, List[Any]], raw: List[bytes], level: int) -> "Segment":
+        """Write rows (given as columns) to a new segment, atomically"""
+        blobs: List[bytes] = []
+        offsets: Dict[str, Any] = {}
+        offset = 0
+        for name, kind in COLUMNS:
+            blob = _encode(kind, columns[name], level)
+            offsets[name] = [offset, len(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+        raw_blocks = []
+        for start in range(0, len(raw), RAW_BLOCK_ROWS):
+            blob = _encode("blob", raw[start:start + RAW_BLOCK_ROWS], level)
+            raw_blocks.append([offset, len(blob)])
+            blobs.append(blob)
+            offset += len(blob)
+        addresses = {value for name in ADDRESS_COLUMNS for value in columns[name] if type(value) is str}
+        bloom = Bloom.of(addresses)
+        header = json.dumps({
+            "count": len(raw),
+            "min_ts": min(columns["ts"]),
+            "max_ts": max(columns["ts"]),
+            "byteorder": sys.byteorder,
+            "columns": offsets,
+            "raw_blocks": raw_blocks,
+            "bloom": base64.b64encode(bloom.data).decode(),
+            "bloom_bits": bloom.bits,
+            "bloom_hashes": bloom.hashes,
+        }).encode()
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + LENGTH.pack(len(header)) + header)
+            f.writelines(blobs)
+        os.replace(tmp, path)
+        return cls(path, header=json.loads(header), data_offset=len(MAGIC) + LENGTH.size + len(header))
+
+    def _read(self, offset: int, length: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(self.data_offset + offset)
+            return f.read(length)
+
+    def column(self, name: str) -> List[Any]:
+        offset, length = self.header["columns"][name]
+        return _decode(KINDS[name], self._read(offset, length), self.swap)
+
+    def raw_block(self, block: int) -> List[bytes]:
+        offset, length = self.header["raw_blocks"][block]
+        return _decode("blob", self._read(offset, length), self.swap)
+
+
+class _Buffer:
+    """Events not yet written to a segment, as columns; queried like a segment"""
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {name: [] for name, _ in COLUMNS}
+        self.raw: List[bytes] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.raw)
+
+    def snapshot(self) -> Tuple[Dict[str, List[Any]], List[bytes]]:
+        """Consistent copies of the columns; rows may be appended on the event loop meanwhile"""
+        rows = min(len(self.raw), *(len(values) for values in self.columns.values()))
+        return {name: values[:rows] for name, values in self.columns.items()}, self.raw[:rows]
+
+
+class Query:
+    """Filters for a store query: a time range plus optional address, port, proto and log type sets"""
+
+    def __init__(self, start: float, end: float, ips: Optional[Set[str]] = None, ports: Optional[Set[int]] = None,
+                 protos: Optional[Set[str]] = None, log_types: Optional[Set[str]] = None):
+        self.start = start
+        self.end = end
+        self.ips = ips
+        self.ports = ports
+        self.protos = protos
+        self.log_types = log_types
+
+    def overlaps(self, segment: Segment) -> bool:
+        """False when the segment's time range or address filter rules out every row"""
+        if segment.max_ts < self.start or segment.min_ts > self.end:
+            return False
+        return self.ips is None or any(ip in segment.addresses for ip in self.ips)
+
+    def rows(self, columns: Dict[str, List[Any]]) -> List[int]:
+        """Positions of the matching rows"""
+        start, end = self.start, self.end
+        rows = [i for i, ts in enumerate(columns["ts"]) if start <= ts <= end]
+        for names, allowed in ((("log_type",), self.log_types), (("proto",), self.protos),
+                               (ADDRESS_COLUMNS, self.ips), (PORT_COLUMNS, self.ports)):
+            if allowed is not None and rows:
+                values = [columns[name] for name in names]
+                rows = [i for i in rows if any(column[i] in allowed for column in values)]
+        return rows
+
+    def needed(self) -> List[str]:
+        names = ["ts"]
+        for columns, allowed in (
+            (("log_type",), self.log_types), (("proto",), self.protos),
+            (ADDRESS_COLUMNS, self.ips), (PORT_COLUMNS, self.ports),
+        ):
+            if allowed is not None:
+                names.extend(columns)
+        return names
+
+
+class EventStore:
+    """
+    Events are buffered in memory (and queryable right away), then written every
+    `flush_interval` seconds or `segment_events` events as one segment per hour the events
+    fall in, under a directory per hour. Partitions older than `retention_hours` and, past
+    `max_bytes`, the oldest segments are deleted whole. Decoded columns of recently queried
+    segments are cached, so repeated drilldowns over recent data don't decompress again.
+    """
+
+    def __init__(self, directory: str, retention_hours: float = 24.0, max_bytes: int = 10 * 1024 ** 3,
+                 flush_interval: float = 30.0, segment_events: int = 50000, cache_columns: int = 256,
+                 compression: int = 6):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention_hours = retention_hours
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.segment_events = segment_events
+        self.cache_columns = cache_columns
+        self.compression = compression
+        self._pending = _Buffer()
+        self._flushing: Optional[_Buffer] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._cache: "OrderedDict[Tuple[str, Any], List[Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._sequence = 0
+        # Replaced, never mutated, so queries in other threads can iterate a snapshot
+        self.segments: List[Segment] = self._load()
+        REGISTRY.callback("store_segments", "Segments in the local event store", lambda: len(self.segments))
+        REGISTRY.callback("store_bytes", "Bytes in the local event store",
+                          lambda: sum(segment.size for segment in self.segments))
+
+    def _load(self) -> List[Segment]:
+        segments = []
+        for path in sorted(self.directory.glob(f"*/*{SEGMENT_SUFFIX}")):
+            try:
+                segments.append(Segment.open(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable event store segment {path}: {e}")
+        for path in self.directory.glob("*/*.tmp"):
+            path.unlink(missing_ok=True)
+        segments.sort(key=lambda segment: segment.path.name)
+        if segments:
+            logger.info(f"Event store: {len(segments)} segments, {sum(s.count for s in segments)} events")
+        return segments
+
+    def add(self, events: List[Dict[str, Any]], payloads: List[bytes], log_type: str):
+        """Buffer delivered events with their HEC payloads (in the same order)"""
+        if not events:
+            return
+        columns = self._pending.columns
+        now = time.time()
+        for name, kind in COLUMNS:
+            if name == "ts":
+                columns[name].extend(event_time(event.get("ts"), now) for event in events)
+            elif name == "log_type":
+                columns[name].extend([log_type] * len(events))
+            else:
+                columns[name].extend(_normalize(kind, event.get(name)) for event in events)
+        # Keep the event object of each payload, without the HEC envelope that closes it
+        self._pending.raw.extend(payload[9:payload.rindex(b',"source":')] for payload in payloads)
+        if self._pending.size >= self.segment_events and self._wake is not None:
+            self._wake.set()
+
+    def _write(self, buffer: _Buffer) -> List[Segment]:
+        """Write a buffer as one segment per hourly partition"""
+        partitions: Dict[int, List[int]] = {}
+        for i, ts in enumerate(buffer.columns["ts"]):
+            partitions.setdefault(int(ts // PARTITION_SECONDS), []).append(i)
+        segments = []
+        for hour, rows in sorted(partitions.items()):
+            directory = self.directory / time.strftime(PARTITION_FORMAT, time.gmtime(hour * PARTITION_SECONDS))
+            directory.mkdir(exist_ok=True)
+            self._sequence += 1
+            path = directory / f"{int(time.time() * 1000):013d}-{self._sequence:06d}{SEGMENT_SUFFIX}"
+            columns = {name: [values[i] for i in rows] for name, values in buffer.columns.items()}
+            segments.append(Segment.write(path, columns, [buffer.raw[i] for i in rows], self.compression))
+        STORE_EVENTS.inc(amount=buffer.size)
+        return segments
+
+    async def flush(self):
+        """Write buffered events and apply retention"""
+        buffer, self._pending = self._pending, _Buffer()
+        if buffer.size:
+            self._flushing = buffer
+            try:
+                segments = await asyncio.to_thread(self._write, buffer)
+                self.segments = sorted(self.segments + segments, key=lambda segment: segment.path.name)
+            except OSError as e:
+                logger.error(f"Failed to write {buffer.size} events to the event store: {e}")
+            finally:
+                self._flushing = None
+        await asyncio.to_thread(self._expire)
+
+    async def run(self):
+        """Flush periodically, or as soon as a segment's worth of events is buffered"""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _expire(self):
+        cutoff = time.time() - self.retention_hours * 3600
+        keep = [segment for segment in self.segments if segment.max_ts >= cutoff]
+        total = sum(segment.size for segment in keep)
+        while keep and total > self.max_bytes:
+            total -= keep.pop(0).size
+        if len(keep) == len(self.segments):
+            return
+        kept = set(map(id, keep))
+        expired = [segment for segment in self.segments if id(segment) not in kept]
+        self.segments = keep
+        for segment in expired:
+            segment.path.unlink(missing_ok=True)
+        live = {segment.path.parent for segment in keep}
+        for partition in {segment.path.parent for segment in expired} - live:
+            shutil.rmtree(partition, ignore_errors=True)
+        logger.info(f"Event store retention dropped {len(expired)} segments")
+
+    def _cached(self, segment: Segment, key: Any, load) -> List[Any]:
+        cache_key = (str(segment.path), key)
+        with self._cache_lock:
+            values = self._cache.get(cache_key)
+            if values is not None:
+                self._cache.move_to_end(cache_key)
+                return values
+        values = load()
+        with self._cache_lock:
+            self._cache[cache_key] = values
+            while len(self._cache) > self.cache_columns:
+                self._cache.popitem(last=False)
+        return values
+
+    def _sources(self, query: Query, names: List[str]) -> Iterator[Tuple[Any, Dict[str, List[Any]]]]:
+        """(source, columns) for the buffers and the segments that may hold matching rows"""
+        for buffer in (self._pending, self._flushing):
+            if buffer is not None and buffer.size:
+                columns, raw = buffer.snapshot()
+                yield raw, columns
+        for segment in reversed(self.segments):
+            if not query.overlaps(segment):
+                continue
+            try:
+                yield segment, {name: self._cached(segment, name, lambda: segment.column(name)) for name in names}
+            except (OSError, ValueError, zlib.error) as e:
+                # Most likely dropped by retention while the query ran
+                logger.debug(f"Skipping event store segment {segment.path}: {e}")
+
+    def events(self, query: Query, limit: int) -> Iterator[bytes]:
+        """The newest `limit` matching events, newest first, as newline-delimited JSON"""
+        started = time.perf_counter()
+        sources = []
+        candidates: List[Tuple[float, int, int]] = []
+        for source, columns in self._sources(query, query.needed()):
+            ts = columns["ts"]
+            rows = query.rows(columns)
+            candidates = heapq.nlargest(
+                limit, candidates + [(ts[i], len(sources), i) for i in rows]
+            )
+            sources.append(source)
+        for _, source_index, row in candidates:
+            source = sources[source_index]
+            if isinstance(source, Segment):
+                block = self._cached(source, row // RAW_BLOCK_ROWS, lambda: source.raw_block(row // RAW_BLOCK_ROWS))
+                yield block[row % RAW_BLOCK_ROWS] + b"\n"
+            else:
+                yield source[row] + b"\n"
+        STORE_QUERY_SECONDS.observe("events", value=time.perf_counter() - started)
+
+    def group(self, query: Query, group_by: List[str], limit: int) -> Dict[str, Any]:
+        """Counts of matching events per distinct combination of the `group_by` columns, largest first"""
+        started = time.perf_counter()
+        counts: Counter = Counter()
+        matched = 0
+        scanned = 0
+        names = list(dict.fromkeys(query.needed() + group_by))
+        for _, columns in self._sources(query, names):
+            rows = query.rows(columns)
+            matched += len(rows)
+            scanned += 1
+            keys = [columns[name] for name in group_by]
+            counts.update(tuple(column[i] for column in keys) for i in rows)
+        elapsed = time.perf_counter() - started
+        STORE_QUERY_SECONDS.observe("group", value=elapsed)
+        return {
+            "start": query.start,
+            "end": query.end,
+            "matched": matched,
+            "sources_scanned": scanned,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "groups": [
+                {
+                    "key": {
+                        name: None if KINDS[name] == "int" and value == -1 else value
+                        for name, value in zip(group_by, key)
+                    },
+                    "count": count,
+                }
+                for key, count in counts.most_common(limit)
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments
+        return {
+            "directory": str(self.directory),
+            "segments": len(segments),
+            "events": sum(segment.count for segment in segments),
+            "bytes": sum(segment.size for segment in segments),
+            "buffered_events": self._pending.size,
+            "oldest_ts": segments[0].min_ts if segments else None,
+        }
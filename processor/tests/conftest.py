@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Processor modules import each other as top-level modules, as when run from processor/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py builds its spool, rules and intel engines at import; keep them off the real paths
+_STATE = tempfile.mkdtemp(prefix="processor-tests-")
+os.environ.setdefault("SPOOL_DIR", os.path.join(_STATE, "spool"))
+os.environ.setdefault("RULES_FILE", os.path.join(_STATE, "rules.json"))
+os.environ.setdefault("INTEL_DIR", os.path.join(_STATE, "intel"))
+os.environ.setdefault("STORE_DIR", "")
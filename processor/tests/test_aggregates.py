@@ -0,0 +1,53 @@
+import math
+import random
+
+import pytest
+
+from aggregates import CACHE_LIMIT, HyperLogLog, SpaceSaving, StreamStats
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 20000, 200000])
+def test_hyperloglog_count_within_error_bound(distinct):
+    sketch = HyperLogLog(precision=12)
+    sketch.add_many(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(distinct))
+    # Hashing is deterministic, so three standard errors is a fixed, not a flaky, margin
+    bound = 3 * 1.04 / math.sqrt(sketch.size)
+    assert abs(sketch.count() - distinct) <= max(1, bound * distinct)
+
+
+def test_hyperloglog_ignores_repeats_and_merges_as_union():
+    left, right = HyperLogLog(10), HyperLogLog(10)
+    left.add_many(str(i) for i in range(5000))
+    left.add_many(str(i) for i in range(5000))
+    right.add_many(str(i) for i in range(2500, 7500))
+    union = HyperLogLog(10)
+    union.add_many(str(i) for i in range(7500))
+    left.merge(right)
+    assert left.registers == union.registers
+
+
+def test_space_saving_counts_bound_the_true_counts():
+    rng = random.Random(7)
+    truth = {}
+    sketch = SpaceSaving(capacity=20)
+    for _ in range(200):
+        batch = [(f"host-{min(int(rng.paretovariate(1.2)), 500)}", rng.randint(1, 5)) for _ in range(50)]
+        for item, count in batch:
+            truth[item] = truth.get(item, 0) + count
+        sketch.update(batch)
+    total = sum(truth.values())
+    for item, count, error in sketch.top(20):
+        assert count - error <= truth[item] <= count
+        assert error <= total / sketch.capacity
+    heavy = sorted(truth, key=truth.get, reverse=True)[:3]
+    assert heavy == [item for item, _, _ in sketch.top(3)]
+
+
+def test_snapshot_cache_is_bounded():
+    stats = StreamStats(window_seconds=60, windows=60, top_k=100)
+    stats.add_events("conn", [{"id_orig_h": "10.0.0.1", "id_resp_h": "10.0.0.2", "orig_bytes": 10}])
+    for windows in range(1, 61):
+        for top in range(1, 5):
+            stats.snapshot(windows, top)
+    assert len(stats._cache) <= CACHE_LIMIT
+    assert stats.snapshot(1, 1)["totals"]["bytes"] == 10
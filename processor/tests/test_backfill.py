@@ -0,0 +1,47 @@
+import json
+
+import backfill
+from backfill import MAX_ATTEMPTS, Backfill
+
+CONN_HEADER = (
+    "#separator \\x09\n#path\tconn\n"
+    "#fields\tts\tuid\tid.orig_h\tid.orig_p\tid.resp_h\tid.resp_p\tproto\n"
+    "#types\ttime\tstring\taddr\tport\taddr\tport\tenum\n"
+)
+
+
+class _Response:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = responses
+        self.posts = []
+
+    def post(self, url, params=None, json=None, timeout=None):
+        self.posts.append(json)
+        return self.responses.pop(0)
+
+
+def test_run_of_503s_does_not_use_up_attempts(tmp_path, monkeypatch):
+    log = tmp_path / "conn.log"
+    log.write_text(CONN_HEADER + "".join(
+        f"1700000000.{i}\tC{i}\t10.0.0.1\t4000{i}\t10.0.0.2\t443\ttcp\n" for i in range(3)
+    ))
+    monkeypatch.setattr(backfill.time, "sleep", lambda seconds: None)
+    job = Backfill([log], processor_url="http://processor", rate=1000, manifest=str(tmp_path / "manifest.json"))
+    busy = [_Response(503, headers={"Retry-After": "1"}) for _ in range(MAX_ATTEMPTS * 2)]
+    job._local.session = session = _Session(busy + [_Response(200, {"failed": 0})])
+
+    assert job.process_file(log)
+    assert len(session.posts) == MAX_ATTEMPTS * 2 + 1
+    assert job.events_sent == 3 and job.files_done == 1 and job.files_failed == 0
+    assert job.manifest.start(log)["done"]
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from cluster import ClusterSender, HashRing, parse_members
+
+KEYS = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(20000)]
+REPLICAS = ["http://p1:8000", "http://p2:8000", "http://p3:8000"]
+
+
+def test_placement_is_stable_and_balanced():
+    ring = HashRing(REPLICAS)
+    placement = [ring.node_for(key) for key in KEYS]
+    # Order of the member list must not matter, so every watcher agrees
+    reordered = HashRing(reversed(REPLICAS))
+    assert placement == [reordered.node_for(key) for key in KEYS]
+    for replica in REPLICAS:
+        assert 0.25 < placement.count(replica) / len(KEYS) < 0.42
+
+
+def test_adding_a_replica_moves_about_one_in_n_keys():
+    before = HashRing(REPLICAS)
+    after = HashRing(REPLICAS + ["http://p4:8000"])
+    moved = [key for key in KEYS if before.node_for(key) != after.node_for(key)]
+    assert 0.18 < len(moved) / len(KEYS) < 0.32
+    # Keys only move to the new replica, never between existing ones
+    assert {after.node_for(key) for key in moved} == {"http://p4:8000"}
+
+
+def test_empty_ring_has_no_owner():
+    with pytest.raises(ValueError):
+        HashRing([]).node_for("10.0.0.1")
+
+
+def test_parse_members_skips_blanks_comments_and_duplicates():
+    assert parse_members("http://p1:8000/, http://p2:8000\n# spare\n\nhttp://p1:8000 # again") == [
+        "http://p1:8000", "http://p2:8000",
+    ]
+
+
+def test_partition_keeps_sources_together_and_in_order():
+    sender = ClusterSender(REPLICAS)
+    try:
+        events = [{"id_orig_h": KEYS[i % 50], "uid": f"C{i}", "n": i} for i in range(500)]
+        partitions = sender.partition(events)
+        assert sum(len(group) for group in partitions.values()) == len(events)
+        for member, group in partitions.items():
+            assert [event["n"] for event in group] == sorted(event["n"] for event in group)
+            assert {sender.ring.node_for(event["id_orig_h"]) for event in group} == {member}
+        # Without a source address an event follows its uid
+        assert list(sender.partition([{"uid": "Cabc"}])) == [sender.ring.node_for("Cabc")]
+    finally:
+        sender.close()
+
+
+def test_members_file_is_reloaded_when_it_changes(tmp_path):
+    members_file = tmp_path / "replicas"
+    members_file.write_text("\n".join(REPLICAS[:2]) + "\n")
+    sender = ClusterSender(["http://static:8000"], members_file=str(members_file), reload_interval=0)
+    try:
+        assert sender.members == REPLICAS[:2]
+        assert not sender.reload()
+        rebalances = sender.rebalances
+
+        members_file.write_text("\n".join(REPLICAS) + "\n")
+        assert sender.reload()
+        assert sender.members == REPLICAS
+        assert sender.rebalances == rebalances + 1
+
+        # An empty file keeps the current members rather than dropping every replica
+        members_file.write_text("# draining\n")
+        assert not sender.reload()
+        assert sender.members == REPLICAS
+
+        # Without the file, the configured members apply again
+        os.remove(members_file)
+        assert sender.reload()
+        assert sender.members == ["http://static:8000"]
+        assert sender.stats()["rebalances"] == rebalances + 2
+    finally:
+        sender.close()
@@ -0,0 +1,52 @@
+import json
+
+from columnar import ColumnarBatch, enrich_and_encode
+from geoip import GeoIPEngine
+from log_types import LOG_TYPES
+
+CONN = LOG_TYPES["conn"]
+
+
+def _encode(lines, extra=None, extra_keys=()):
+    records = [json.loads(line) for line in lines]
+    batch = ColumnarBatch(records, CONN.batch_columns(records), validate=False)
+    batch.raw = lines
+    payloads = enrich_and_encode(batch, GeoIPEngine(), CONN, "main", "zeek", extra, extra_keys)
+    return [payload.decode() for payload in payloads]
+
+
+def _pairs(payload):
+    """The event's keys in order, failing on invalid JSON"""
+    return json.loads(payload, object_pairs_hook=lambda pairs: pairs)[0][1]
+
+
+def test_plain_events_are_spliced_as_they_are():
+    line = '{"uid":"C1","id_orig_h":"10.0.0.1","note":"as sent"}'
+    [payload] = _encode([line])
+    assert payload.startswith('{"event":' + line[:-1] + ',"orig_geoip":')
+    assert json.loads(payload)["event"]["processor_version"]
+
+
+def test_empty_object_gets_valid_json():
+    for line in ("{}", "{ }"):
+        [payload] = _encode([line], extra=[',"intel":[]'], extra_keys=["intel"])
+        event = json.loads(payload)["event"]
+        assert set(event) == {"intel", "processed_at", "processor_version"}
+
+
+def test_enrichment_keys_already_present_are_replaced_not_duplicated():
+    lines = [
+        '{"uid":"C1","id_orig_h":"10.0.0.1","orig_geoip":{"country":"XX"},"processed_at":1}',
+        '{"uid":"C2","id_orig_h":"10.0.0.2","intel" : ["stale"]}',
+        '{"uid":"C3","id_orig_h":"10.0.0.3","\\u0070rocessor_version":"old"}',
+    ]
+    payloads = _encode(lines, extra=[',"intel":["new"]', ',"intel":["new"]', ""], extra_keys=["intel"])
+    for payload in payloads:
+        keys = [key for key, _ in _pairs(payload)]
+        assert len(keys) == len(set(keys)), keys
+    events = [json.loads(payload)["event"] for payload in payloads]
+    assert events[0]["orig_geoip"]["country"] != "XX"
+    assert events[0]["processed_at"] != 1
+    assert events[1]["intel"] == ["new"]
+    assert events[2]["processor_version"] != "old"
+    assert [event["uid"] for event in events] == ["C1", "C2", "C3"]
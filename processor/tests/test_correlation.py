@@ -0,0 +1,67 @@
+import json
+import time
+
+from correlation import CorrelationCache
+
+
+def _dns(uid, query):
+    return {"uid": uid, "query": query, "qtype_name": "A", "rcode_name": "NOERROR", "answers": ["192.0.2.1"]}
+
+
+def test_conn_is_joined_to_its_records():
+    cache = CorrelationCache()
+    cache.record("dns", [_dns("C1", "example.com"), _dns("C2", "example.org")])
+    cache.record("ssl", [{"uid": "C1", "server_name": "example.com", "established": True}])
+    event = cache.join({"uid": "C1", "service": "ssl,dns"})
+    assert event["correlated"]["dns"][0]["query"] == "example.com"
+    assert event["correlated"]["ssl"] == [{"server_name": "example.com", "established": True}]
+    assert cache.stats()["joined"] == 1
+
+
+def test_records_stay_for_a_resent_conn():
+    cache = CorrelationCache()
+    cache.record("dns", [_dns("C1", "example.com")])
+    first = cache.join({"uid": "C1", "service": "dns"})
+    again = cache.join({"uid": "C1", "service": "dns"})
+    assert first["correlated"] == again["correlated"]
+    # A join is a copy, unaffected by records that arrive later
+    cache.record("dns", [_dns("C1", "retry.example.com")])
+    assert len(first["correlated"]["dns"]) == 1
+
+
+def test_records_expire_after_ttl():
+    cache = CorrelationCache(ttl=0.05)
+    cache.record("dns", [_dns("C1", "example.com")])
+    time.sleep(0.1)
+    event = cache.join({"uid": "C1", "service": "dns"})
+    assert "correlated" not in event
+    stats = cache.stats()
+    assert stats["missed"] == 1 and stats["uids"] == 0
+
+
+def test_only_conns_with_an_application_service_count_as_missed():
+    cache = CorrelationCache()
+    cache.join({"uid": "C1", "service": None})
+    cache.join({"uid": "C2", "service": "ntp"})
+    cache.join({"uid": "C3", "service": "http"})
+    assert cache.stats()["missed"] == 1
+
+
+def test_uids_and_records_per_protocol_are_bounded():
+    cache = CorrelationCache(max_uids=2, max_records=2)
+    cache.record("dns", [_dns(f"C{i}", f"host{i}.example") for i in range(3)])
+    cache.record("dns", [_dns("C2", f"retry{i}.example") for i in range(3)])
+    assert list(cache.entries) == ["C1", "C2"]
+    assert len(cache.entries["C2"][1]["dns"]) == 2
+    assert cache.stats()["uids"] == 2
+
+
+def test_fragments_are_spliceable_json():
+    cache = CorrelationCache()
+    cache.record("http", [{"uid": "C2", "method": "GET", "host": "example.com", "uri": "/"}])
+    assert cache.fragments(["C1"], [None]) is None
+    fragments = cache.fragments(["C1", "C2", None], [None, "http", None])
+    assert fragments[0] == fragments[2] == ""
+    assert json.loads("{" + fragments[1][1:] + "}") == {
+        "correlated": {"http": [{"method": "GET", "host": "example.com", "uri": "/"}]}
+    }
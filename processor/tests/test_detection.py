@@ -0,0 +1,93 @@
+from detection import Detector
+
+T0 = 1700000000.0
+
+
+def _conn(ts, source="10.0.0.1", host="10.0.0.2", port=443, uid=None):
+    return {"ts": ts, "uid": uid, "id_orig_h": source, "id_resp_h": host, "id_resp_p": port, "proto": "tcp"}
+
+
+def _sweep(start, hosts, source="10.0.0.1", port=22):
+    return [_conn(start + i * 0.1, source, f"10.1.{i // 256}.{i % 256}", port) for i in range(hosts)]
+
+
+def _beacon(times, source="10.0.0.1", host="203.0.113.5", port=443):
+    return [_conn(ts, source, host, port, uid=f"C{i}") for i, ts in enumerate(times)]
+
+
+def test_host_sweep_within_the_window_is_a_scan():
+    detector = Detector(scan_hosts=100, scan_ports=100)
+    detector.add(_sweep(T0, 200))
+    detections = detector.ready()
+    assert [d["detection"] for d in detections] == ["scan"]
+    assert detections[0]["id_orig_h"] == "10.0.0.1"
+    assert 170 <= detections[0]["distinct_hosts"] <= 230
+    assert detections[0]["distinct_ports"] == 1
+
+
+def test_fan_out_below_the_threshold_is_not_a_scan():
+    detector = Detector(scan_hosts=100, scan_ports=100)
+    detector.add(_sweep(T0, 50))
+    assert detector.ready() == []
+
+
+def test_fan_out_spread_past_the_window_is_not_a_scan():
+    detector = Detector(scan_window=300, scan_buckets=5, scan_hosts=100, scan_ports=100)
+    # 60 hosts now and 60 more ten minutes later never share a window
+    detector.add(_sweep(T0, 60))
+    detector.add([dict(event, ts=event["ts"] + 600, id_resp_h=event["id_resp_h"].replace("10.1.", "10.2."))
+                  for event in _sweep(T0, 60)])
+    assert detector.ready() == []
+
+
+def test_scan_is_not_reported_again_within_the_cooldown():
+    detector = Detector(scan_hosts=100, scan_ports=100, cooldown=3600)
+    detector.add(_sweep(T0, 200))
+    detector.add(_sweep(T0 + 60, 200, port=23))
+    assert len(detector.ready()) == 1
+    assert detector.stats()["detections"]["scan"] == 1
+
+
+def test_steady_interval_is_a_beacon_even_out_of_order():
+    detector = Detector()
+    times = [T0 + 60 * i for i in range(8)]
+    # Zeek logs connections as they end, so start times arrive shuffled
+    detector.add(_beacon(times[:3] + times[5:] + times[3:5]))
+    detections = detector.ready()
+    assert [d["detection"] for d in detections] == ["beacon"]
+    beacon = detections[0]
+    assert beacon["interval"] == 60
+    assert beacon["jitter"] == 0
+    assert beacon["severity"] == "high"
+    assert beacon["conn_count"] == 8
+    assert (beacon["first_ts"], beacon["last_ts"]) == (times[0], times[-1])
+    assert (beacon["id_resp_h"], beacon["id_resp_p"]) == ("203.0.113.5", 443)
+
+
+def test_small_jitter_is_still_a_beacon():
+    detector = Detector(beacon_max_jitter=0.1)
+    offsets = [0, 2, -3, 1, -1, 3, -2, 0]
+    detector.add(_beacon([T0 + 60 * i + offset for i, offset in enumerate(offsets)]))
+    detections = detector.ready()
+    assert len(detections) == 1
+    assert 0 < detections[0]["jitter"] <= 0.1
+
+
+def test_irregular_intervals_are_not_a_beacon():
+    detector = Detector(beacon_max_jitter=0.1)
+    ts, times = T0, []
+    for interval in (20, 100, 35, 90, 15, 110, 60, 45):
+        ts += interval
+        times.append(ts)
+    detector.add(_beacon(times))
+    assert detector.ready() == []
+
+
+def test_beacon_needs_min_events_and_min_interval():
+    detector = Detector(beacon_min_events=8, beacon_min_interval=10)
+    detector.add(_beacon([T0 + 60 * i for i in range(7)]))
+    assert detector.ready() == []
+    detector.add(_beacon([T0 + 2 * i for i in range(16)], host="203.0.113.6"))
+    assert detector.ready() == []
+    detector.add(_beacon([T0 + 60 * 7]))
+    assert [d["id_resp_h"] for d in detector.ready()] == ["203.0.113.5"]
@@ -0,0 +1,95 @@
+import pytest
+from mmdb_writer import MMDBWriter
+from netaddr import IPSet
+
+from geoip import GeoIPEngine
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory):
+    """A tiny City and ASN database pair, written in MaxMind format"""
+    directory = tmp_path_factory.mktemp("geoip")
+    city = MMDBWriter(ip_version=6, database_type="GeoLite2-City", ipv4_compatible=True)
+    city.insert_network(IPSet(["8.8.8.0/24"]), {
+        "country": {"iso_code": "US", "names": {"en": "United States"}},
+        "city": {"names": {"en": "Mountain View"}},
+        "location": {"latitude": 37.386, "longitude": -122.0838},
+    })
+    city.insert_network(IPSet(["2001:db8::/32"]), {
+        "country": {"iso_code": "DE", "names": {"en": "Germany"}},
+        "city": {"names": {"en": "Berlin"}},
+        "location": {"latitude": 52.52, "longitude": 13.405},
+    })
+    city.to_db_file(str(directory / "city.mmdb"))
+    asn = MMDBWriter(ip_version=6, database_type="GeoLite2-ASN", ipv4_compatible=True)
+    asn.insert_network(IPSet(["8.8.8.0/24"]), {
+        "autonomous_system_number": 15169, "autonomous_system_organization": "GOOGLE",
+    })
+    asn.to_db_file(str(directory / "asn.mmdb"))
+    return str(directory / "city.mmdb"), str(directory / "asn.mmdb")
+
+
+@pytest.fixture
+def engine(databases):
+    engine = GeoIPEngine(*databases, cache_size=4)
+    yield engine
+    engine.close()
+
+
+def test_hit(engine):
+    assert engine.lookup("8.8.8.8") == {
+        "country": "US", "city": "Mountain View", "latitude": 37.386, "longitude": -122.0838, "isp": "GOOGLE",
+    }
+    assert engine.lookup("2001:db8::1")["city"] == "Berlin"
+
+
+def test_miss(engine):
+    assert engine.lookup("1.1.1.1") == {"country": None, "city": None, "latitude": None, "longitude": None, "isp": None}
+    assert engine.lookup("not an ip")["country"] is None
+
+
+@pytest.mark.parametrize("ip, label", [
+    ("10.1.2.3", "Private Network"),
+    ("192.168.0.1", "Private Network"),
+    ("100.64.0.1", "Carrier-Grade NAT"),
+    ("127.0.0.1", "Loopback"),
+    ("fe80::1", "Link-Local"),
+])
+def test_special_networks(engine, ip, label):
+    assert engine.lookup(ip) == {"country": "Private", "city": "Private", "latitude": None, "longitude": None,
+                                 "isp": label}
+
+
+def test_cache_hits_and_eviction(engine):
+    engine.lookup("8.8.8.8")
+    engine.lookup("8.8.8.8")
+    stats = engine.stats()
+    assert (stats["cache_hits"], stats["cache_misses"]) == (1, 1)
+
+    for i in range(1, 6):
+        engine.lookup(f"8.8.8.{i + 8}")
+    stats = engine.stats()
+    assert stats["cache_size"] == 4
+    # 8.8.8.8 was the least recently used entry and has been evicted
+    engine.lookup("8.8.8.8")
+    assert engine.stats()["cache_misses"] == stats["cache_misses"] + 1
+
+
+def test_lookup_json_matches_lookup(engine):
+    assert engine.lookup_json("8.8.8.8").startswith('{"country":"US","city":"Mountain View"')
+
+
+def test_missing_database(tmp_path):
+    engine = GeoIPEngine(str(tmp_path / "none.mmdb"), str(tmp_path / "none-asn.mmdb"))
+    assert engine.stats()["database"] is None
+    assert engine.lookup("8.8.8.8")["country"] is None
+    assert engine.lookup("10.0.0.1")["isp"] == "Private Network"
+
+
+def test_corrupt_database(tmp_path, databases):
+    corrupt = tmp_path / "corrupt.mmdb"
+    corrupt.write_bytes(b"not a maxmind database" * 100)
+    engine = GeoIPEngine(str(corrupt), databases[1])
+    assert engine.stats()["database"] is None
+    assert engine.lookup("8.8.8.8") == {"country": None, "city": None, "latitude": None, "longitude": None,
+                                        "isp": "GOOGLE"}
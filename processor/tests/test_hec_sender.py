@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+
+from hec_sender import HecSender
+
+
+def run_sender(handler, payloads, **kwargs):
+    async def go():
+        sender = HecSender("http://hec.test/services/collector/event", "token", "main",
+                           flush_interval=0.01, **kwargs)
+        await sender.start()
+        await sender._client.aclose()
+        sender._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await sender.send_encoded_failures(payloads), sender.stats()
+        finally:
+            await sender.stop()
+    return asyncio.run(go())
+
+
+def test_all_accepted():
+    failed, stats = run_sender(lambda request: httpx.Response(200), [b"a", b"b", b"c"], max_batch_events=2)
+    assert failed == []
+    assert stats["events_sent"] == 3
+
+
+def test_partial_failure_returns_only_failed_payloads():
+    payloads = [b'{"n":%d}' % i for i in range(5)]
+
+    def handler(request):
+        return httpx.Response(503 if b'{"n":2}' in request.content else 200)
+
+    failed, stats = run_sender(handler, payloads, max_batch_events=2)
+    assert failed == [payloads[2], payloads[3]]
+    assert stats["events_sent"] == 3
+    assert stats["events_failed"] == 2
+
+
+def test_unstarted_sender_starts_on_first_use():
+    async def go():
+        # Nothing listens on port 9, so the request fails fast instead of crashing the sender
+        sender = HecSender("http://127.0.0.1:9/services/collector/event", "token", "main",
+                           flush_interval=0.01, timeout=2)
+        await sender.enqueue({"uid": "C0"})
+        failed = await sender.send_encoded_failures([b"a"])
+        await sender.stop()
+        return failed, sender.stats()
+
+    failed, stats = asyncio.run(go())
+    assert failed == [b"a"]
+    assert stats["events_failed"] == 2
@@ -0,0 +1,81 @@
+import asyncio
+
+import ingest
+from checkpoint import CheckpointStore
+from ingest import MAX_ENCODE_ATTEMPTS, DirectIngest
+
+CONN_HEADER = (
+    "#separator \\x09\n#path\tconn\n"
+    "#fields\tts\tuid\tid.orig_h\tid.orig_p\tid.resp_h\tid.resp_p\tproto\n"
+    "#types\ttime\tstring\taddr\tport\taddr\tport\tenum\n"
+)
+
+
+def _ingest(tmp_path, encode):
+    """Run direct ingest over a three-line conn.log until something is delivered"""
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    log = logs / "conn.log"
+    log.write_text(CONN_HEADER + "".join(
+        f"1700000000.{i}\tC{i}\t10.0.0.1\t4000{i}\t10.0.0.2\t443\ttcp\n" for i in range(3)
+    ))
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    delivered = []
+
+    async def deliver(payloads, log_type):
+        delivered.extend(payloads)
+        return "sent"
+
+    async def run():
+        direct = DirectIngest(str(logs), encode, deliver, checkpoints=checkpoints, sweep_interval=0.05)
+        await direct.start()
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                # Nothing may be committed while the batch has not been delivered
+                assert delivered or checkpoints.get(str(log)) is None
+                if delivered:
+                    break
+            await asyncio.sleep(0.05)
+        finally:
+            await direct.stop()
+        return direct.stats()
+
+    stats = asyncio.run(run())
+    checkpoint = checkpoints.get(str(log))
+    return delivered, stats, checkpoint.offset if checkpoint else None, log.stat().st_size
+
+
+def test_failed_encode_is_retried_before_the_checkpoint_advances(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "ENCODE_RETRY_DELAY", 0.01)
+    attempts = []
+
+    def encode(records, schema, lines):
+        attempts.append(len(records))
+        if len(attempts) == 1:
+            raise RuntimeError("enrichment failed")
+        return [record["uid"].encode() for record in records]
+
+    delivered, stats, offset, size = _ingest(tmp_path, encode)
+    assert attempts == [3, 3]
+    assert delivered == [b"C0", b"C1", b"C2"]
+    assert stats["encode_failures"] == 1
+    assert offset == size
+
+
+def test_batch_that_keeps_failing_drops_only_the_bad_event(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "ENCODE_RETRY_DELAY", 0.01)
+    attempts = []
+
+    def encode(records, schema, lines):
+        attempts.append(len(records))
+        if any(record["uid"] == "C1" for record in records):
+            raise RuntimeError("enrichment failed")
+        return [record["uid"].encode() for record in records]
+
+    delivered, stats, offset, size = _ingest(tmp_path, encode)
+    assert attempts == [3] * MAX_ENCODE_ATTEMPTS + [1, 1, 1]
+    assert delivered == [b"C0", b"C2"]
+    assert stats["encode_failures"] == MAX_ENCODE_ATTEMPTS
+    assert stats["events_dropped"] == 1
+    assert offset == size
@@ -0,0 +1,114 @@
+import ipaddress
+import random
+
+import pytest
+
+from intel import IntelIndex, load_index, normalize_domain
+
+
+def _index(*indicators, feed="feed"):
+    return IntelIndex.build({feed: iter([(value, None, "high", "test") for value in indicators])})
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("10.0.0.0", "10.0.0.0/8"),
+    ("10.255.255.255", "10.0.0.0/8"),
+    ("9.255.255.255", None),
+    ("11.0.0.0", None),
+    ("10.1.2.0", "10.1.2.0/24"),
+    ("10.1.2.255", "10.1.2.0/24"),
+    ("10.1.3.0", "10.0.0.0/8"),
+    ("10.1.2.3", "10.1.2.3"),
+    ("10.1.2.4", "10.1.2.0/24"),
+    ("2001:db8::1", "2001:db8::/32"),
+    ("2001:db9::", None),
+])
+def test_ip_ranges_match_the_most_specific_indicator(address, expected):
+    index = _index("10.0.0.0/8", "10.1.2.0/24", "10.1.2.3", "2001:db8::/32", "192.0.2.7/24")
+    match = index.match_ip(address)
+    assert (match[0] if match else None) == expected
+
+
+def test_cidr_host_bits_are_masked():
+    index = _index("192.0.2.7/24")
+    assert index.match_ip("192.0.2.200")[0] == "192.0.2.0/24"
+
+
+def test_nested_ranges_agree_with_brute_force():
+    rng = random.Random(3)
+    networks = set()
+    for _ in range(200):
+        length = rng.choice([8, 12, 16, 20, 24, 28, 32])
+        address = rng.getrandbits(32) & 0x0AFFFFFF | 0x0A000000
+        networks.add(ipaddress.ip_network(f"{ipaddress.ip_address(address)}/{length}", strict=False))
+    index = _index(*(str(network) for network in networks))
+    for _ in range(2000):
+        address = ipaddress.ip_address(rng.getrandbits(32) & 0x0AFFFFFF | 0x0A000000)
+        covering = [network for network in networks if address in network]
+        match = index.match_ip(str(address))
+        if not covering:
+            assert match is None
+        else:
+            innermost = max(covering, key=lambda network: network.prefixlen)
+            assert match is not None
+            assert ipaddress.ip_network(match[0]) == innermost
+
+
+def test_invalid_addresses_do_not_match():
+    index = _index("10.0.0.0/8")
+    assert index.match_ip("not-an-ip") is None
+    assert index.match_ip("") is None
+
+
+def test_domains_and_wildcards():
+    index = _index("evil.example", "*.bad.example", "*.deep.bad.example")
+    assert index.match_domain("EVIL.example.")[0] == "evil.example"
+    assert index.match_domain("sub.evil.example") is None
+    assert index.match_domain("bad.example") is None
+    assert index.match_domain("x.bad.example")[0] == "*.bad.example"
+    assert index.match_domain("a.b.bad.example:8080")[0] == "*.bad.example"
+    assert index.match_domain("x.deep.bad.example")[0] == "*.deep.bad.example"
+    assert index.match_domain("notbad.example") is None
+
+
+def test_hashes_and_invalid_indicators():
+    ja3 = "e7d705a3286e19ea42f587b344ee6865"
+    index = _index(ja3.upper(), "not a valid indicator!", "300.1.1.1")
+    assert index.match_hash(ja3)[0] == ja3
+    assert index.counts["hash"] == 1
+    assert index.counts["invalid"] == 2
+
+
+def test_normalize_domain():
+    assert normalize_domain("Example.COM.") == "example.com"
+    assert normalize_domain("example.com:443") == "example.com"
+
+
+def test_zeek_and_plain_feeds(tmp_path):
+    (tmp_path / "zeek.intel").write_text(
+        "#fields\tindicator\tindicator_type\tmeta.source\tmeta.desc\n"
+        "198.51.100.9\tIntel::ADDR\tfeed\tC2 server\n"
+        "c2.example\tIntel::DOMAIN\tfeed\t-\n"
+    )
+    (tmp_path / "plain.txt").write_text("# comment\n203.0.113.0/24,medium,scanner range\n\n")
+    index = load_index(str(tmp_path))
+    tags = index.match_event(
+        {"id_orig_h": "203.0.113.5", "id_resp_h": "198.51.100.9", "query": "c2.example"},
+        ["id_orig_h", "id_resp_h"],
+    )
+    assert [(tag["field"], tag["feed"], tag["type"]) for tag in tags] == [
+        ("id_orig_h", "plain", "cidr"), ("id_resp_h", "zeek", "ip"), ("query", "zeek", "domain"),
+    ]
+    assert tags[0]["severity"] == "medium" and tags[0]["description"] == "scanner range"
+    assert tags[1]["description"] == "C2 server"
+    assert "description" not in tags[2]
+
+
+def test_match_columns_tags_only_matching_rows():
+    index = _index("10.0.0.0/8")
+    columns = {"id_orig_h": ["10.0.0.1", "192.0.2.1", None], "id_resp_h": ["192.0.2.2", "10.9.9.9", 5]}
+    fragments = index.match_columns(columns, 3, ["id_orig_h", "id_resp_h"])
+    assert fragments[0].startswith(',"intel":[{"indicator":"10.0.0.0/8"')
+    assert '"field":"id_resp_h"' in fragments[1]
+    assert fragments[2] == ""
+    assert index.match_columns({"id_orig_h": ["192.0.2.1"]}, 1, ["id_orig_h"]) is None
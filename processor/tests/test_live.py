@@ -0,0 +1,32 @@
+import asyncio
+
+from live import LiveHub
+
+
+def _hub(**kwargs):
+    totals = {"connections": 0, "bytes": 0, "packets": 0, "events": {}}
+    return LiveHub(lambda: {"totals": totals}, **kwargs)
+
+
+def test_unread_stream_registers_no_subscriber():
+    hub = _hub()
+
+    async def go():
+        hub.stream({"conn"})
+        await asyncio.sleep(0)
+
+    asyncio.run(go())
+    assert hub.stats()["subscribers"] == 0
+
+
+def test_subscriber_is_removed_when_the_client_goes_away():
+    hub = _hub(max_subscribers=1)
+
+    async def go():
+        body = hub.stream()
+        assert await body.__anext__() == b"retry: 3000\n\n"
+        assert hub.stats()["subscribers"] == 1 and hub.full()
+        await body.aclose()
+
+    asyncio.run(go())
+    assert hub.stats()["subscribers"] == 0 and not hub.full()
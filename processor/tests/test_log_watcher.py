@@ -0,0 +1,133 @@
+import json
+
+from checkpoint import CheckpointStore
+from log_watcher import LogWatcher
+
+CONN_HEADER = (
+    "#separator \\x09\n#path\tconn\n"
+    "#fields\tts\tuid\tid.orig_h\tid.orig_p\tid.resp_h\tid.resp_p\tproto\n"
+    "#types\ttime\tstring\taddr\tport\taddr\tport\tenum\n"
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = json.dumps({"status": status_code})
+
+
+def _lines(start, count, source="10.0.0.1"):
+    return "".join(
+        f"1700000000.{i}\tC{i}\t{source}\t4000{i}\t10.0.0.2\t443\ttcp\n" for i in range(start, start + count)
+    )
+
+
+def _watch(logs, checkpoints, statuses, processor_url="http://processor", **kwargs):
+    """A watcher whose posts are recorded as (replica, uids); statuses are popped per replica"""
+    watcher = LogWatcher(str(logs), processor_url, checkpoints=checkpoints, **kwargs)
+    posts = []
+
+    def post(replica, path, params=None, json=None):
+        posts.append((replica, [event["uid"] for event in json]))
+        pending = statuses.get(replica) or statuses.get(None) or []
+        return FakeResponse(pending.pop(0) if pending else 200)
+
+    watcher.sender.post = post
+    return watcher, posts
+
+
+def _watcher(tmp_path, statuses, lines=3):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    log = logs / "conn.log"
+    log.write_text(CONN_HEADER + _lines(0, lines))
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    watcher, posts = _watch(logs, checkpoints, {None: statuses})
+    return watcher, log, posts
+
+
+def _sent(posts):
+    return [uid for _, uids in posts for uid in uids]
+
+
+def test_rejected_batch_is_skipped_and_committed(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [422])
+    assert watcher.process_log_file(log)
+    assert len(posts) == 1
+    assert watcher.file_positions[str(log)] == log.stat().st_size
+    assert not watcher.unsent
+    assert watcher.events_rejected.values[("conn", "http://processor")] == 3
+
+
+def test_unavailable_processor_holds_position_until_retry(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [500])
+    assert not watcher.process_log_file(log)
+    assert watcher.file_positions.get(str(log), 0) < log.stat().st_size
+    assert watcher.process_log_file(log)
+    assert _sent(posts) == ["C0", "C1", "C2"] * 2
+    assert watcher.file_positions[str(log)] == log.stat().st_size
+
+
+def test_rotated_file_is_finished_before_the_new_one(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [])
+    assert watcher.process_log_file(log)
+    with open(log, "a") as f:
+        f.write(_lines(3, 2))
+    log.rename(log.with_name("conn.2023-11-14-22-00-00.log"))
+    log.write_text(CONN_HEADER + _lines(5, 1))
+    assert watcher.process_log_file(log)
+    assert _sent(posts) == ["C0", "C1", "C2", "C3", "C4", "C5"]
+    assert watcher.file_positions[str(log)] == log.stat().st_size
+
+
+def test_truncated_file_is_read_from_the_start(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [])
+    assert watcher.process_log_file(log)
+    log.write_text(CONN_HEADER + _lines(9, 1))
+    assert watcher.process_log_file(log)
+    assert _sent(posts) == ["C0", "C1", "C2", "C9"]
+    assert watcher.file_positions[str(log)] == log.stat().st_size
+
+
+def test_restart_resumes_from_the_checkpoint(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [])
+    assert watcher.process_log_file(log)
+    with open(log, "a") as f:
+        f.write(_lines(3, 1))
+    restarted, posts = _watch(log.parent, CheckpointStore(str(tmp_path / "checkpoints.json")), {})
+    assert restarted.process_log_file(log)
+    assert _sent(posts) == ["C3"]
+
+
+def test_restart_finishes_a_file_rotated_while_down(tmp_path):
+    watcher, log, posts = _watcher(tmp_path, [])
+    assert watcher.process_log_file(log)
+    with open(log, "a") as f:
+        f.write(_lines(3, 1))
+    log.rename(log.with_name("conn.2023-11-14-22-00-00.log"))
+    log.write_text(CONN_HEADER + _lines(5, 1))
+    restarted, posts = _watch(log.parent, CheckpointStore(str(tmp_path / "checkpoints.json")), {})
+    assert restarted.process_log_file(log)
+    assert _sent(posts) == ["C3", "C5"]
+
+
+def test_events_of_a_departed_replica_are_repartitioned(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    log = logs / "conn.log"
+    log.write_text(CONN_HEADER + "".join(_lines(i, 1, source=f"10.0.{i}.1") for i in range(20)))
+    members = tmp_path / "replicas"
+    members.write_text("http://p1\nhttp://p2\n")
+    watcher, posts = _watch(logs, None, {"http://p1": [500]}, members_file=str(members),
+                            members_reload_interval=0)
+    assert not watcher.process_log_file(log)
+    refused = [uid for replica, uids in posts if replica == "http://p1" for uid in uids]
+    assert refused and len(refused) < 20
+
+    # p1 leaves the cluster: what it refused goes to the remaining replica, nothing else is resent
+    members.write_text("http://p2\n")
+    posts.clear()
+    assert watcher.process_log_file(log)
+    assert posts == [("http://p2", refused)]
+    assert watcher.file_positions[str(log)] == log.stat().st_size
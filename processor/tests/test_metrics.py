@@ -0,0 +1,30 @@
+import sys
+import threading
+
+from metrics import Counter, Histogram
+
+
+def test_concurrent_updates_are_not_lost():
+    counter = Counter("test_total", "Test counter", ["kind"])
+    histogram = Histogram("test_seconds", "Test histogram", buckets=(0.5,))
+    threads, per_thread = 8, 20000
+
+    def work():
+        for _ in range(per_thread):
+            counter.inc("a")
+            histogram.observe(value=0.25)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert counter.values[("a",)] == threads * per_thread
+    assert histogram.counts[()] == [threads * per_thread, 0]
+    assert histogram.sums[()] == 0.25 * threads * per_thread
+    assert f"test_seconds_count {threads * per_thread}" in histogram.render()
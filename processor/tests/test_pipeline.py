@@ -0,0 +1,64 @@
+import asyncio
+
+from pipeline import Pipeline
+from spool import Spool
+
+CONN_HEADER = (
+    "#separator \\x09\n#path\tconn\n"
+    "#fields\tts\tuid\tid.orig_h\tid.orig_p\tid.resp_h\tid.resp_p\tproto\n"
+    "#types\ttime\tstring\taddr\tport\taddr\tport\tenum\n"
+)
+
+
+class FakeSender:
+    """Accepts payloads except on the calls listed in `refuse`"""
+    index = "main"
+    source = "zeek_processor"
+
+    def __init__(self, refuse):
+        self.refuse = refuse
+        self.calls = 0
+        self.accepted = []
+
+    async def send_encoded_failures(self, payloads):
+        self.calls += 1
+        if self.calls in self.refuse:
+            return list(payloads)
+        self.accepted.extend(payloads)
+        return []
+
+
+def _run(tmp_path, sender):
+    log = tmp_path / "conn.log"
+    log.write_text(CONN_HEADER + "".join(
+        f"1700000000.{i}\tC{i}\t10.0.0.1\t4000{i}\t10.0.0.2\t443\ttcp\n" for i in range(20)
+    ))
+    spool = Spool(str(tmp_path / "spool"))
+    pipeline = Pipeline(workers=1, chunk_bytes=1 << 20, sender=sender, rules_file="", intel_dir="", spool=spool)
+    result = asyncio.run(pipeline.run([str(log)]))
+    spool.close()
+    return result
+
+
+def test_refused_payloads_are_spooled_not_dropped(tmp_path):
+    sender = FakeSender(refuse=set(range(1, 100)))
+    result = _run(tmp_path, sender)
+    assert result["events"] == 0
+    assert result["events_failed"] == 0
+    assert result["events_spooled"] == 20
+    assert result["spool_pending_bytes"] > 0
+    # A later run replays them first
+    sender = FakeSender(refuse=set())
+    (tmp_path / "conn.log").unlink()
+    result = _run(tmp_path, sender)
+    assert result["spool_pending_bytes"] == 0
+    assert len(sender.accepted) == 40
+
+
+def test_spooled_payloads_are_replayed_once_hec_recovers(tmp_path):
+    sender = FakeSender(refuse={1})
+    result = _run(tmp_path, sender)
+    assert result["events_spooled"] == 20
+    assert result["spool_pending_bytes"] == 0
+    assert len(sender.accepted) == 20
+    assert len(set(sender.accepted)) == 20
@@ -0,0 +1,22 @@
+import main
+from log_types import LOG_TYPES
+
+
+def test_invalid_events_fail_alone():
+    raw_events = [
+        {"ts": 1700000000.0, "uid": "C1", "id_orig_h": "10.0.0.1", "id_orig_p": 40000,
+         "id_resp_h": "10.0.0.2", "id_resp_p": 443, "proto": "tcp"},
+        {"ts": 1700000001.0, "uid": "C2", "id_orig_h": "10.0.0.1", "id_orig_p": "not-a-port",
+         "id_resp_h": "10.0.0.2", "id_resp_p": 443, "proto": "tcp"},
+        "not an object",
+        {"ts": "1700000002.0", "uid": "C3", "id_orig_h": "10.0.0.3", "id_orig_p": "40001",
+         "id_resp_h": "10.0.0.2", "id_resp_p": 443, "proto": "tcp"},
+    ]
+    results, accepted, folded = [], [], []
+    payloads = main.encode_batch_per_event(raw_events, results, LOG_TYPES["conn"], accepted, folded)
+
+    assert [result["status"] for result in results] == ["success", "failed", "failed", "success"]
+    assert [result["uid"] for result in results] == ["C1", "C2", None, "C3"]
+    assert results[1]["error"].startswith("Invalid event")
+    assert len(payloads) == 2
+    assert [event["uid"] for event in accepted] == ["C1", "C3"]
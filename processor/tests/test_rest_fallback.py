@@ -0,0 +1,36 @@
+import json
+
+import main
+from hec_sender import encode_event
+
+
+class FakeResponse:
+    status_code = 200
+    text = ""
+
+
+def test_rest_fallback_posts_bare_events_with_metadata_params(monkeypatch):
+    posts = []
+
+    def post(url, data=None, params=None, **kwargs):
+        posts.append((url, data, params))
+        return FakeResponse()
+
+    monkeypatch.setattr(main.requests, "post", post)
+    body = b"\n".join([
+        encode_event({"uid": "C1", "ts": 1.5}, "main", "zeek_processor", "zeek_conn_enriched"),
+        encode_event({"uid": "D1", "ts": 2.5}, "main", "zeek_processor", "zeek_dns_enriched"),
+        encode_event({"uid": "C2", "ts": 3.5}, "main", "zeek_processor", "zeek_conn_enriched"),
+    ])
+    assert main.send_to_splunk_rest(body)
+
+    assert len(posts) == 2
+    url, data, params = posts[0]
+    assert url.endswith("/services/receivers/simple")
+    assert params["sourcetype"] == "zeek_conn_enriched"
+    assert params["index"] == "main"
+    assert params["host"]
+    assert [json.loads(line) for line in data.decode().splitlines()] == [
+        {"uid": "C1", "ts": 1.5}, {"uid": "C2", "ts": 3.5},
+    ]
+    assert posts[1][2]["sourcetype"] == "zeek_dns_enriched"
@@ -0,0 +1,17 @@
+from rollup import FlowRollup
+
+
+def _conn(ts, uid):
+    return {"ts": ts, "uid": uid, "id_orig_h": "10.0.0.1", "id_resp_h": "10.0.0.2",
+            "id_resp_p": 123, "proto": "udp", "service": "ntp", "orig_bytes": 48}
+
+
+def test_mixed_string_and_float_ts_are_compared_as_epoch_seconds():
+    rollup = FlowRollup(window=60)
+    rollup.add([_conn("1700000010.5", "C1"), _conn(1700000002.0, "C2"), _conn("1700000020", "C3")], now=0)
+    rollup.add([_conn("-", "C4"), _conn(None, "C5")], now=1)
+    [summary] = rollup.expired(now=61)
+    assert summary["first_ts"] == summary["ts"] == 1700000002.0
+    assert summary["last_ts"] == 1700000020.0
+    assert summary["conn_count"] == 5
+    assert summary["orig_bytes"] == 240
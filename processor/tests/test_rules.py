@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from rules import RuleEngine, RuleError, RuleSet
+
+VALID = {"rules": [{"name": "ssh", "match": {"port": [22]}, "action": "drop"}]}
+
+
+@pytest.mark.parametrize("config", [
+    [],
+    "keep",
+    {"rules": {"name": "ssh"}},
+    {"rules": ["ssh"]},
+    {"rules": [{"action": "sample", "rate": "abc"}]},
+    {"rules": [{"action": "sample", "rate": True}]},
+    {"rules": [{"action": "sample", "rate": 2}]},
+    {"rules": [{"action": "route", "index": 5}]},
+    {"rules": [{"action": "drop", "match": {"src": ["not-an-address"]}}]},
+    {"rules": [{"action": "drop", "match": {"port": ["abc"]}}]},
+    {"rules": [{"action": "drop", "match": {"proto": [["tcp"]]}}]},
+    {"rules": [{"action": "drop", "log_types": "conn"}]},
+])
+def test_invalid_config_raises_rule_error(config):
+    with pytest.raises(RuleError):
+        RuleSet(config)
+
+
+def test_valid_rules_match():
+    rule_set = RuleSet(VALID)
+    assert rule_set.target("conn", {"id_orig_h": "10.0.0.1", "id_resp_p": 22}, "zeek") is None
+    assert rule_set.target("conn", {"id_orig_h": "10.0.0.1", "id_resp_p": 443}, "zeek") == "zeek"
+
+
+def _write(path, content, mtime):
+    path.write_text(content if isinstance(content, str) else json.dumps(content))
+    os.utime(path, (mtime, mtime))
+
+
+def test_failed_reload_keeps_previous_rules_and_retries(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, VALID, 1000)
+    engine = RuleEngine(str(path), reload_interval=0)
+    previous = engine.rule_set
+    assert previous is not None and engine.error is None
+
+    # Same length as the valid file, so a fix below keeps the mtime and size
+    broken = json.dumps(VALID).replace('"drop"', '"nope"')
+    _write(path, broken, 2000)
+    assert not engine.reload()
+    assert engine.rule_set is previous
+    assert "action" in engine.error
+
+    _write(path, json.dumps(VALID).replace('"drop"', '"keep"'), 2000)
+    assert engine.reload()
+    assert engine.error is None
+    assert engine.rule_set.rules[0].action == "keep"
+
+
+def test_invalid_file_at_startup_does_not_raise(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, "[1, 2]", 1000)
+    engine = RuleEngine(str(path))
+    assert engine.rule_set is None
+    assert engine.error
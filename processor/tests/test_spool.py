@@ -0,0 +1,83 @@
+import zlib
+
+import pytest
+
+from spool import FRAME, Spool, SpoolFullError
+
+
+def _segments(directory):
+    return sorted(directory.glob("*.seg"))
+
+
+def test_records_replay_across_segments_and_commit_drops_drained(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    payloads = [f"event-{i}".encode() * 3 for i in range(6)]
+    spool.append(payloads)
+    assert len(_segments(tmp_path)) > 1
+    records, position = spool.read(max_records=100)
+    assert records == payloads
+    spool.commit(position)
+    assert spool.is_empty()
+    assert len(_segments(tmp_path)) == 1
+    spool.close()
+
+
+def test_cursor_survives_reopen(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([b"one", b"two", b"three"])
+    records, position = spool.read(max_records=2)
+    spool.commit(position)
+    spool.close()
+    reopened = Spool(str(tmp_path))
+    assert reopened.read()[0] == [b"three"]
+    reopened.close()
+
+
+def test_torn_tail_record_is_truncated_on_open(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([b"complete"])
+    spool.close()
+    [segment] = _segments(tmp_path)
+    intact = segment.stat().st_size
+    with open(segment, "ab") as f:
+        f.write(FRAME.pack(100, 0) + b"cut short")
+
+    spool = Spool(str(tmp_path))
+    assert segment.stat().st_size == intact
+    spool.append([b"after"])
+    assert spool.read()[0] == [b"complete", b"after"]
+    spool.close()
+
+
+def test_record_with_bad_crc_is_truncated_on_open(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([b"good"])
+    spool.close()
+    [segment] = _segments(tmp_path)
+    intact = segment.stat().st_size
+    payload = b"corrupted"
+    with open(segment, "ab") as f:
+        f.write(FRAME.pack(len(payload), zlib.crc32(payload) ^ 1) + payload)
+
+    spool = Spool(str(tmp_path))
+    assert segment.stat().st_size == intact
+    assert spool.read()[0] == [b"good"]
+    spool.close()
+
+
+def test_append_raises_when_batch_does_not_fit(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=64)
+    spool.append([b"x" * 40])
+    with pytest.raises(SpoolFullError):
+        spool.append([b"y" * 10, b"z" * 10])
+    assert spool.read()[0] == [b"x" * 40]
+    spool.close()
+
+
+def test_append_raises_for_a_batch_larger_than_the_spool(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=64)
+    with pytest.raises(SpoolFullError):
+        spool.append([b"x" * 100])
+    assert spool.is_empty()
+    assert all(segment.stat().st_size == 0 for segment in _segments(tmp_path))
+    spool.close()
@@ -0,0 +1,31 @@
+import asyncio
+
+import main
+from spool import Spool
+
+
+def test_replay_resends_only_records_hec_refused(tmp_path, monkeypatch):
+    spool = Spool(str(tmp_path / "spool"))
+    spool.append([b"a", b"b", b"c"])
+    attempts = []
+
+    async def send_encoded_failures(payloads):
+        attempts.append(list(payloads))
+        return [b"b"] if len(attempts) == 1 else []
+
+    monkeypatch.setattr(main, "spool", spool)
+    monkeypatch.setattr(main, "HEC_FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(main.hec_sender, "send_encoded_failures", send_encoded_failures)
+
+    async def run():
+        task = asyncio.create_task(main.drain_spool())
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if spool.is_empty():
+                break
+        task.cancel()
+
+    asyncio.run(run())
+    assert attempts == [[b"a", b"b", b"c"], [b"b"]]
+    assert spool.is_empty()
+    spool.close()
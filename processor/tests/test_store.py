@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+
+from hec_sender import encode_event
+from store import PARTITION_FORMAT, PARTITION_SECONDS, SEGMENT_SUFFIX, EventStore, Query
+
+# The start of the hour before last, so events fall in two partitions well inside retention
+HOUR = (int(time.time()) // PARTITION_SECONDS - 2) * PARTITION_SECONDS
+
+
+def _event(i, ts, orig="10.0.0.1", resp_p=443, proto="tcp"):
+    return {"ts": ts, "uid": f"C{i}", "id_orig_h": orig, "id_orig_p": 40000 + i,
+            "id_resp_h": "10.0.0.2", "id_resp_p": resp_p, "proto": proto}
+
+
+def _add(store, events, log_type="conn"):
+    store.add(events, [encode_event(event, "main", "zeek", "zeek_conn_enriched") for event in events], log_type)
+
+
+def _uids(store, query, limit=100):
+    return [json.loads(line)["uid"] for line in store.events(query, limit)]
+
+
+def _populated(tmp_path):
+    store = EventStore(str(tmp_path))
+    _add(store, [
+        _event(0, HOUR + 10),
+        _event(1, HOUR + 20, orig="10.0.0.9", resp_p=53, proto="udp"),
+        _event(2, HOUR + PARTITION_SECONDS + 5),
+    ])
+    _add(store, [_event(3, HOUR + PARTITION_SECONDS + 30, resp_p=22)], log_type="ssh")
+    asyncio.run(store.flush())
+    return store
+
+
+def test_flush_writes_one_segment_per_hourly_partition(tmp_path):
+    store = _populated(tmp_path)
+    partitions = sorted(path.name for path in tmp_path.iterdir())
+    assert partitions == [
+        time.strftime(PARTITION_FORMAT, time.gmtime(HOUR)),
+        time.strftime(PARTITION_FORMAT, time.gmtime(HOUR + PARTITION_SECONDS)),
+    ]
+    assert [segment.count for segment in store.segments] == [2, 2]
+    assert store.stats()["events"] == 4
+    assert store.stats()["buffered_events"] == 0
+
+
+def test_events_are_newest_first_and_filtered(tmp_path):
+    store = _populated(tmp_path)
+    everything = Query(HOUR, HOUR + 2 * PARTITION_SECONDS)
+    assert _uids(store, everything) == ["C3", "C2", "C1", "C0"]
+    assert _uids(store, everything, limit=2) == ["C3", "C2"]
+    assert _uids(store, Query(HOUR, HOUR + PARTITION_SECONDS - 1)) == ["C1", "C0"]
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS, ips={"10.0.0.9"})) == ["C1"]
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS, ports={53, 22})) == ["C3", "C1"]
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS, protos={"udp"})) == ["C1"]
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS, log_types={"ssh"})) == ["C3"]
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS, ips={"192.0.2.1"})) == []
+
+
+def test_group_counts_largest_first(tmp_path):
+    store = _populated(tmp_path)
+    result = store.group(Query(HOUR, HOUR + 2 * PARTITION_SECONDS), ["proto", "log_type"], 10)
+    assert result["matched"] == 4
+    groups = [(group["key"]["proto"], group["key"]["log_type"], group["count"]) for group in result["groups"]]
+    assert groups[0] == ("tcp", "conn", 2)
+    assert sorted(groups[1:]) == [("tcp", "ssh", 1), ("udp", "conn", 1)]
+    assert len(store.group(Query(HOUR, HOUR + 2 * PARTITION_SECONDS), ["proto"], 1)["groups"]) == 1
+
+
+def test_buffered_events_are_queryable_before_flush(tmp_path):
+    store = _populated(tmp_path)
+    _add(store, [_event(4, HOUR + PARTITION_SECONDS + 60)])
+    assert store.stats()["buffered_events"] == 1
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS), limit=2) == ["C4", "C3"]
+
+
+def test_reopen_after_a_crash_serves_only_committed_segments(tmp_path):
+    store = _populated(tmp_path)
+    # Events still buffered when the process dies were never written
+    _add(store, [_event(4, HOUR + PARTITION_SECONDS + 60)])
+    partition = store.segments[-1].path.parent
+    # A flush cut short leaves its temporary file, and a torn write leaves a bad segment
+    interrupted = partition / "9999999999999-000001.tmp"
+    interrupted.write_bytes(b"ZEEKCOL1partial")
+    (partition / f"9999999999999-000002{SEGMENT_SUFFIX}").write_bytes(b"garbage")
+
+    reopened = EventStore(str(tmp_path))
+    assert not interrupted.exists()
+    assert len(reopened.segments) == 2
+    assert _uids(reopened, Query(HOUR, HOUR + 2 * PARTITION_SECONDS)) == ["C3", "C2", "C1", "C0"]
+
+
+def test_retention_drops_whole_partitions(tmp_path):
+    store = _populated(tmp_path)
+    store.retention_hours = (time.time() - HOUR - PARTITION_SECONDS) / 3600
+    asyncio.run(store.flush())
+    assert [segment.count for segment in store.segments] == [2]
+    assert len(list(tmp_path.iterdir())) == 1
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS)) == ["C3", "C2"]
+
+
+def test_max_bytes_drops_the_oldest_segments(tmp_path):
+    store = _populated(tmp_path)
+    store.max_bytes = store.segments[-1].size
+    asyncio.run(store.flush())
+    assert len(store.segments) == 1
+    assert _uids(store, Query(HOUR, HOUR + 2 * PARTITION_SECONDS)) == ["C3", "C2"]